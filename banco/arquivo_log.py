@@ -0,0 +1,286 @@
+# banco/arquivo_log.py
+# Arquivamento mensal de log_acessos em bancos SQLite por mês e leitura transparente com ATTACH
+# Data: 18/10/2026 - Hora: 22:00
+# comando: uv run python -m banco.arquivo_log [--dry-run]
+
+import re
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from config import DB_PATH, LOG_ARQUIVO_DIR, LOG_MESES_QUENTES
+from banco.backends import get_backend
+from banco.conexao import get_connection
+from banco.shards import arquivos_shards
+
+# O banco principal guarda só os LOG_MESES_QUENTES meses mais recentes de
+# log_acessos; cada mês fechado mais antigo vai para log_acessos_AAAA_MM.db
+# em LOG_ARQUIVO_DIR. A cópia usa INSERT OR IGNORE pelo id e é gravada antes
+# da remoção no banco principal: se o processo cair no meio, rodar de novo
+# completa o serviço sem duplicar linhas. As consultas do monitor usam
+# fonte_log_acessos(), que só anexa (ATTACH) os meses arquivados que caem no
+# intervalo pedido. Cada shard de empresa (banco/shards.py) tem o próprio
+# log_acessos e os próprios arquivos, <shard>_log_acessos_AAAA_MM.db.
+COLUNAS_LOG = ('id', 'user_id', 'data_acesso', 'hora_acesso', 'programa', 'acao')
+_PREFIXO = 'log_acessos_'
+
+_stats_lock = threading.Lock()
+_ESTATISTICAS = {
+    'consultas': 0,             # usos de fonte_log_acessos
+    'consultas_com_arquivo': 0, # usos que precisaram anexar arquivos
+    'anexacoes': 0,             # ATTACH executados
+    'meses_arquivados': 0,      # meses movidos nesta execução do processo
+    'linhas_arquivadas': 0,
+}
+
+
+def _mes_seguinte(mes):
+    ano, numero = map(int, mes.split('-'))
+    return f"{ano + numero // 12:04d}-{numero % 12 + 1:02d}"
+
+
+def _primeiro_dia(mes):
+    return f"{mes}-01"
+
+
+def _prefixo(banco=None):
+    """Prefixo dos arquivos mensais: 'log_acessos_' no principal, '<shard>_log_acessos_' nos shards."""
+    return _PREFIXO if banco is None else f"{Path(banco).stem}_{_PREFIXO}"
+
+
+def arquivo_do_mes(mes, banco=None):
+    """Caminho do arquivo de um mês no formato 'AAAA-MM' (banco: arquivo do shard; None = principal)."""
+    return LOG_ARQUIVO_DIR / f"{_prefixo(banco)}{mes.replace('-', '_')}.db"
+
+
+def meses_arquivados(banco=None):
+    """Meses ('AAAA-MM') que já possuem arquivo, em ordem (banco: arquivo do shard; None = principal)."""
+    if not LOG_ARQUIVO_DIR.exists():
+        return []
+    prefixo = _prefixo(banco)
+    padrao = re.compile(rf'^{re.escape(prefixo)}(\d{{4}})_(\d{{2}})\.db$')
+    meses = []
+    for caminho in LOG_ARQUIVO_DIR.glob(f'{prefixo}*.db'):
+        match = padrao.match(caminho.name)
+        if match:
+            meses.append(f"{match.group(1)}-{match.group(2)}")
+    return sorted(meses)
+
+
+def inicio_janela_quente(hoje=None):
+    """Primeiro dia ('AAAA-MM-DD') do período mantido no banco principal."""
+    hoje = hoje or datetime.now(timezone.utc).date()
+    indice = hoje.year * 12 + hoje.month - 1 - (max(LOG_MESES_QUENTES, 1) - 1)
+    return date(indice // 12, indice % 12 + 1, 1).isoformat()
+
+
+def _criar_tabela_arquivo(conn, esquema):
+    """Cria log_acessos no arquivo anexado com o mesmo DDL do banco principal."""
+    sql = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'log_acessos'"
+    ).fetchone()[0]
+    sql = re.sub(r'^\s*CREATE\s+TABLE\s+"?log_acessos"?',
+                 f'CREATE TABLE IF NOT EXISTS {esquema}.log_acessos', sql, flags=re.IGNORECASE)
+    # A chave estrangeira para usuarios não se aplica fora do banco principal
+    sql = re.sub(r',\s*FOREIGN\s+KEY[^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)', '', sql, flags=re.IGNORECASE)
+    conn.execute(sql)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_log_arquivo_data ON log_acessos (data_acesso)")
+
+
+def arquivar_meses_fechados(dry_run=False, hoje=None, banco=None):
+    """
+    Move os meses anteriores à janela quente para os arquivos mensais.
+
+    Args:
+        dry_run (bool): Se True, só informa quantas linhas seriam movidas por mês
+        hoje (date, optional): Data de referência (padrão: hoje)
+        banco (str, optional): Arquivo do shard de empresa. Padrão: banco principal
+
+    Returns:
+        dict: {'AAAA-MM': linhas movidas (ou a mover)}
+    """
+    if get_backend().nome != 'sqlite':
+        raise RuntimeError("arquivamento em arquivos mensais só se aplica ao SQLite")
+    if not LOG_ARQUIVO_DIR.exists():
+        raise FileNotFoundError(f"pasta de arquivo '{LOG_ARQUIVO_DIR}' não existe")
+
+    corte = inicio_janela_quente(hoje)
+    colunas = ', '.join(COLUNAS_LOG)
+    # Conexão do pool sem transação aberta (ATTACH exige autocommit)
+    conn = get_connection(banco)
+    movidos = {}
+    try:
+        meses = [linha[0] for linha in conn.execute("""
+            SELECT DISTINCT substr(data_acesso, 1, 7)
+            FROM log_acessos
+            WHERE data_acesso < ?
+            ORDER BY 1
+        """, (corte,)).fetchall()]
+
+        for mes in meses:
+            faixa = (_primeiro_dia(mes), _primeiro_dia(_mes_seguinte(mes)))
+            if dry_run:
+                movidos[mes] = conn.execute(
+                    "SELECT COUNT(*) FROM log_acessos WHERE data_acesso >= ? AND data_acesso < ?", faixa
+                ).fetchone()[0]
+                continue
+
+            conn.execute("ATTACH DATABASE ? AS arquivo", (str(arquivo_do_mes(mes, banco)),))
+            try:
+                # 1) copia e confirma no arquivo; 2) só então remove do banco (principal ou shard)
+                conn.execute("BEGIN IMMEDIATE")
+                _criar_tabela_arquivo(conn, 'arquivo')
+                conn.execute(f"""
+                    INSERT OR IGNORE INTO arquivo.log_acessos ({colunas})
+                    SELECT {colunas} FROM main.log_acessos
+                    WHERE data_acesso >= ? AND data_acesso < ?
+                """, faixa)
+                conn.commit()
+                conn.execute("BEGIN IMMEDIATE")
+                movidos[mes] = conn.execute(
+                    "DELETE FROM main.log_acessos WHERE data_acesso >= ? AND data_acesso < ?", faixa
+                ).rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DETACH DATABASE arquivo")
+    finally:
+        conn.close()
+
+    if not dry_run and movidos:
+        with _stats_lock:
+            _ESTATISTICAS['meses_arquivados'] += len(movidos)
+            _ESTATISTICAS['linhas_arquivadas'] += sum(movidos.values())
+    return movidos
+
+
+def _meses_do_intervalo(data_inicio, data_fim):
+    mes, ultimo = data_inicio[:7], data_fim[:7]
+    meses = []
+    while mes <= ultimo:
+        meses.append(mes)
+        mes = _mes_seguinte(mes)
+    return meses
+
+
+def _anexar(conn, meses, banco=None):
+    """Anexa os arquivos dos meses e devolve os nomes de esquema usados."""
+    anexados = []
+    try:
+        for mes in meses:
+            esquema = f"arq_{mes.replace('-', '_')}"
+            conn.execute(f"ATTACH DATABASE ? AS {esquema}", (str(arquivo_do_mes(mes, banco)),))
+            anexados.append(esquema)
+    except Exception:
+        _desanexar(conn, anexados)
+        raise
+    with _stats_lock:
+        _ESTATISTICAS['anexacoes'] += len(anexados)
+    return anexados
+
+
+def _desanexar(conn, esquemas):
+    for esquema in esquemas:
+        try:
+            conn.execute(f"DETACH DATABASE {esquema}")
+        except sqlite3.Error as e:
+            print(f"⚠️ AVISO: não foi possível desanexar {esquema}: {e}")
+
+
+@contextmanager
+def fonte_log_acessos(conn, data_inicio, data_fim):
+    """
+    Expressão FROM de log_acessos para o intervalo, anexando só os arquivos necessários.
+
+    Até o limite de ATTACH do SQLite (10 por conexão) os meses são lidos
+    direto dos arquivos; acima disso as linhas do intervalo são copiadas
+    em lotes para uma tabela temporária da conexão.
+
+    Uso:
+        with fonte_log_acessos(conn, '2025-01-01', '2025-03-31') as fonte:
+            pd.read_sql_query(f"SELECT ... FROM {fonte} la WHERE la.data_acesso >= ? ...", conn, ...)
+
+    Args:
+        conn: Conexão (sem transação aberta: ATTACH exige autocommit)
+        data_inicio (str): 'AAAA-MM-DD' inicial (inclusive)
+        data_fim (str): 'AAAA-MM-DD' final (inclusive)
+
+    Yields:
+        str: 'log_acessos' ou subconsulta UNION ALL com os meses arquivados
+    """
+    # Conexão de shard de empresa (banco/shards.py): arquivos mensais do shard
+    chave = getattr(conn, '_chave_pool', None)
+    banco = None if chave in (None, str(DB_PATH)) else chave
+    arquivados = set(meses_arquivados(banco)) if get_backend().nome == 'sqlite' else set()
+    necessarios = [mes for mes in _meses_do_intervalo(data_inicio, data_fim) if mes in arquivados]
+
+    with _stats_lock:
+        _ESTATISTICAS['consultas'] += 1
+        if necessarios:
+            _ESTATISTICAS['consultas_com_arquivo'] += 1
+
+    if not necessarios:
+        yield 'log_acessos'
+        return
+
+    colunas = ', '.join(COLUNAS_LOG)
+    # Descontados os bancos já anexados (ex.: 'diretorio' nas conexões de shard)
+    ja_anexados = sum(1 for linha in conn.execute("PRAGMA database_list") if linha[1] not in ('main', 'temp'))
+    limite = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - ja_anexados
+
+    if len(necessarios) <= limite:
+        anexados = _anexar(conn, necessarios, banco)
+        try:
+            partes = [f"SELECT {colunas} FROM main.log_acessos"]
+            partes += [f"SELECT {colunas} FROM {esquema}.log_acessos" for esquema in anexados]
+            yield "(" + " UNION ALL ".join(partes) + ")"
+        finally:
+            _desanexar(conn, anexados)
+        return
+
+    # Intervalo longo: junta os meses arquivados em temp.log_acessos_periodo
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS log_acessos_periodo AS SELECT {colunas} FROM main.log_acessos WHERE 0")
+    conn.execute("DELETE FROM temp.log_acessos_periodo")
+    try:
+        for inicio_lote in range(0, len(necessarios), limite):
+            anexados = _anexar(conn, necessarios[inicio_lote:inicio_lote + limite], banco)
+            try:
+                for esquema in anexados:
+                    conn.execute(f"""
+                        INSERT INTO temp.log_acessos_periodo ({colunas})
+                        SELECT {colunas} FROM {esquema}.log_acessos
+                        WHERE data_acesso >= ? AND data_acesso <= ?
+                    """, (data_inicio, data_fim))
+                conn.commit()
+            finally:
+                _desanexar(conn, anexados)
+        yield (f"(SELECT {colunas} FROM main.log_acessos"
+               f" UNION ALL SELECT {colunas} FROM temp.log_acessos_periodo)")
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.log_acessos_periodo")
+        conn.commit()
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores do arquivamento e o tamanho da tabela quente.
+
+    Returns:
+        dict: consultas, anexacoes, meses_arquivados, linhas_arquivadas, meses em arquivo e inicio_janela
+    """
+    with _stats_lock:
+        stats = dict(_ESTATISTICAS)
+    stats['meses_em_arquivo'] = meses_arquivados()
+    stats['inicio_janela'] = inicio_janela_quente()
+    return stats
+
+
+if __name__ == "__main__":
+    print(arquivar_meses_fechados(dry_run='--dry-run' in sys.argv))
+    for arquivo_shard in arquivos_shards():
+        print(arquivo_shard, arquivar_meses_fechados(dry_run='--dry-run' in sys.argv, banco=arquivo_shard))
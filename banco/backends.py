@@ -0,0 +1,346 @@
+# banco/backends.py
+# Backends de armazenamento: SQLite (padrão) e PostgreSQL (opcional, import sob demanda)
+# Data: 18/10/2026 - Hora: 19:00
+
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    DB_BACKEND,
+    DATABASE_URL,
+    DB_PATH,
+    DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE,
+)
+
+# As páginas continuam escrevendo SQL com '?' e usando cursor/commit/close.
+# O backend abre as conexões e responde às perguntas que dependem do banco
+# (colunas de uma tabela, objetos existentes, versão do esquema, snapshot).
+# No PostgreSQL os '?' são traduzidos para '%s' e o esquema deve ter sido
+# carregado antes (ex.: pgloader a partir do calcrh2.db).
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class BackendSQLite:
+    """Arquivo SQLite local (config.DB_PATH) em modo WAL."""
+
+    nome = 'sqlite'
+    erros = (sqlite3.Error,)
+
+    def destino_padrao(self):
+        return DB_PATH
+
+    def banco_disponivel(self, destino=None):
+        """Indica se o arquivo do banco existe."""
+        return Path(destino or DB_PATH).exists()
+
+    def abrir(self, destino, factory):
+        """Abre a conexão e aplica uma única vez os PRAGMAs de desempenho."""
+        conn = sqlite3.connect(
+            destino,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,  # a conexão pode mudar de thread entre reruns
+            factory=factory,
+        )
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+        cursor.close()
+        return conn
+
+    def info_colunas(self, cursor, tabela):
+        """Colunas no formato do PRAGMA table_info: (cid, nome, tipo, notnull, padrão, pk)."""
+        cursor.execute(f"PRAGMA table_info({tabela})")
+        return cursor.fetchall()
+
+    def objetos_existentes(self, cursor):
+        """Nomes de tabelas, views, índices e triggers do banco."""
+        cursor.execute("SELECT name FROM sqlite_master")
+        return {row[0] for row in cursor.fetchall()}
+
+    def versao_esquema(self, cursor):
+        cursor.execute("PRAGMA user_version")
+        return cursor.fetchone()[0]
+
+    def definir_versao_esquema(self, cursor, versao):
+        cursor.execute(f"PRAGMA user_version = {int(versao)}")
+
+    def iniciar_escrita(self, cursor):
+        """Abre transação que já reserva o lock de escrita."""
+        cursor.execute("BEGIN IMMEDIATE")
+
+    def adaptar_ddl(self, comando):
+        return comando
+
+    def otimizar(self, cursor):
+        cursor.execute("PRAGMA optimize")
+
+    def abrir_leitor(self, destino, factory):
+        """Conexão somente leitura fora do pool, com os PRAGMAs de leitura."""
+        uri = f"{Path(destino).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(
+            uri, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+            factory=factory
+        )
+        conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+        return conn
+
+    def somente_leitura(self, conn):
+        """Recusa gravações na conexão (leitores do pool com o gravador único)."""
+        conn.execute("PRAGMA query_only=1")
+
+    def iniciar_snapshot(self, conn):
+        """Em WAL a primeira leitura dentro da transação fixa o snapshot."""
+        conn.execute("BEGIN")
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+
+
+# ---------------------------------------------------------------------------
+# PostgreSQL
+# ---------------------------------------------------------------------------
+
+_RE_TOKENS_SQL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\?|%)")
+
+
+def traduzir_placeholders(sql):
+    """Troca '?' por '%s' fora de textos entre aspas e escapa todo '%' literal como '%%'."""
+    def trocar(match):
+        token = match.group(0)
+        if token == '?':
+            return '%s'
+        return token.replace('%', '%%')
+    return _RE_TOKENS_SQL.sub(trocar, sql)
+
+
+def _importar_driver():
+    """Importa psycopg (v3) ou psycopg2 apenas quando o backend PostgreSQL é usado."""
+    try:
+        import psycopg
+        return psycopg
+    except ImportError:
+        pass
+    try:
+        import psycopg2
+        return psycopg2
+    except ImportError as e:
+        raise ImportError(
+            "DB_BACKEND=postgres requer 'psycopg' ou 'psycopg2' instalado (pip install psycopg[binary])"
+        ) from e
+
+
+class CursorPostgres:
+    """Cursor que aceita o SQL com '?' das páginas e mede as execuções."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _medir(self, metodo, sql, parametros):
+        from banco.instrumentacao import _registrar
+        inicio = time.perf_counter()
+        try:
+            return metodo(traduzir_placeholders(sql), parametros)
+        finally:
+            _registrar(sql, time.perf_counter() - inicio, self._cursor.rowcount if self._cursor.rowcount is not None else -1)
+
+    def execute(self, sql, parameters=()):
+        self._medir(self._cursor.execute, sql, tuple(parameters))
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._medir(self._cursor.executemany, sql, [tuple(p) for p in seq_of_parameters])
+        return self
+
+    def fetchone(self):
+        linha = self._cursor.fetchone()
+        return tuple(linha) if linha is not None else None
+
+    def fetchall(self):
+        return [tuple(linha) for linha in self._cursor.fetchall()]
+
+    def fetchmany(self, size=None):
+        return [tuple(linha) for linha in self._cursor.fetchmany(size or self._cursor.arraysize)]
+
+    def __iter__(self):
+        return (tuple(linha) for linha in self._cursor)
+
+    def __getattr__(self, nome):
+        # rowcount, description, close, arraysize...
+        return getattr(self._cursor, nome)
+
+
+class ConexaoPostgres:
+    """Conexão PostgreSQL com a mesma interface usada pelo pool (close devolve ao pool)."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, factory=None):
+        return CursorPostgres(self._conn.cursor())
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    @property
+    def in_transaction(self):
+        info = getattr(self._conn, 'info', None)
+        status = info.transaction_status if info is not None else self._conn.get_transaction_status()
+        return int(status) != 0  # 0 = IDLE em psycopg e psycopg2
+
+    def close(self):
+        from banco.conexao import _liberar
+        _liberar(self)
+
+    def fechar_definitivamente(self):
+        self._conn.close()
+
+
+class BackendPostgres:
+    """Banco PostgreSQL compartilhado (config.DATABASE_URL), para várias instâncias do app."""
+
+    nome = 'postgres'
+
+    def __init__(self):
+        self._driver = _importar_driver()
+        self.erros = (self._driver.Error,)
+
+    def destino_padrao(self):
+        if not DATABASE_URL:
+            raise RuntimeError("DB_BACKEND=postgres requer DATABASE_URL definido")
+        return DATABASE_URL
+
+    def banco_disponivel(self, destino=None):
+        return bool(destino or DATABASE_URL)
+
+    def abrir(self, destino, factory=None):
+        conn = self._driver.connect(str(destino))
+        cursor = conn.cursor()
+        cursor.execute(f"SET lock_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+        conn.commit()
+        return ConexaoPostgres(conn)
+
+    def info_colunas(self, cursor, tabela):
+        cursor.execute("""
+            SELECT c.ordinal_position - 1, c.column_name, UPPER(c.data_type),
+                   CASE WHEN c.is_nullable = 'NO' THEN 1 ELSE 0 END, c.column_default,
+                   CASE WHEN k.column_name IS NOT NULL THEN 1 ELSE 0 END
+            FROM information_schema.columns c
+            LEFT JOIN information_schema.table_constraints t
+                ON t.table_name = c.table_name AND t.constraint_type = 'PRIMARY KEY'
+            LEFT JOIN information_schema.key_column_usage k
+                ON k.constraint_name = t.constraint_name AND k.column_name = c.column_name
+            WHERE c.table_name = ? AND c.table_schema = current_schema()
+            ORDER BY c.ordinal_position
+        """, (tabela,))
+        return cursor.fetchall()
+
+    def objetos_existentes(self, cursor):
+        cursor.execute("""
+            SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()
+            UNION
+            SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()
+            UNION
+            SELECT trigger_name FROM information_schema.triggers WHERE trigger_schema = current_schema()
+        """)
+        return {row[0] for row in cursor.fetchall()}
+
+    def versao_esquema(self, cursor):
+        cursor.execute("CREATE TABLE IF NOT EXISTS esquema_versao (versao INTEGER NOT NULL)")
+        cursor.execute("SELECT MAX(versao) FROM esquema_versao")
+        versao = cursor.fetchone()[0]
+        return versao or 0
+
+    def definir_versao_esquema(self, cursor, versao):
+        cursor.execute("DELETE FROM esquema_versao")
+        cursor.execute("INSERT INTO esquema_versao (versao) VALUES (?)", (int(versao),))
+
+    def iniciar_escrita(self, cursor):
+        # O driver abre a transação no primeiro comando; DDL no PostgreSQL é transacional
+        pass
+
+    def adaptar_ddl(self, comando):
+        """Traduz cláusulas exclusivas do SQLite (gatilhos SQLite não têm tradução: None)."""
+        if re.match(r'\s*CREATE\s+TRIGGER', comando, flags=re.IGNORECASE):
+            return None
+        comando = re.sub(r'CREATE\s+VIEW\s+IF\s+NOT\s+EXISTS', 'CREATE OR REPLACE VIEW', comando, flags=re.IGNORECASE)
+        comando = re.sub(r'\)\s*WITHOUT\s+ROWID', ')', comando, flags=re.IGNORECASE)
+        comando = re.sub(r"strftime\('%Y-%m-%dT%H:%M:%f',\s*'now'\)",
+                         """to_char(clock_timestamp() AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.MS')""",
+                         comando, flags=re.IGNORECASE)
+        return re.sub(r'\bINTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT\b',
+                      'BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY', comando, flags=re.IGNORECASE)
+
+    def otimizar(self, cursor):
+        cursor.execute("ANALYZE")
+
+    def abrir_leitor(self, destino, factory=None):
+        return self.abrir(destino)
+
+    def somente_leitura(self, conn):
+        """Toda transação da sessão começa READ ONLY (a conexão fica num pool só de leitores)."""
+        conn.execute("SET default_transaction_read_only = on")
+        conn.commit()
+
+    def iniciar_snapshot(self, conn):
+        """
+        Transação REPEATABLE READ somente leitura: o snapshot vale até o rollback.
+        SET TRANSACTION vale só para a transação; a sessão (que pode voltar ao
+        pool) continua com o nível padrão e aceitando gravações.
+        """
+        conn.rollback()
+        conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        conn.execute("SELECT 1").fetchall()
+
+
+def get_backend():
+    """
+    Retorna o backend configurado em config.DB_BACKEND (instância única por processo).
+
+    Returns:
+        BackendSQLite|BackendPostgres: Backend ativo
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if DB_BACKEND == 'postgres':
+                    _backend = BackendPostgres()
+                else:
+                    if DB_BACKEND != 'sqlite':
+                        print(f"⚠️ AVISO: DB_BACKEND '{DB_BACKEND}' desconhecido. Usando 'sqlite'.")
+                    _backend = BackendSQLite()
+    return _backend
+
+
+def banco_disponivel():
+    """Indica se o banco configurado está disponível (arquivo SQLite existe / URL definida)."""
+    return get_backend().banco_disponivel()
+
+
+def info_colunas(cursor, tabela):
+    """Colunas da tabela no formato do PRAGMA table_info, em qualquer backend."""
+    return get_backend().info_colunas(cursor, tabela)
+
+
+def erros_banco():
+    """Tupla de exceções de banco do backend ativo (para blocos except)."""
+    return get_backend().erros
@@ -0,0 +1,182 @@
+# banco/conexao.py
+# Gerenciador de conexões compartilhadas (reuso por thread + PRAGMAs no SQLite)
+# Data: 18/10/2026 - Hora: 09:00
+
+import threading
+import time
+
+from config import DB_POOL_IDLE_MAX, DB_SHARDING
+from banco import gravador
+from banco.backends import get_backend
+from banco.instrumentacao import ConexaoInstrumentada
+
+# Estado do pool: conexões ociosas por caminho de banco e conexão ativa por thread
+_pool_lock = threading.Lock()
+_conexoes_ociosas = {}
+_local = threading.local()
+
+_ESTATISTICAS = {
+    'aberturas': 0,         # conexões novas (sqlite3.connect + PRAGMAs)
+    'reusos': 0,            # pedidos atendidos por conexão já aberta
+    'devolucoes': 0,        # conexões devolvidas ao pool
+    'fechamentos': 0,       # conexões realmente fechadas
+    'tempo_espera': 0.0,    # segundos gastos para obter conexões
+}
+
+
+class ConexaoCompartilhada(ConexaoInstrumentada):
+    """
+    Conexão SQLite que volta para o pool quando close() é chamado.
+
+    Permite que o código das páginas continue usando o padrão
+    conn = ...; ...; conn.close() sem pagar o custo de abrir o arquivo
+    e reaplicar os PRAGMAs a cada chamada.
+    """
+
+    def close(self):
+        _liberar(self)
+
+    def fechar_definitivamente(self):
+        """Fecha a conexão de fato (usado pelo pool)."""
+        super().close()
+
+
+def _abrir(destino, somente_leitura=False):
+    """Abre conexão nova pelo backend configurado (SQLite aplica os PRAGMAs aqui)."""
+    backend = get_backend()
+    conn = backend.abrir(destino, ConexaoCompartilhada)
+    principal = str(backend.destino_padrao())
+    if DB_SHARDING and backend.nome == 'sqlite' and destino != principal:
+        # Shard de empresa (banco/shards.py): usuarios e demais tabelas globais vêm do principal
+        conn.execute("ATTACH DATABASE ? AS diretorio", (principal,))
+    if somente_leitura:
+        backend.somente_leitura(conn)
+    return conn
+
+
+def _ativas_da_thread():
+    if not hasattr(_local, 'ativas'):
+        _local.ativas = {}
+    return _local.ativas
+
+
+def get_connection(db_path=None, leitura=False):
+    """
+    Obtém uma conexão reutilizável com o banco de dados.
+
+    Chamadas aninhadas na mesma thread recebem a mesma conexão; ela só é
+    devolvida ao pool quando o último close() correspondente é chamado.
+
+    Com o gravador único ligado (banco/gravador.py), leitura=True devolve
+    uma conexão somente leitura do banco principal, de um pool separado:
+    as gravações da página vão para a fila do gravador e a conexão de
+    leitura nunca disputa o lock de escrita com ele. Shards e o modo
+    desligado usam a conexão normal.
+
+    Args:
+        db_path (Path|str, optional): Caminho do banco (ou URL no PostgreSQL).
+            Padrão: config.DB_PATH / config.DATABASE_URL conforme config.DB_BACKEND
+        leitura (bool): A página só lê por esta conexão (grava por executar_escrita)
+
+    Returns:
+        ConexaoCompartilhada: Conexão pronta para uso
+    """
+    principal = str(get_backend().destino_padrao())
+    chave = str(db_path or principal)
+    somente_leitura = leitura and gravador.ativo() and chave == principal
+    vaga = f"{chave}#leitura" if somente_leitura else chave
+    inicio = time.perf_counter()
+
+    ativas = _ativas_da_thread()
+    if vaga in ativas:
+        entrada = ativas[vaga]
+        entrada[1] += 1
+        with _pool_lock:
+            _ESTATISTICAS['reusos'] += 1
+            _ESTATISTICAS['tempo_espera'] += time.perf_counter() - inicio
+        return entrada[0]
+
+    conn = None
+    with _pool_lock:
+        ociosas = _conexoes_ociosas.get(vaga)
+        if ociosas:
+            conn = ociosas.pop()
+            _ESTATISTICAS['reusos'] += 1
+
+    if conn is None:
+        conn = _abrir(chave, somente_leitura)
+        with _pool_lock:
+            _ESTATISTICAS['aberturas'] += 1
+
+    conn._chave_pool = chave
+    conn._vaga_pool = vaga
+    conn.somente_leitura = somente_leitura
+    ativas[vaga] = [conn, 1]
+    with _pool_lock:
+        _ESTATISTICAS['tempo_espera'] += time.perf_counter() - inicio
+    return conn
+
+
+def _liberar(conn):
+    """Decrementa o uso da conexão na thread e a devolve ao pool quando livre."""
+    vaga = getattr(conn, '_vaga_pool', None)
+    ativas = _ativas_da_thread()
+    entrada = ativas.get(vaga)
+
+    if entrada is None or entrada[0] is not conn:
+        # Conexão de outra thread ou já devolvida: apenas fecha de fato
+        conn.fechar_definitivamente()
+        with _pool_lock:
+            _ESTATISTICAS['fechamentos'] += 1
+        return
+
+    entrada[1] -= 1
+    if entrada[1] > 0:
+        return
+
+    del ativas[vaga]
+
+    # Mesmo comportamento do close() original: descarta o que não foi commitado
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except Exception:
+        conn.fechar_definitivamente()
+        with _pool_lock:
+            _ESTATISTICAS['fechamentos'] += 1
+        return
+
+    with _pool_lock:
+        ociosas = _conexoes_ociosas.setdefault(vaga, [])
+        if len(ociosas) < DB_POOL_IDLE_MAX:
+            ociosas.append(conn)
+            _ESTATISTICAS['devolucoes'] += 1
+            return
+        _ESTATISTICAS['fechamentos'] += 1
+    conn.fechar_definitivamente()
+
+
+def fechar_conexoes():
+    """Fecha todas as conexões ociosas do pool (ex.: antes de substituir o arquivo do banco)."""
+    with _pool_lock:
+        todas = [c for lista in _conexoes_ociosas.values() for c in lista]
+        _conexoes_ociosas.clear()
+        _ESTATISTICAS['fechamentos'] += len(todas)
+    for conn in todas:
+        try:
+            conn.fechar_definitivamente()
+        except Exception:
+            pass
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores do gerenciador de conexões.
+
+    Returns:
+        dict: aberturas, reusos, devolucoes, fechamentos, tempo_espera (s) e ociosas
+    """
+    with _pool_lock:
+        stats = dict(_ESTATISTICAS)
+        stats['ociosas'] = sum(len(lista) for lista in _conexoes_ociosas.values())
+    return stats
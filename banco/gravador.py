@@ -0,0 +1,263 @@
+# banco/gravador.py
+# Gravador único opcional: uma thread dona da conexão de escrita executa as gravações de todas as páginas
+# Data: 18/10/2026 - Hora: 23:30
+
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from config import DB_GRAVADOR_UNICO, GRAVADOR_FILA_MAX, GRAVADOR_LOTE_MAX, GRAVADOR_JANELA_MS, GRAVADOR_ESPERA_MS
+from banco.backends import get_backend
+from banco.instrumentacao import ConexaoInstrumentada
+
+# Com DB_GRAVADOR_UNICO=1 as transações de gravação (transacao_com_retentativa
+# e o flush da unidade de trabalho) não disputam mais o lock do SQLite entre
+# si: viram pedidos numa fila, e a thread do gravador os executa na sua
+# conexão, juntando até GRAVADOR_LOTE_MAX pedidos por commit (group commit).
+# Se um pedido do grupo falha, os pedidos são repetidos um a um: o erro de um
+# não desfaz os outros. As páginas continuam lendo pelas conexões do pool,
+# que em WAL não esperam pelo gravador. Desligado (padrão), nada muda.
+_fila = queue.Queue(maxsize=GRAVADOR_FILA_MAX)
+_thread = None
+_thread_lock = threading.Lock()
+_parar = threading.Event()
+
+_stats_lock = threading.Lock()
+_latencias = deque(maxlen=2000)  # segundos da entrada na fila até o commit, por pedido
+_ESTATISTICAS = {
+    'pedidos': 0,           # pedidos executados pelo gravador
+    'diretos': 0,           # gravações feitas na própria conexão (modo desligado ou transação já aberta)
+    'grupos': 0,            # commits (cada um com 1 ou mais pedidos)
+    'erros_pedido': 0,      # pedidos que falharam pelo próprio erro
+    'grupos_falhos': 0,     # commits que falharam (todos os pedidos do grupo recebem o erro)
+    'maior_grupo': 0,
+    'maior_fila': 0,
+    'tempo_gravacao': 0.0,  # segundos da thread executando grupos
+}
+
+
+class _Pedido:
+    __slots__ = ('funcao', 'args', 'kwargs', 'futuro', 'entrada')
+
+    def __init__(self, funcao, args, kwargs):
+        self.funcao = funcao
+        self.args = args
+        self.kwargs = kwargs
+        self.futuro = Future()
+        self.entrada = time.perf_counter()
+
+
+def ativo():
+    """Indica se as gravações passam pelo gravador único (config.DB_GRAVADOR_UNICO)."""
+    return DB_GRAVADOR_UNICO
+
+
+class _ErroPedido(Exception):
+    """Erro de um pedido dentro do grupo (os demais pedidos são reexecutados sem ele)."""
+
+    def __init__(self, erro):
+        super().__init__(str(erro))
+        self.erro = erro
+
+
+def _transacao_grupo(conn, grupo):
+    """Executa os pedidos em uma transação com um único commit e devolve os retornos."""
+    cursor = conn.cursor()
+    get_backend().iniciar_escrita(cursor)
+    resultados = []
+    for pedido in grupo:
+        try:
+            resultados.append(pedido.funcao(cursor, *pedido.args, **pedido.kwargs))
+        except Exception as e:
+            raise _ErroPedido(e) from e
+    conn.commit()
+    return resultados
+
+
+def _executar_grupo(conn, grupo):
+    """
+    Grava o grupo em um commit e resolve os futures.
+
+    Se um pedido falha, a transação é desfeita e cada pedido é repetido
+    sozinho: só o pedido com erro recebe a exceção dele.
+    """
+    try:
+        resultados = _transacao_grupo(conn, grupo)
+    except Exception as e:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        if isinstance(e, _ErroPedido) and len(grupo) > 1:
+            for pedido in grupo:
+                _executar_grupo(conn, [pedido])
+            return
+        with _stats_lock:
+            if isinstance(e, _ErroPedido):
+                _ESTATISTICAS['erros_pedido'] += 1
+            else:
+                _ESTATISTICAS['grupos_falhos'] += 1
+        # BEGIN/COMMIT com erro (ex.: SQLITE_BUSY de outro processo): todos recebem o erro
+        erro = e.erro if isinstance(e, _ErroPedido) else e
+        for pedido in grupo:
+            pedido.futuro.set_exception(erro)
+        return
+
+    agora = time.perf_counter()
+    with _stats_lock:
+        _ESTATISTICAS['grupos'] += 1
+        _ESTATISTICAS['pedidos'] += len(grupo)
+        _ESTATISTICAS['maior_grupo'] = max(_ESTATISTICAS['maior_grupo'], len(grupo))
+        _latencias.extend(agora - pedido.entrada for pedido in grupo)
+    for pedido, resultado in zip(grupo, resultados):
+        pedido.futuro.set_result(resultado)
+
+
+def _trabalhador():
+    """Laço da thread do gravador: junta pedidos até GRAVADOR_LOTE_MAX ou GRAVADOR_JANELA_MS."""
+    backend = get_backend()
+    conn = backend.abrir(backend.destino_padrao(), ConexaoInstrumentada)
+    janela = GRAVADOR_JANELA_MS / 1000
+    try:
+        while not (_parar.is_set() and _fila.empty()):
+            try:
+                grupo = [_fila.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            limite = time.monotonic() + janela
+            while len(grupo) < GRAVADOR_LOTE_MAX:
+                try:
+                    grupo.append(_fila.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    grupo.append(_fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+
+            inicio = time.perf_counter()
+            _executar_grupo(conn, grupo)
+            with _stats_lock:
+                _ESTATISTICAS['tempo_gravacao'] += time.perf_counter() - inicio
+    finally:
+        conn.close()
+
+
+def _garantir_thread():
+    """Inicia a thread do gravador na primeira gravação."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _parar.clear()
+            _thread = threading.Thread(target=_trabalhador, name='gravador_unico', daemon=True)
+            _thread.start()
+
+
+def submeter(funcao, *args, **kwargs):
+    """
+    Coloca uma gravação na fila do gravador.
+
+    Args:
+        funcao (callable): Recebe o cursor da conexão de escrita e executa os comandos (sem commit)
+
+    Returns:
+        concurrent.futures.Future: Resolvido com o retorno de funcao após o commit do grupo
+    """
+    if threading.current_thread() is _thread:
+        raise RuntimeError("gravação aninhada dentro do gravador único")
+    _garantir_thread()
+    pedido = _Pedido(funcao, args, kwargs)
+    _fila.put(pedido, timeout=GRAVADOR_ESPERA_MS / 1000)
+    tamanho = _fila.qsize()
+    with _stats_lock:
+        if tamanho > _ESTATISTICAS['maior_fila']:
+            _ESTATISTICAS['maior_fila'] = tamanho
+    return pedido.futuro
+
+
+def _do_principal(conn):
+    chave = getattr(conn, '_chave_pool', None)
+    return chave is None or chave == str(get_backend().destino_padrao())
+
+
+def executar_escrita(conn, funcao, *args, **kwargs):
+    """
+    Executa funcao(cursor, ...) + commit pelo gravador único, ou na própria conexão quando desligado.
+
+    A conexão da página também é usada diretamente quando já tem transação
+    aberta (mandar o pedido ao gravador esperaria pelo lock que a própria
+    página segura) e quando é de um shard de empresa (banco/shards.py): o
+    gravador é só do banco principal, e cada shard tem o seu próprio lock.
+    Conexões de leitura (get_connection(leitura=True)) sempre passam pelo
+    gravador: não gravam e a transação delas, se houver, é só de leitura.
+
+    Args:
+        conn: Conexão da página (pool)
+        funcao (callable): Recebe o cursor e executa os comandos (sem commit)
+
+    Returns:
+        O retorno de funcao
+    """
+    pela_fila = ativo() and not conn.in_transaction and _do_principal(conn)
+    if pela_fila or getattr(conn, 'somente_leitura', False):
+        return submeter(funcao, *args, **kwargs).result(timeout=GRAVADOR_ESPERA_MS / 1000)
+
+    with _stats_lock:
+        _ESTATISTICAS['diretos'] += 1
+    cursor = conn.cursor()
+    try:
+        resultado = funcao(cursor, *args, **kwargs)
+        conn.commit()
+        return resultado
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def encerrar(timeout=5.0):
+    """Executa os pedidos restantes e para a thread (chamado no desligamento do processo)."""
+    global _thread
+    if _thread is None:
+        return
+    _parar.set()
+    _thread.join(timeout)
+    _thread = None
+
+
+def _percentil(valores, fracao):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(fracao * len(ordenados)))]
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores do gravador único.
+
+    Returns:
+        dict: pedidos, diretos, grupos, pedidos_por_grupo, latências p50/p99 (ms), fila atual e ativo
+    """
+    with _stats_lock:
+        stats = dict(_ESTATISTICAS)
+        latencias = list(_latencias)
+    stats['pedidos_por_grupo'] = round(stats['pedidos'] / stats['grupos'], 2) if stats['grupos'] else 0.0
+    stats['latencia_p50_ms'] = round(_percentil(latencias, 0.50) * 1000, 3)
+    stats['latencia_p99_ms'] = round(_percentil(latencias, 0.99) * 1000, 3)
+    stats['fila'] = _fila.qsize()
+    stats['habilitado'] = ativo()
+    stats['ativo'] = _thread is not None and _thread.is_alive()
+    return stats
+
+
+atexit.register(encerrar)
@@ -0,0 +1,400 @@
+# banco/instrumentacao.py
+# Instrumentação das consultas: impressão digital, ponto de chamada, tempo, linhas e log de lentas
+# Data: 18/10/2026 - Hora: 18:00
+
+import atexit
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from config import (
+    DB_INSTRUMENTACAO, DB_SLOW_QUERY_MS, SLOW_QUERY_FILA_MAX, SLOW_QUERY_LOG, SLOW_QUERY_LOG_MAX_KB
+)
+
+# Todas as conexões do projeto (pool e snapshot) usam ConexaoInstrumentada,
+# então qualquer cursor.execute das páginas e do texto_manager passa por aqui
+# sem alterar o código que chama.
+_RAIZ_PROJETO = str(Path(__file__).resolve().parent.parent)
+_PACOTE_BANCO = str(Path(__file__).resolve().parent)
+
+# Limites superiores (ms) das faixas do histograma; a última faixa é "acima"
+FAIXAS_MS = (1, 5, 10, 50, 100, 500, 1000)
+_JANELA = 200             # últimas durações guardadas por instrução (percentis)
+_MAX_INSTRUCOES = 500     # evita crescimento sem limite com SQL montado dinamicamente
+
+_stats_lock = threading.Lock()
+_log_lock = threading.Lock()
+_ESTATISTICAS = {}        # impressão digital -> contadores
+
+# Uma instrução lenta só entra na fila: o EXPLAIN QUERY PLAN (em conexão
+# própria, somente leitura) e a gravação no arquivo são feitos por uma thread
+# em segundo plano, fora da transação de quem chamou, que pode estar com o
+# lock de escrita. Com a fila cheia a entrada é descartada e contada. O log
+# passa a slow_queries.log.1 ao atingir SLOW_QUERY_LOG_MAX_KB (um arquivo
+# antigo é mantido).
+_BYTES_POR_ENTRADA = 2048  # estimativa usada para ler só o final do log
+_fila_lentas = queue.Queue(maxsize=SLOW_QUERY_FILA_MAX)
+_thread_lentas = None
+_thread_lock = threading.Lock()
+_ESTATISTICAS_LOG = {
+    'enfileiradas': 0,      # lentas aceitas na fila
+    'gravadas': 0,          # entradas escritas no arquivo
+    'descartadas': 0,       # perdidas por fila cheia ou erro de escrita
+    'rotacoes': 0,          # vezes que o arquivo passou a .1
+}
+
+_RE_ESPACOS = re.compile(r'\s+')
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_LISTA = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_EXPLICAVEIS = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')
+
+
+def impressao_digital(sql):
+    """
+    Normaliza o SQL para agrupar execuções da mesma instrução.
+
+    Literais viram '?', listas IN (?, ?, ...) viram (...) e espaços são compactados.
+    """
+    texto = _RE_ESPACOS.sub(' ', sql).strip()
+    texto = _RE_TEXTO.sub('?', texto)
+    texto = _RE_NUMERO.sub('?', texto)
+    return _RE_LISTA.sub('(...)', texto)
+
+
+def _ponto_de_chamada():
+    """Primeiro quadro da pilha dentro do projeto e fora do pacote banco (ex.: paginas/form_model.py:412)."""
+    quadro = sys._getframe(1)
+    interno = None  # chamada feita pelo próprio pacote banco (ex.: PRAGMAs do pool)
+    while quadro is not None:
+        arquivo = quadro.f_code.co_filename
+        if arquivo.startswith(_RAIZ_PROJETO):
+            relativo = arquivo[len(_RAIZ_PROJETO) + 1:].replace('\\', '/')
+            local = f"{relativo}:{quadro.f_lineno} {quadro.f_code.co_name}"
+            if not arquivo.startswith(_PACOTE_BANCO):
+                return local
+            if not relativo.startswith('banco/instrumentacao'):
+                interno = local
+        quadro = quadro.f_back
+    return interno or 'desconhecido'
+
+
+def _novo_registro(sql):
+    return {
+        'sql': _RE_ESPACOS.sub(' ', sql).strip()[:500],
+        'execucoes': 0,
+        'tempo_total': 0.0,       # segundos em execute/executemany
+        'tempo_fetch': 0.0,       # segundos em fetch*
+        'maior': 0.0,
+        'linhas_retornadas': 0,
+        'linhas_afetadas': 0,
+        'lentas': 0,
+        'faixas': [0] * (len(FAIXAS_MS) + 1),
+        'recentes': deque(maxlen=_JANELA),
+        'locais': {},             # ponto de chamada -> execuções
+    }
+
+
+def _registrar(sql, duracao, linhas_afetadas):
+    """Acumula a execução no histograma da instrução e devolve o registro."""
+    digital = impressao_digital(sql)
+    local = _ponto_de_chamada()
+    ms = duracao * 1000
+    faixa = next((i for i, limite in enumerate(FAIXAS_MS) if ms <= limite), len(FAIXAS_MS))
+
+    with _stats_lock:
+        registro = _ESTATISTICAS.get(digital)
+        if registro is None:
+            if len(_ESTATISTICAS) >= _MAX_INSTRUCOES:
+                digital = '<outras instruções>'
+                registro = _ESTATISTICAS.setdefault(digital, _novo_registro(digital))
+            else:
+                registro = _ESTATISTICAS[digital] = _novo_registro(sql)
+        registro['execucoes'] += 1
+        registro['tempo_total'] += duracao
+        registro['maior'] = max(registro['maior'], duracao)
+        registro['faixas'][faixa] += 1
+        registro['recentes'].append(ms)
+        if linhas_afetadas > 0:
+            registro['linhas_afetadas'] += linhas_afetadas
+        registro['locais'][local] = registro['locais'].get(local, 0) + 1
+        lenta = ms >= DB_SLOW_QUERY_MS
+        if lenta:
+            registro['lentas'] += 1
+    return registro, digital, local, lenta
+
+
+def _uri_leitura(arquivo):
+    """URI somente leitura do banco de uma conexão (caminho ou URI file:)."""
+    if arquivo.startswith('file:'):
+        return f"{arquivo.split('?')[0]}?mode=ro"
+    return f"{Path(arquivo).resolve().as_uri()}?mode=ro"
+
+
+def _plano(conn, sql, parametros):
+    """EXPLAIN QUERY PLAN com cursor não instrumentado (evita recursão)."""
+    if conn is None or not sql.lstrip().upper().startswith(_EXPLICAVEIS):
+        return None
+    try:
+        cursor = sqlite3.Cursor(conn)
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros)
+        return [linha[-1] for linha in cursor.fetchall()]
+    except sqlite3.Error as e:
+        return [f"plano indisponível: {e}"]
+
+
+def _escrever_lenta(entrada):
+    """Acrescenta a entrada ao log, passando o arquivo a .1 quando atinge o limite."""
+    try:
+        with _log_lock:
+            if SLOW_QUERY_LOG.exists() and SLOW_QUERY_LOG.stat().st_size >= SLOW_QUERY_LOG_MAX_KB * 1024:
+                SLOW_QUERY_LOG.replace(SLOW_QUERY_LOG.with_name(f"{SLOW_QUERY_LOG.name}.1"))
+                _ESTATISTICAS_LOG['rotacoes'] += 1
+            with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as arquivo:
+                arquivo.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+            _ESTATISTICAS_LOG['gravadas'] += 1
+    except OSError as e:
+        with _log_lock:
+            _ESTATISTICAS_LOG['descartadas'] += 1
+        print(f"⚠️ AVISO: não foi possível gravar o log de consultas lentas: {e}")
+
+
+def _trabalhador_lentas():
+    """Laço da thread do log de lentas: EXPLAIN em conexão própria e gravação no arquivo."""
+    conexoes = {}  # banco -> conexão somente leitura para os planos
+    while True:
+        arquivo, sql, parametros, entrada = _fila_lentas.get()
+        try:
+            conn = None
+            if arquivo:
+                conn = conexoes.get(arquivo)
+                if conn is None:
+                    try:
+                        conn = conexoes[arquivo] = sqlite3.connect(_uri_leitura(arquivo), uri=True, timeout=1)
+                    except sqlite3.Error as e:
+                        entrada['plano'] = [f"plano indisponível: {e}"]
+            if 'plano' not in entrada:
+                entrada['plano'] = _plano(conn, sql, parametros)
+            _escrever_lenta(entrada)
+        finally:
+            _fila_lentas.task_done()
+
+
+def _garantir_thread_lentas():
+    """Inicia a thread do log de lentas na primeira consulta lenta."""
+    global _thread_lentas
+    if _thread_lentas is not None and _thread_lentas.is_alive():
+        return
+    with _thread_lock:
+        if _thread_lentas is None or not _thread_lentas.is_alive():
+            _thread_lentas = threading.Thread(target=_trabalhador_lentas, name='slow_query_log', daemon=True)
+            _thread_lentas.start()
+
+
+def _gravar_lenta(conn, sql, parametros, duracao, digital, local, linhas_afetadas):
+    """Enfileira a instrução lenta para o log (parâmetros não são gravados: podem conter senhas)."""
+    entrada = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'ms': round(duracao * 1000, 2),
+        'local': local,
+        'digital': digital,
+        'linhas_afetadas': linhas_afetadas,
+    }
+    if isinstance(parametros, dict):
+        parametros = dict(parametros)
+    else:
+        parametros = tuple(parametros or ())
+    _garantir_thread_lentas()
+    try:
+        _fila_lentas.put_nowait((getattr(conn, '_arquivo', None), sql, parametros, entrada))
+        evento = 'enfileiradas'
+    except queue.Full:
+        evento = 'descartadas'
+    with _log_lock:
+        _ESTATISTICAS_LOG[evento] += 1
+
+
+def aguardar_log_lentas(timeout=5.0):
+    """
+    Aguarda a gravação das lentas já enfileiradas (ex.: antes de ler o log).
+
+    Returns:
+        bool: True se a fila foi esvaziada dentro do timeout
+    """
+    prazo = time.monotonic() + timeout
+    while _fila_lentas.unfinished_tasks:
+        if time.monotonic() >= prazo:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que mede execute/executemany e conta as linhas lidas nos fetch*."""
+
+    _registro = None
+
+    def _medir(self, metodo, sql, parametros, lote):
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, parametros)
+        finally:
+            duracao = time.perf_counter() - inicio
+            afetadas = self.rowcount if self.rowcount is not None else -1
+            registro, digital, local, lenta = _registrar(sql, duracao, afetadas)
+            self._registro = registro
+            if lenta:
+                primeiro = parametros
+                if lote:
+                    primeiro = next(iter(lote), ())
+                _gravar_lenta(self.connection, sql, primeiro, duracao, digital, local, afetadas)
+
+    def execute(self, sql, parameters=()):
+        return self._medir(super().execute, sql, parameters, None)
+
+    def executemany(self, sql, seq_of_parameters):
+        lote = list(seq_of_parameters)
+        return self._medir(super().executemany, sql, lote, lote)
+
+    def _contar(self, inicio, linhas):
+        registro = self._registro
+        if registro is not None:
+            with _stats_lock:
+                registro['tempo_fetch'] += time.perf_counter() - inicio
+                registro['linhas_retornadas'] += linhas
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._contar(inicio, 1 if linha is not None else 0)
+        return linha
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(self.arraysize if size is None else size)
+        self._contar(inicio, len(linhas))
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._contar(inicio, len(linhas))
+        return linhas
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de conn.execute) são instrumentados."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # O EXPLAIN das lentas abre este banco em outra conexão
+        self._arquivo = str(args[0] if args else kwargs.get('database'))
+
+    def cursor(self, factory=None):
+        if factory is None and DB_INSTRUMENTACAO:
+            factory = CursorInstrumentado
+        return super().cursor(factory or sqlite3.Cursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def get_estatisticas():
+    """
+    Retorna as instruções medidas, da maior para a menor em tempo total.
+
+    Returns:
+        list[dict]: digital, sql, execucoes, tempos (ms), p50/p95 recentes, linhas, lentas, faixas e locais
+    """
+    with _stats_lock:
+        copia = [(digital, dict(registro, recentes=list(registro['recentes']),
+                                faixas=list(registro['faixas']), locais=dict(registro['locais'])))
+                 for digital, registro in _ESTATISTICAS.items()]
+
+    resultado = []
+    for digital, registro in copia:
+        execucoes = registro['execucoes'] or 1
+        resultado.append({
+            'digital': digital,
+            'sql': registro['sql'],
+            'execucoes': registro['execucoes'],
+            'total_ms': round(registro['tempo_total'] * 1000, 2),
+            'medio_ms': round(registro['tempo_total'] * 1000 / execucoes, 3),
+            'p50_ms': round(_percentil(registro['recentes'], 50), 3),
+            'p95_ms': round(_percentil(registro['recentes'], 95), 3),
+            'maior_ms': round(registro['maior'] * 1000, 2),
+            'fetch_ms': round(registro['tempo_fetch'] * 1000, 2),
+            'linhas_retornadas': registro['linhas_retornadas'],
+            'linhas_afetadas': registro['linhas_afetadas'],
+            'lentas': registro['lentas'],
+            'faixas': dict(zip([f"<={f}ms" for f in FAIXAS_MS] + [f">{FAIXAS_MS[-1]}ms"], registro['faixas'])),
+            'locais': registro['locais'],
+        })
+    resultado.sort(key=lambda item: item['total_ms'], reverse=True)
+    return resultado
+
+
+def ler_log_lentas(limite=100):
+    """Retorna as últimas entradas do log de consultas lentas (mais recentes primeiro)."""
+    if not SLOW_QUERY_LOG.exists():
+        return []
+    # Lê só o final do arquivo (o tamanho também é limitado pela rotação)
+    with _log_lock, open(SLOW_QUERY_LOG, 'rb') as arquivo:
+        tamanho = arquivo.seek(0, os.SEEK_END)
+        inicio = max(0, tamanho - limite * _BYTES_POR_ENTRADA)
+        arquivo.seek(inicio)
+        linhas = arquivo.read().decode('utf-8', errors='replace').splitlines()
+    if inicio:
+        linhas = linhas[1:]  # primeira linha pode ter sido cortada
+    entradas = []
+    for linha in reversed(linhas[-limite:]):
+        try:
+            entradas.append(json.loads(linha))
+        except json.JSONDecodeError:
+            continue
+    return entradas
+
+
+def get_estatisticas_log_lentas():
+    """
+    Retorna os contadores do log de consultas lentas.
+
+    Returns:
+        dict: enfileiradas, gravadas, descartadas, rotacoes, backlog e tamanho_kb do arquivo
+    """
+    with _log_lock:
+        stats = dict(_ESTATISTICAS_LOG)
+    stats['backlog'] = _fila_lentas.qsize()
+    try:
+        stats['tamanho_kb'] = round(SLOW_QUERY_LOG.stat().st_size / 1024, 1)
+    except OSError:
+        stats['tamanho_kb'] = 0.0
+    stats['limite_kb'] = SLOW_QUERY_LOG_MAX_KB
+    return stats
+
+
+def limpar_estatisticas():
+    """Zera os contadores em memória (o log de lentas em disco é mantido)."""
+    with _stats_lock:
+        _ESTATISTICAS.clear()
+
+
+atexit.register(aguardar_log_lentas, 2.0)
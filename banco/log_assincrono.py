@@ -0,0 +1,193 @@
+# banco/log_assincrono.py
+# Gravação assíncrona e em lote do log de acessos (log_acessos)
+# Data: 18/10/2026 - Hora: 15:00
+
+import atexit
+import queue
+import threading
+import time
+
+from config import LOG_FILA_MAX, LOG_LOTE_MAX, LOG_INTERVALO_MS
+from banco.backends import erros_banco
+from banco.conexao import get_connection
+from banco.retentativa import transacao_com_retentativa
+from banco.shards import banco_do_usuario
+
+# A página só coloca o registro na fila; uma thread em segundo plano grava
+# com executemany a cada LOG_LOTE_MAX registros ou LOG_INTERVALO_MS. Se a
+# fila estiver cheia o registro é descartado e contado (o render não espera).
+_fila = queue.Queue(maxsize=LOG_FILA_MAX)
+_thread = None
+_thread_lock = threading.Lock()
+_parar = threading.Event()
+
+_stats_lock = threading.Lock()
+_ESTATISTICAS = {
+    'enfileirados': 0,      # registros aceitos na fila
+    'gravados': 0,          # registros inseridos em log_acessos
+    'descartados': 0,       # registros perdidos por fila cheia
+    'falhas': 0,            # registros perdidos por erro de gravação
+    'lotes': 0,             # executemany executados
+    'maior_backlog': 0,     # maior profundidade de fila observada
+    'tempo_gravacao': 0.0,  # segundos gastos gravando lotes
+    'ultimo_erro': None,
+}
+
+
+class _MarcaFlush:
+    """Marcador colocado na fila por flush(): sinaliza quando tudo antes dele foi gravado."""
+
+    def __init__(self):
+        self.evento = threading.Event()
+
+
+def _gravar_lote(lote, destino=None):
+    """Insere um lote de registros em uma transação."""
+    inicio = time.perf_counter()
+    conn = get_connection(destino)
+    try:
+        transacao_com_retentativa(
+            conn, 'log_assincrono.gravar_lote',
+            lambda cursor: cursor.executemany("""
+                INSERT INTO log_acessos (
+                    user_id,
+                    data_acesso,
+                    hora_acesso,
+                    programa,
+                    acao
+                )
+                VALUES (?, ?, ?, ?, ?)
+            """, lote)
+        )
+        with _stats_lock:
+            _ESTATISTICAS['gravados'] += len(lote)
+            _ESTATISTICAS['lotes'] += 1
+            _ESTATISTICAS['tempo_gravacao'] += time.perf_counter() - inicio
+    except erros_banco() as e:
+        with _stats_lock:
+            _ESTATISTICAS['falhas'] += len(lote)
+            _ESTATISTICAS['ultimo_erro'] = str(e)
+        print(f"⚠️ AVISO: {len(lote)} registro(s) de log_acessos não gravados: {e}")
+    finally:
+        conn.close()
+
+
+def _gravar_por_banco(lote):
+    """Separa o lote pelo banco de cada usuário (banco/shards.py) e grava cada parte."""
+    partes = {}
+    for registro in lote:
+        partes.setdefault(banco_do_usuario(registro[0]), []).append(registro)
+    for destino, registros in partes.items():
+        _gravar_lote(registros, destino)
+
+
+def _trabalhador():
+    """Laço da thread de gravação: junta registros em lotes por quantidade ou tempo."""
+    intervalo = LOG_INTERVALO_MS / 1000
+    while not (_parar.is_set() and _fila.empty()):
+        try:
+            item = _fila.get(timeout=intervalo)
+        except queue.Empty:
+            continue
+
+        lote = []
+        marcas = []
+        limite = time.monotonic() + intervalo
+        while True:
+            if isinstance(item, _MarcaFlush):
+                marcas.append(item)
+                break  # grava imediatamente o que veio antes da marca
+            lote.append(item)
+            if len(lote) >= LOG_LOTE_MAX:
+                break
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                item = _fila.get(timeout=restante)
+            except queue.Empty:
+                break
+
+        if lote:
+            _gravar_por_banco(lote)
+        for marca in marcas:
+            marca.evento.set()
+
+
+def _garantir_thread():
+    """Inicia a thread de gravação na primeira utilização."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _parar.clear()
+            _thread = threading.Thread(target=_trabalhador, name='log_acessos_writer', daemon=True)
+            _thread.start()
+
+
+def enfileirar(user_id, data_acesso, hora_acesso, programa, acao):
+    """
+    Coloca um registro de acesso na fila de gravação sem bloquear.
+
+    Returns:
+        bool: True se aceito, False se descartado por fila cheia
+    """
+    _garantir_thread()
+    try:
+        _fila.put_nowait((user_id, data_acesso, hora_acesso, programa, acao))
+    except queue.Full:
+        with _stats_lock:
+            _ESTATISTICAS['descartados'] += 1
+        return False
+
+    backlog = _fila.qsize()
+    with _stats_lock:
+        _ESTATISTICAS['enfileirados'] += 1
+        if backlog > _ESTATISTICAS['maior_backlog']:
+            _ESTATISTICAS['maior_backlog'] = backlog
+    return True
+
+
+def flush(timeout=5.0):
+    """
+    Aguarda a gravação de tudo que já estava na fila (ex.: antes de ler o log).
+
+    Returns:
+        bool: True se a fila foi gravada dentro do timeout
+    """
+    if _thread is None or not _thread.is_alive():
+        return _fila.empty()
+    marca = _MarcaFlush()
+    try:
+        _fila.put(marca, timeout=timeout)
+    except queue.Full:
+        return False
+    return marca.evento.wait(timeout)
+
+
+def encerrar(timeout=5.0):
+    """Grava o que restou na fila e para a thread (chamado no desligamento do processo)."""
+    global _thread
+    if _thread is None:
+        return
+    _parar.set()
+    _thread.join(timeout)
+    _thread = None
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores do gravador assíncrono.
+
+    Returns:
+        dict: enfileirados, gravados, descartados, falhas, lotes, backlog atual e maior_backlog
+    """
+    with _stats_lock:
+        stats = dict(_ESTATISTICAS)
+    stats['backlog'] = _fila.qsize()
+    stats['ativo'] = _thread is not None and _thread.is_alive()
+    return stats
+
+
+atexit.register(encerrar)
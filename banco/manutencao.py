@@ -0,0 +1,513 @@
+# banco/manutencao.py
+# Manutenção em segundo plano: backup online incremental, ANALYZE/PRAGMA optimize, arquivamento do log, poda do registro de mudanças e VACUUM INTO sob demanda
+# Data: 18/10/2026 - Hora: 21:00
+# comando: uv run python -m banco.manutencao [--backup | --otimizar | --compactar [destino]]
+
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from config import (
+    DB_PATH,
+    DB_BUSY_TIMEOUT_MS,
+    BACKUP_DIR,
+    BACKUP_INTERVALO_H,
+    BACKUP_MANTER,
+    BACKUP_PAGINAS_PASSO,
+    BACKUP_PAUSA_MS,
+    OTIMIZAR_INTERVALO_H,
+    LOG_ARQUIVAR_INTERVALO_H,
+)
+from banco.backends import get_backend
+from banco.arquivo_log import arquivar_meses_fechados
+from banco.conexao import get_connection
+from banco.retentativa import transacao_com_retentativa
+from banco.mudancas import podar as podar_registro_mudancas
+from banco.shards import arquivos_shards, sincronizar_templates
+
+# O backup usa a API de backup do SQLite em passos de BACKUP_PAGINAS_PASSO
+# páginas com pausa entre eles: em WAL o leitor não bloqueia os gravadores e
+# a pausa limita o I/O disputado com as páginas. Se o banco for alterado
+# durante a cópia o SQLite recomeça; após _MAX_REINICIOS a cópia é terminada
+# em um único passo. Backups e cópias compactadas são arquivos novos na pasta
+# BACKUP_DIR, que precisa existir (não é criada aqui). Cada tarefa percorre o
+# banco principal e os shards de empresa do diretório (banco/shards.py); a
+# cada verificação o template dos shards é recopiado se o do principal mudou.
+_MAX_REINICIOS = 3
+_PREFIXO_BACKUP = 'calcrh2_backup_'
+_VERIFICAR_A_CADA_S = 60
+
+_execucao_lock = threading.Lock()    # uma tarefa de manutenção por vez no processo
+_stats_lock = threading.Lock()
+_thread = None
+_thread_lock = threading.Lock()
+_parar = threading.Event()
+
+_ESTATISTICAS = {
+    'backups': 0,
+    'otimizacoes': 0,
+    'compactacoes': 0,
+    'arquivamentos': 0,
+    'podas_mudancas': 0,
+    'falhas': 0,
+    'ultimo_backup': None,       # datetime.isoformat da última execução bem-sucedida
+    'ultima_otimizacao': None,
+    'historico': deque(maxlen=50),
+}
+
+
+class _ReiniciarCopia(Exception):
+    """Interrompe a cópia em passos quando o banco mudou vezes demais durante o backup."""
+
+
+def _tamanho(caminho):
+    try:
+        return Path(caminho).stat().st_size
+    except OSError:
+        return 0
+
+
+def _registrar(tarefa, inicio, ok, **detalhes):
+    """Guarda a execução no histórico e nos contadores."""
+    entrada = {
+        'tarefa': tarefa,
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'duracao_s': round(time.perf_counter() - inicio, 3),
+        'ok': ok,
+        **detalhes,
+    }
+    with _stats_lock:
+        _ESTATISTICAS['historico'].appendleft(entrada)
+        if not ok:
+            _ESTATISTICAS['falhas'] += 1
+    if not ok:
+        print(f"⚠️ AVISO: manutenção '{tarefa}' falhou: {detalhes.get('erro')}")
+    return entrada
+
+
+def _pasta_backup():
+    if not BACKUP_DIR.exists():
+        raise FileNotFoundError(f"pasta de backup '{BACKUP_DIR}' não existe")
+    return BACKUP_DIR
+
+
+def _conectar_origem(caminho=None):
+    """Conexão própria (fora do pool), para não disputar a conexão das páginas."""
+    return sqlite3.connect(caminho or DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+
+
+def _destino_shard(destino, arquivo):
+    """Arquivo ao lado de destino para a cópia de um shard: <destino>_<shard>.db."""
+    return destino.with_name(f"{destino.stem}_{Path(arquivo).stem}{destino.suffix}")
+
+
+def _avisar_shard(tarefa, arquivo, erro):
+    """Falha em um shard: aviso e contador, sem interromper os demais bancos."""
+    with _stats_lock:
+        _ESTATISTICAS['falhas'] += 1
+    print(f"⚠️ AVISO: manutenção '{tarefa}' falhou no shard {arquivo}: {erro}")
+    return str(erro)
+
+
+def _rotacionar(pasta, prefixo=_PREFIXO_BACKUP):
+    """Apaga os backups mais antigos além de BACKUP_MANTER."""
+    backups = sorted(pasta.glob(f'{prefixo}*.db'))
+    for antigo in backups[:-BACKUP_MANTER] if BACKUP_MANTER > 0 else []:
+        try:
+            antigo.unlink()
+        except OSError as e:
+            print(f"⚠️ AVISO: não foi possível remover o backup antigo {antigo.name}: {e}")
+
+
+def _copiar_online(origem, destino, paginas_passo, pausa):
+    """
+    Copia um arquivo SQLite em passos com pausa, via <destino>.parcial.
+
+    Returns:
+        dict: passos, reinicios e total de páginas
+    """
+    progresso = {'passos': 0, 'reinicios': 0, 'restante': None, 'total': 0}
+
+    def ao_progredir(status, restante, total):
+        if progresso['restante'] is not None and restante >= progresso['restante']:
+            progresso['reinicios'] += 1  # alguém gravou no banco: o SQLite recomeçou a cópia
+            if progresso['reinicios'] > _MAX_REINICIOS:
+                raise _ReiniciarCopia()
+        progresso['passos'] += 1
+        progresso['restante'] = restante
+        progresso['total'] = total
+        if restante:
+            time.sleep(pausa)
+
+    parcial = destino.with_suffix('.parcial')
+    try:
+        conn_origem = _conectar_origem(origem)
+        copia = sqlite3.connect(parcial)
+        try:
+            try:
+                conn_origem.backup(copia, pages=paginas_passo, progress=ao_progredir)
+            except _ReiniciarCopia:
+                conn_origem.backup(copia, pages=-1)  # banco muito ativo: termina em um passo
+                progresso['passos'] += 1
+        finally:
+            copia.close()
+            conn_origem.close()
+        parcial.replace(destino)
+    except Exception:
+        parcial.unlink(missing_ok=True)
+        raise
+    return progresso
+
+
+def fazer_backup(destino=None, paginas_passo=None, pausa_ms=None):
+    """
+    Copia o banco em funcionamento e cada shard de empresa para arquivos novos, em passos com pausa.
+
+    Os shards (banco/shards.py) vão para BACKUP_DIR/<shard>_backup_<data>.db,
+    ou para <destino>_<shard>.db quando destino é informado. Um shard que
+    falha gera aviso e fica em falhas_shards; o backup do principal vale.
+
+    Args:
+        destino (Path|str, optional): Arquivo de destino. Padrão: BACKUP_DIR/calcrh2_backup_<data>.db
+        paginas_passo (int, optional): Páginas por passo. Padrão: config.BACKUP_PAGINAS_PASSO
+        pausa_ms (int, optional): Pausa entre passos. Padrão: config.BACKUP_PAUSA_MS
+
+    Returns:
+        dict: Registro da execução (duracao_s, tamanho, paginas, passos, reinicios, arquivo,
+              shards e falhas_shards)
+    """
+    paginas_passo = paginas_passo or BACKUP_PAGINAS_PASSO
+    pausa = (BACKUP_PAUSA_MS if pausa_ms is None else pausa_ms) / 1000
+    inicio = time.perf_counter()
+    copias, falhas = {}, {}
+
+    with _execucao_lock:
+        try:
+            if get_backend().nome != 'sqlite':
+                raise RuntimeError("backup online só se aplica ao SQLite (use pg_dump no PostgreSQL)")
+            data = f"{datetime.now():%Y%m%d_%H%M%S}"
+            padrao = destino is None
+            destino = _pasta_backup() / f"{_PREFIXO_BACKUP}{data}.db" if padrao else Path(destino)
+            progresso = _copiar_online(DB_PATH, destino, paginas_passo, pausa)
+            if destino.parent == BACKUP_DIR:
+                _rotacionar(BACKUP_DIR)
+        except Exception as e:
+            return _registrar('backup', inicio, False, erro=str(e))
+
+        for arquivo in arquivos_shards():
+            prefixo = f"{Path(arquivo).stem}_backup_"
+            copia = BACKUP_DIR / f"{prefixo}{data}.db" if padrao else _destino_shard(destino, arquivo)
+            try:
+                parcial = _copiar_online(arquivo, copia, paginas_passo, pausa)
+            except Exception as e:
+                falhas[arquivo] = _avisar_shard('backup', arquivo, e)
+                continue
+            copias[arquivo] = str(copia)
+            for chave in ('passos', 'reinicios', 'total'):
+                progresso[chave] += parcial[chave]
+            if copia.parent == BACKUP_DIR:
+                _rotacionar(BACKUP_DIR, prefixo)
+
+    with _stats_lock:
+        _ESTATISTICAS['backups'] += 1
+        _ESTATISTICAS['ultimo_backup'] = datetime.now().isoformat(timespec='seconds')
+    return _registrar(
+        'backup', inicio, True,
+        arquivo=str(destino),
+        tamanho=_tamanho(destino) + sum(_tamanho(c) for c in copias.values()),
+        paginas=progresso['total'],
+        passos=progresso['passos'],
+        reinicios=progresso['reinicios'],
+        shards=copias,
+        falhas_shards=falhas,
+    )
+
+
+def otimizar():
+    """
+    Atualiza as estatísticas do planejador (ANALYZE) e roda PRAGMA optimize,
+    no banco principal e em cada shard de empresa.
+
+    Returns:
+        dict: Registro da execução (bancos otimizados e falhas_shards)
+    """
+    inicio = time.perf_counter()
+    falhas = {}
+    bancos = 1
+    with _execucao_lock:
+        try:
+            backend = get_backend()
+            if backend.nome == 'sqlite':
+                for arquivo in [None] + arquivos_shards():
+                    try:
+                        conn = _conectar_origem(arquivo)
+                        try:
+                            conn.execute("ANALYZE")
+                            conn.execute("PRAGMA optimize")
+                            conn.commit()
+                        finally:
+                            conn.close()
+                    except Exception as e:
+                        if arquivo is None:
+                            raise
+                        falhas[arquivo] = _avisar_shard('otimizar', arquivo, e)
+                        continue
+                    bancos += arquivo is not None
+            else:
+                conn = get_connection()
+                try:
+                    backend.otimizar(conn.cursor())
+                    conn.commit()
+                finally:
+                    conn.close()
+        except Exception as e:
+            return _registrar('otimizar', inicio, False, erro=str(e))
+
+    with _stats_lock:
+        _ESTATISTICAS['otimizacoes'] += 1
+        _ESTATISTICAS['ultima_otimizacao'] = datetime.now().isoformat(timespec='seconds')
+    return _registrar('otimizar', inicio, True, bancos=bancos, falhas_shards=falhas)
+
+
+def compactar(destino=None):
+    """
+    Grava cópias compactadas do banco e dos shards com VACUUM INTO (os bancos em uso não são alterados).
+
+    Para usar a cópia, pare o app e substitua o arquivo do banco por ela.
+    A cópia de cada shard fica em <destino>_<shard>.db.
+
+    Args:
+        destino (Path|str, optional): Arquivo de destino (não pode existir).
+            Padrão: BACKUP_DIR/calcrh2_compactado_<data>.db
+
+    Returns:
+        dict: Registro da execução (tamanho_original, tamanho_compactado, economia, shards, falhas_shards)
+    """
+    inicio = time.perf_counter()
+    copias, falhas = {}, {}
+    with _execucao_lock:
+        try:
+            if get_backend().nome != 'sqlite':
+                raise RuntimeError("VACUUM INTO só se aplica ao SQLite")
+            if destino is None:
+                destino = _pasta_backup() / f"calcrh2_compactado_{datetime.now():%Y%m%d_%H%M%S}.db"
+            destino = Path(destino)
+            if destino.exists():
+                raise FileExistsError(f"'{destino}' já existe")
+
+            original = _tamanho(DB_PATH) + _tamanho(f"{DB_PATH}-wal")
+            conn = _conectar_origem()
+            try:
+                conn.execute("VACUUM INTO ?", (str(destino),))
+            finally:
+                conn.close()
+        except Exception as e:
+            return _registrar('compactar', inicio, False, erro=str(e))
+
+        for arquivo in arquivos_shards():
+            copia = _destino_shard(destino, arquivo)
+            try:
+                if copia.exists():
+                    raise FileExistsError(f"'{copia}' já existe")
+                conn = _conectar_origem(arquivo)
+                try:
+                    conn.execute("VACUUM INTO ?", (str(copia),))
+                finally:
+                    conn.close()
+            except Exception as e:
+                falhas[arquivo] = _avisar_shard('compactar', arquivo, e)
+                continue
+            copias[arquivo] = str(copia)
+            original += _tamanho(arquivo) + _tamanho(f"{arquivo}-wal")
+
+    compactado = _tamanho(destino) + sum(_tamanho(c) for c in copias.values())
+    with _stats_lock:
+        _ESTATISTICAS['compactacoes'] += 1
+    return _registrar(
+        'compactar', inicio, True,
+        arquivo=str(destino),
+        tamanho_original=original,
+        tamanho_compactado=compactado,
+        economia=original - compactado,
+        shards=copias,
+        falhas_shards=falhas,
+    )
+
+
+def arquivar_log():
+    """
+    Move os meses fechados de log_acessos para os arquivos mensais (banco/arquivo_log.py),
+    no banco principal e em cada shard de empresa.
+
+    Returns:
+        dict: Registro da execução (meses {AAAA-MM: linhas} do principal, shards {arquivo: meses},
+              linhas, tamanho do banco)
+    """
+    inicio = time.perf_counter()
+    por_shard, falhas = {}, {}
+    with _execucao_lock:
+        try:
+            meses = arquivar_meses_fechados()
+        except Exception as e:
+            return _registrar('arquivar_log', inicio, False, erro=str(e))
+        for arquivo in arquivos_shards():
+            try:
+                por_shard[arquivo] = arquivar_meses_fechados(banco=arquivo)
+            except Exception as e:
+                falhas[arquivo] = _avisar_shard('arquivar_log', arquivo, e)
+
+    with _stats_lock:
+        _ESTATISTICAS['arquivamentos'] += 1
+    return _registrar(
+        'arquivar_log', inicio, True,
+        meses=meses,
+        shards=por_shard,
+        linhas=sum(meses.values()) + sum(sum(m.values()) for m in por_shard.values()),
+        tamanho=_tamanho(DB_PATH),
+        falhas_shards=falhas,
+    )
+
+
+def podar_mudancas():
+    """
+    Remove do registro de mudanças o que todos os consumidores já confirmaram (banco/mudancas.py),
+    no banco principal e em cada shard de empresa (cada um tem o seu registro).
+
+    Returns:
+        dict: Registro da execução (linhas removidas no total e shards {arquivo: linhas})
+    """
+    inicio = time.perf_counter()
+    por_shard, falhas = {}, {}
+    with _execucao_lock:
+        for arquivo in [None] + arquivos_shards():
+            try:
+                conn = get_connection(arquivo)
+                try:
+                    linhas = transacao_com_retentativa(conn, 'manutencao.podar_mudancas', podar_registro_mudancas)
+                finally:
+                    conn.close()
+            except Exception as e:
+                if arquivo is None:
+                    return _registrar('podar_mudancas', inicio, False, erro=str(e))
+                falhas[arquivo] = _avisar_shard('podar_mudancas', arquivo, e)
+                continue
+            if arquivo is None:
+                principal = linhas
+            else:
+                por_shard[arquivo] = linhas
+
+    with _stats_lock:
+        _ESTATISTICAS['podas_mudancas'] += 1
+    return _registrar('podar_mudancas', inicio, True, linhas=principal + sum(por_shard.values()),
+                      shards=por_shard, falhas_shards=falhas)
+
+
+def sincronizar_templates_shards():
+    """
+    Recopia o template para os shards cujo carimbo ficou para trás do principal (banco/shards.py).
+
+    Returns:
+        dict|None: Registro da execução, ou None se nenhum shard precisava de cópia
+    """
+    inicio = time.perf_counter()
+    with _execucao_lock:
+        try:
+            copiadas = sincronizar_templates(somente_alterados=True)
+        except Exception as e:
+            return _registrar('sincronizar_templates', inicio, False, erro=str(e))
+    if not copiadas:
+        return None  # verificado a cada minuto: só entra no histórico quando copiou algo
+    return _registrar('sincronizar_templates', inicio, True, shards=copiadas)
+
+
+def _ultimo_backup_em_disco():
+    """Data do backup mais recente na pasta (sobrevive a reinícios do processo)."""
+    if not BACKUP_DIR.exists():
+        return None
+    backups = sorted(BACKUP_DIR.glob(f'{_PREFIXO_BACKUP}*.db'))
+    return datetime.fromtimestamp(backups[-1].stat().st_mtime) if backups else None
+
+
+def _vencido(ultima, intervalo_h):
+    return intervalo_h > 0 and (ultima is None or (datetime.now() - ultima).total_seconds() >= intervalo_h * 3600)
+
+
+def _agendador():
+    """Laço da thread: confere a cada minuto se backup ou otimização venceram."""
+    ultimo_backup = _ultimo_backup_em_disco()
+    ultima_otimizacao = datetime.now()  # a inicialização já roda as migrações (PRAGMA optimize)
+    ultimo_arquivamento = None
+    sem_pasta_avisado = False
+    while not _parar.wait(_VERIFICAR_A_CADA_S):
+        if get_backend().nome == 'sqlite':
+            sincronizar_templates_shards()
+        if _vencido(ultimo_backup, BACKUP_INTERVALO_H):
+            if get_backend().nome == 'sqlite' and BACKUP_DIR.exists():
+                if fazer_backup()['ok']:
+                    ultimo_backup = datetime.now()
+            elif not sem_pasta_avisado:
+                print(f"⚠️ AVISO: backup agendado desativado - pasta '{BACKUP_DIR}' ausente ou backend sem suporte")
+                sem_pasta_avisado = True
+        if _vencido(ultimo_arquivamento, LOG_ARQUIVAR_INTERVALO_H):
+            if get_backend().nome == 'sqlite':
+                arquivar_log()
+                podar_mudancas()
+            ultimo_arquivamento = datetime.now()
+        if _vencido(ultima_otimizacao, OTIMIZAR_INTERVALO_H):
+            otimizar()
+            ultima_otimizacao = datetime.now()
+
+
+def iniciar_agendador():
+    """Inicia a thread de manutenção (uma por processo)."""
+    global _thread
+    if BACKUP_INTERVALO_H <= 0 and OTIMIZAR_INTERVALO_H <= 0 and LOG_ARQUIVAR_INTERVALO_H <= 0:
+        return False
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _parar.clear()
+            _thread = threading.Thread(target=_agendador, name='manutencao_banco', daemon=True)
+            _thread.start()
+    return True
+
+
+def parar_agendador(timeout=5.0):
+    """Para a thread de manutenção (a tarefa em andamento termina antes)."""
+    global _thread
+    if _thread is None:
+        return
+    _parar.set()
+    _thread.join(timeout)
+    _thread = None
+
+
+def get_estatisticas():
+    """
+    Retorna contadores e histórico das tarefas de manutenção.
+
+    Returns:
+        dict: backups, otimizacoes, compactacoes, arquivamentos, falhas, últimas execuções,
+              historico (mais recente primeiro), ativo e tamanho atual do banco e dos shards
+    """
+    with _stats_lock:
+        stats = dict(_ESTATISTICAS, historico=list(_ESTATISTICAS['historico']))
+    stats['ativo'] = _thread is not None and _thread.is_alive()
+    if get_backend().nome == 'sqlite':
+        stats['tamanho_banco'] = _tamanho(DB_PATH)
+        stats['tamanho_wal'] = _tamanho(f"{DB_PATH}-wal")
+        stats['tamanho_shards'] = sum(_tamanho(arquivo) for arquivo in arquivos_shards())
+    return stats
+
+
+if __name__ == "__main__":
+    if '--otimizar' in sys.argv:
+        print(otimizar())
+    elif '--compactar' in sys.argv:
+        argumentos = sys.argv[sys.argv.index('--compactar') + 1:]
+        print(compactar(argumentos[0] if argumentos else None))
+    else:
+        print(fazer_backup())
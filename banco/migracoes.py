@@ -0,0 +1,399 @@
+# banco/migracoes.py
+# Migrações versionadas do esquema (índices, views e tabelas) com relatório de dry-run
+# Data: 18/10/2026 - Hora: 10:00
+# comando: uv run python -m banco.migracoes [--dry-run]
+
+import re
+import sys
+
+from banco.conexao import get_connection
+from banco.backends import get_backend
+from banco.templates import marcar_templates_alterados
+from banco.provisionamento import limpar_marcas
+from banco.shards import arquivos_shards
+
+# Cada migração é idempotente (IF NOT EXISTS). A versão aplicada fica em
+# PRAGMA user_version, e os objetos de cada migração são conferidos a cada
+# execução: se create_forms.py recriar uma tabela, os índices voltam.
+def _gatilhos_template(tabela, condicao):
+    """Gatilhos que incrementam template_versao quando linhas do template mudam."""
+    comandos = []
+    for evento, sufixo, linhas in (('INSERT', 'ins', ('NEW',)), ('UPDATE', 'upd', ('OLD', 'NEW')),
+                                   ('DELETE', 'del', ('OLD',))):
+        when = ''
+        if condicao:
+            when = ' WHEN ' + ' OR '.join(f"{linha}.{condicao}" for linha in linhas)
+        comandos.append(f"""CREATE TRIGGER IF NOT EXISTS trg_{tabela}_template_{sufixo}
+               AFTER {evento} ON {tabela}{when}
+               BEGIN
+                   INSERT INTO template_versao (tabela, versao) VALUES ('{tabela}', 1)
+                   ON CONFLICT (tabela) DO UPDATE SET versao = versao + 1;
+               END""")
+    return comandos
+
+
+def _gatilhos_mudancas(tabela):
+    """Gatilhos que registram em mudancas_valores as células de usuários alteradas (user_id <> 0)."""
+    colunas = "user_id, tabela, name_element, valor_antigo, valor_novo, str_antigo, str_novo"
+    diferente = "({a}.value_element IS NOT {n}.value_element OR {a}.str_element IS NOT {n}.str_element)"
+    # Modo legado: UPDATE nas cópias do template
+    comandos = [f"""CREATE TRIGGER IF NOT EXISTS trg_cdc_{tabela}_upd
+               AFTER UPDATE OF value_element, str_element ON {tabela}
+               WHEN NEW.user_id <> 0 AND {diferente.format(a='OLD', n='NEW')}
+               BEGIN
+                   INSERT INTO mudancas_valores ({colunas})
+                   VALUES (NEW.user_id, '{tabela}', NEW.name_element,
+                           OLD.value_element, NEW.value_element, OLD.str_element, NEW.str_element);
+               END"""]
+    # Modo normalizado: o valor anterior de uma célula sem linha é o do template
+    for evento, sufixo, linha, antes, depois in (('INSERT', 'ins', 'NEW', 't', 'NEW'),
+                                                 ('UPDATE', 'upd', 'NEW', 'OLD', 'NEW'),
+                                                 ('DELETE', 'del', 'OLD', 'OLD', 't')):
+        comandos.append(f"""CREATE TRIGGER IF NOT EXISTS trg_cdc_{tabela}_valores_{sufixo}
+               AFTER {evento} ON {tabela}_valores
+               BEGIN
+                   INSERT INTO mudancas_valores ({colunas})
+                   SELECT {linha}.user_id, '{tabela}', {linha}.name_element,
+                          {antes}.value_element, {depois}.value_element, {antes}.str_element, {depois}.str_element
+                   FROM {tabela} t
+                   WHERE t.user_id = 0 AND t.name_element = {linha}.name_element
+                     AND {diferente.format(a=antes, n=depois)};
+               END""")
+    return comandos
+
+
+MIGRACOES = [
+    {
+        'versao': 1,
+        'descricao': 'Índices compostos de forms_tab, forms_resultados, forms_insumos e log_acessos',
+        'comandos': [
+            """CREATE INDEX IF NOT EXISTS idx_forms_tab_user_secao
+               ON forms_tab (user_id, section, e_row, e_col)""",
+            """CREATE INDEX IF NOT EXISTS idx_forms_tab_user_nome
+               ON forms_tab (user_id, name_element)""",
+            """CREATE INDEX IF NOT EXISTS idx_forms_tab_condicaoh
+               ON forms_tab (math_element, user_id)
+               WHERE type_element = 'condicaoH'""",
+            """CREATE INDEX IF NOT EXISTS idx_forms_resultados_user_pos
+               ON forms_resultados (user_id, e_row, e_col)""",
+            """CREATE INDEX IF NOT EXISTS idx_forms_resultados_user_nome
+               ON forms_resultados (user_id, name_element)""",
+            """CREATE INDEX IF NOT EXISTS idx_forms_insumos_nome
+               ON forms_insumos (name_element)""",
+            """CREATE INDEX IF NOT EXISTS idx_log_acessos_data
+               ON log_acessos (data_acesso)""",
+            """CREATE INDEX IF NOT EXISTS idx_log_acessos_user_data
+               ON log_acessos (user_id, data_acesso)""",
+        ],
+    },
+    {
+        'versao': 2,
+        'descricao': 'Armazenamento normalizado: views de template e tabelas estreitas de valores por usuário',
+        'comandos': [
+            """CREATE VIEW IF NOT EXISTS forms_tab_template AS
+               SELECT * FROM forms_tab WHERE user_id = 0""",
+            """CREATE TABLE IF NOT EXISTS forms_tab_valores (
+                   user_id INTEGER NOT NULL,
+                   name_element TEXT NOT NULL,
+                   value_element REAL,
+                   str_element TEXT,
+                   PRIMARY KEY (user_id, name_element)
+               ) WITHOUT ROWID""",
+            """CREATE VIEW IF NOT EXISTS forms_resultados_template AS
+               SELECT * FROM forms_resultados WHERE user_id = 0""",
+            """CREATE TABLE IF NOT EXISTS forms_resultados_valores (
+                   user_id INTEGER NOT NULL,
+                   name_element TEXT NOT NULL,
+                   value_element REAL,
+                   str_element TEXT,
+                   PRIMARY KEY (user_id, name_element)
+               ) WITHOUT ROWID""",
+        ],
+    },
+    {
+        'versao': 3,
+        'descricao': 'Carimbo de versão dos templates (user_id = 0) e de forms_insumos para o cache por processo',
+        'comandos': [
+            """CREATE TABLE IF NOT EXISTS template_versao (
+                   tabela TEXT PRIMARY KEY,
+                   versao INTEGER NOT NULL DEFAULT 0
+               )""",
+        ] + _gatilhos_template('forms_tab', 'user_id = 0')
+          + _gatilhos_template('forms_resultados', 'user_id = 0')
+          + _gatilhos_template('forms_insumos', None),
+    },
+    {
+        'versao': 4,
+        'descricao': 'Marca de usuários com linhas dos formulários já materializadas (provisionamento em lote)',
+        'comandos': [
+            """CREATE TABLE IF NOT EXISTS usuarios_provisionados (
+                   user_id INTEGER PRIMARY KEY,
+                   data_provisionamento TEXT NOT NULL
+               )""",
+        ],
+    },
+    {
+        'versao': 5,
+        'descricao': 'Índice de expressão LOWER(email) para o login sem varredura de usuarios',
+        'comandos': [
+            # O SQLite mantém o índice em todo INSERT/UPDATE (CRUD, create_forms.py,
+            # provisionamento); o login precisa usar exatamente LOWER(email) = ...
+            """CREATE INDEX IF NOT EXISTS idx_usuarios_email_lower
+               ON usuarios (LOWER(email))""",
+        ],
+    },
+    {
+        'versao': 6,
+        'descricao': 'Diretório de shards por empresa (banco/shards.py)',
+        'comandos': [
+            """CREATE TABLE IF NOT EXISTS diretorio_shards (
+                   empresa TEXT PRIMARY KEY,
+                   arquivo TEXT NOT NULL,
+                   data_criacao TEXT NOT NULL
+               )""",
+        ],
+    },
+    {
+        'versao': 7,
+        'descricao': 'Registro de mudanças das células dos usuários (CDC) e posição dos consumidores (banco/mudancas.py)',
+        'comandos': [
+            # AUTOINCREMENT: ids nunca são reaproveitados depois da poda, e a
+            # posição gravada de cada consumidor continua válida
+            """CREATE TABLE IF NOT EXISTS mudancas_valores (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   user_id INTEGER NOT NULL,
+                   tabela TEXT NOT NULL,
+                   name_element TEXT,
+                   valor_antigo REAL,
+                   valor_novo REAL,
+                   str_antigo TEXT,
+                   str_novo TEXT,
+                   data_mudanca TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+               )""",
+            """CREATE TABLE IF NOT EXISTS mudancas_consumidores (
+                   consumidor TEXT PRIMARY KEY,
+                   ultimo_id INTEGER NOT NULL,
+                   data_atualizacao TEXT NOT NULL
+               )""",
+        ] + _gatilhos_mudancas('forms_tab')
+          + _gatilhos_mudancas('forms_resultados'),
+    },
+    {
+        'versao': 8,
+        'descricao': 'Carimbo do template do principal copiado para cada shard (banco/shards.py)',
+        'comandos': [
+            # No principal fica vazia; no shard guarda o template_versao do principal na última cópia
+            """CREATE TABLE IF NOT EXISTS template_origem (
+                   tabela TEXT PRIMARY KEY,
+                   versao INTEGER NOT NULL
+               )""",
+        ],
+    },
+]
+
+_RE_OBJETO = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?(INDEX|TABLE|VIEW|TRIGGER)\s+IF\s+NOT\s+EXISTS\s+(\w+)'
+    r'(?:\s+(?:(?:BEFORE|AFTER|INSTEAD\s+OF)\s+)?(?:INSERT|UPDATE|DELETE)(?:\s+OF\s+[\w\s,]+?)?)?'
+    r'(?:\s+ON\s+(\w+))?',
+    re.IGNORECASE
+)
+
+
+def _objeto_do_comando(comando):
+    """Extrai (tipo, nome, tabela_alvo) de um comando CREATE ... IF NOT EXISTS."""
+    match = _RE_OBJETO.search(comando)
+    if not match:
+        return None, None, None
+    tipo, nome, tabela = match.groups()
+    return tipo.lower(), nome, tabela
+
+
+def versao_atual(cursor):
+    """Retorna a versão de migração registrada no banco (PRAGMA user_version no SQLite)."""
+    return get_backend().versao_esquema(cursor)
+
+
+def _objetos_existentes(cursor):
+    return get_backend().objetos_existentes(cursor)
+
+
+def planejar_migracoes(cursor):
+    """
+    Monta a lista de comandos pendentes sem alterar o banco.
+
+    Inclui migrações com versão maior que a registrada e objetos de migrações
+    já aplicadas que sumiram (ex.: tabela recriada pelo create_forms.py).
+
+    Comandos sem tradução no backend (gatilhos SQLite no PostgreSQL) só
+    entram no plano da versão que os introduz, como 'nao_suportado'.
+
+    Returns:
+        list[dict]: versao, descricao, objeto, comando, motivo ('nova', 'ausente',
+                    'sem_tabela' ou 'nao_suportado')
+    """
+    backend = get_backend()
+    versao = versao_atual(cursor)
+    existentes = _objetos_existentes(cursor)
+    planejados = set()
+    plano = []
+
+    for migracao in MIGRACOES:
+        for comando in migracao['comandos']:
+            tipo, nome, tabela = _objeto_do_comando(comando)
+            if nome in existentes:
+                continue
+            if backend.adaptar_ddl(comando) is None:
+                if migracao['versao'] > versao:
+                    plano.append({
+                        'versao': migracao['versao'],
+                        'descricao': migracao['descricao'],
+                        'objeto': nome,
+                        'comando': comando,
+                        'motivo': 'nao_suportado',
+                    })
+                continue
+            # Tabelas criadas por comandos anteriores do mesmo plano contam como existentes
+            if tabela and tabela not in existentes and tabela not in planejados:
+                motivo = 'sem_tabela'
+            elif migracao['versao'] > versao:
+                motivo = 'nova'
+            else:
+                motivo = 'ausente'
+            if motivo != 'sem_tabela':
+                planejados.add(nome)
+            plano.append({
+                'versao': migracao['versao'],
+                'descricao': migracao['descricao'],
+                'objeto': nome,
+                'comando': comando,
+                'motivo': motivo,
+            })
+    return plano
+
+
+def aplicar_migracoes(dry_run=False, conn=None):
+    """
+    Aplica as migrações pendentes e repara objetos ausentes.
+
+    Args:
+        dry_run (bool): Se True, apenas relata o que seria feito
+        conn (sqlite3.Connection, optional): Conexão a usar. Padrão: pool do config.DB_PATH
+
+    Returns:
+        dict: versao_inicial, versao_final, executados, ignorados e dry_run
+    """
+    propria = conn is None
+    if propria:
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        versao_inicial = versao_atual(cursor)
+        plano = planejar_migracoes(cursor)
+        versao_alvo = max([versao_inicial] + [m['versao'] for m in MIGRACOES])
+
+        executados = [p for p in plano if p['motivo'] in ('nova', 'ausente')]
+        ignorados = [p for p in plano if p['motivo'] == 'sem_tabela']
+        nao_suportados = [p for p in plano if p['motivo'] == 'nao_suportado']
+
+        relatorio = {
+            'versao_inicial': versao_inicial,
+            'versao_final': versao_alvo if not dry_run else versao_inicial,
+            'versao_alvo': versao_alvo,
+            'executados': executados,
+            'ignorados': ignorados,
+            'nao_suportados': nao_suportados,
+            'dry_run': dry_run,
+        }
+
+        if dry_run:
+            return relatorio
+
+        if executados or versao_alvo != versao_inicial:
+            backend = get_backend()
+            backend.iniciar_escrita(cursor)
+            try:
+                gatilhos = set()
+                for item in executados:
+                    cursor.execute(backend.adaptar_ddl(item['comando']))
+                    tipo, nome, tabela = _objeto_do_comando(item['comando'])
+                    if tipo == 'trigger' and not nome.startswith('trg_cdc_'):
+                        gatilhos.add(tabela)
+                # Gatilho de template recriado = tabela reconstruída sem passar por ele: renova o carimbo
+                if gatilhos:
+                    marcar_templates_alterados(cursor, sorted(gatilhos))
+                # Formulários recriados perderam as cópias por usuário: as marcas não valem mais
+                if gatilhos & {'forms_tab', 'forms_resultados'}:
+                    limpar_marcas(cursor)
+                backend.definir_versao_esquema(cursor, versao_alvo)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if executados:
+                backend.otimizar(cursor)
+
+        for item in ignorados:
+            print(f"⚠️ AVISO: {item['objeto']} não criado - tabela alvo ausente no banco")
+        for item in nao_suportados:
+            print(f"⚠️ AVISO: {item['objeto']} não suportado em {get_backend().nome} - criar manualmente")
+
+        return relatorio
+    finally:
+        if propria:
+            conn.close()
+
+
+def aplicar_migracoes_em_todos(dry_run=False, conn=None):
+    """
+    Aplica as migrações no banco principal e em cada shard do diretório (banco/shards.py).
+
+    Cada banco tem a sua versão (PRAGMA user_version) e é migrado na sua
+    própria conexão do pool. Um shard que falha não impede os demais; o erro
+    é levantado no fim, depois de todos terem sido tentados.
+
+    Args:
+        dry_run (bool): Se True, apenas relata o que seria feito
+        conn (sqlite3.Connection, optional): Conexão do banco principal. Padrão: pool
+
+    Returns:
+        dict: {None (principal) ou arquivo do shard: relatório de aplicar_migracoes}
+    """
+    relatorios = {None: aplicar_migracoes(dry_run, conn=conn)}
+    falhas = {}
+    for arquivo in arquivos_shards():
+        conn = get_connection(arquivo)
+        try:
+            relatorios[arquivo] = aplicar_migracoes(dry_run, conn=conn)
+        except Exception as e:
+            falhas[arquivo] = str(e)
+            print(f"⚠️ AVISO: falha ao migrar o shard {arquivo}: {e}")
+        finally:
+            conn.close()
+    if falhas:
+        raise RuntimeError(f"{len(falhas)} shard(s) sem migrar: {falhas}")
+    return relatorios
+
+
+def formatar_relatorio(relatorio):
+    """Gera texto legível do relatório de migrações (usado no terminal)."""
+    linhas = [
+        f"Versão do banco: {relatorio['versao_inicial']} -> "
+        f"{relatorio['versao_final']} (alvo {relatorio['versao_alvo']})"
+        + ("  [DRY-RUN]" if relatorio['dry_run'] else "")
+    ]
+    if not relatorio['executados'] and not relatorio['ignorados']:
+        linhas.append("Nenhuma alteração pendente.")
+    for item in relatorio['executados']:
+        acao = "Criaria" if relatorio['dry_run'] else "Criado"
+        linhas.append(f"  {acao} {item['objeto']} (v{item['versao']}, {item['motivo']})")
+    for item in relatorio['ignorados']:
+        linhas.append(f"  Ignorado {item['objeto']} (v{item['versao']}): tabela alvo não existe")
+    for item in relatorio.get('nao_suportados', []):
+        linhas.append(f"  Não suportado {item['objeto']} (v{item['versao']}): criar manualmente")
+    return "\n".join(linhas)
+
+
+if __name__ == "__main__":
+    for destino, relatorio in aplicar_migracoes_em_todos(dry_run='--dry-run' in sys.argv).items():
+        print(f"[{destino or 'principal'}]")
+        print(formatar_relatorio(relatorio))
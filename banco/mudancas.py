@@ -0,0 +1,221 @@
+# banco/mudancas.py
+# Registro de mudanças (CDC) das células dos usuários em forms_tab e forms_resultados, com consumidores de posição durável
+# Data: 19/10/2026 - Hora: 01:30
+# comando: uv run python -m banco.mudancas [--consumidores | --podar]
+
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+from config import CDC_LOTE, CDC_RETENCAO_DIAS
+from banco.conexao import get_connection
+from banco.retentativa import transacao_com_retentativa
+
+# Os gatilhos da migração 7 gravam em mudancas_valores cada célula de usuário
+# (user_id <> 0) cujo value_element ou str_element mudou de fato, com o valor
+# anterior e o novo, seja qual for o caminho da gravação (páginas, CRUD,
+# zerar valores, modo legado ou normalizado). Cada consumidor (recálculo,
+# cópias de call_dados, PDFs em cache, estatísticas) tem a sua posição em
+# mudancas_consumidores: lê as mudanças depois dela, processa e confirma o
+# último id. Se o processamento falha a posição não anda e o lote é entregue
+# de novo (pelo menos uma vez). Um nome de consumidor deve ser usado por um
+# processo de cada vez. Com shards (banco/shards.py) cada arquivo tem o seu
+# registro: o consumidor roda uma vez por banco, com a conexão dele. No
+# Postgres os gatilhos não são criados e o registro fica vazio.
+COLUNAS_MUDANCA = ('id', 'user_id', 'tabela', 'name_element', 'valor_antigo', 'valor_novo',
+                   'str_antigo', 'str_novo', 'data_mudanca')
+
+_stats_lock = threading.Lock()
+_ESTATISTICAS = {
+    'lotes': 0,             # lotes entregues a consumidores
+    'mudancas_lidas': 0,
+    'confirmacoes': 0,
+    'falhas_consumidor': 0, # lotes cujo processamento falhou (serão entregues de novo)
+    'podadas': 0,           # linhas removidas do registro
+}
+
+
+def _agora():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def posicao(cursor, consumidor):
+    """Último id confirmado pelo consumidor (None se não registrado)."""
+    cursor.execute("SELECT ultimo_id FROM mudancas_consumidores WHERE consumidor = ?", (consumidor,))
+    linha = cursor.fetchone()
+    return linha[0] if linha else None
+
+
+def registrar_consumidor(cursor, consumidor, desde_inicio=False):
+    """
+    Cadastra um consumidor (não faz commit). Já cadastrado, nada muda.
+
+    Args:
+        cursor: Cursor do banco de dados
+        consumidor (str): Nome do consumidor
+        desde_inicio (bool): Se True recebe também as mudanças já registradas;
+            senão começa a partir da próxima mudança
+
+    Returns:
+        int: Posição do consumidor
+    """
+    inicio = "0" if desde_inicio else "(SELECT COALESCE(MAX(id), 0) FROM mudancas_valores)"
+    cursor.execute(f"""
+        INSERT INTO mudancas_consumidores (consumidor, ultimo_id, data_atualizacao)
+        VALUES (?, {inicio}, ?)
+        ON CONFLICT (consumidor) DO NOTHING
+    """, (consumidor, _agora()))
+    return posicao(cursor, consumidor)
+
+
+def ler_mudancas(cursor, consumidor, limite=None, tabelas=None):
+    """
+    Lê as mudanças posteriores à posição do consumidor, em ordem (não avança a posição).
+
+    Args:
+        cursor: Cursor do banco de dados
+        consumidor (str): Nome do consumidor (precisa estar registrado)
+        limite (int, optional): Máximo de mudanças. Padrão: config.CDC_LOTE
+        tabelas (iterable, optional): Só as mudanças destas tabelas (ex.: ['forms_tab'])
+
+    Returns:
+        list[dict]: Mudanças com as chaves de COLUNAS_MUDANCA
+    """
+    inicio = posicao(cursor, consumidor)
+    if inicio is None:
+        raise ValueError(f"consumidor '{consumidor}' não registrado")
+    sql = f"SELECT {', '.join(COLUNAS_MUDANCA)} FROM mudancas_valores WHERE id > ?"
+    parametros = [inicio]
+    if tabelas:
+        tabelas = list(tabelas)
+        sql += f" AND tabela IN ({','.join(['?'] * len(tabelas))})"
+        parametros.extend(tabelas)
+    sql += " ORDER BY id LIMIT ?"
+    parametros.append(limite or CDC_LOTE)
+    cursor.execute(sql, parametros)
+    return [dict(zip(COLUNAS_MUDANCA, linha)) for linha in cursor.fetchall()]
+
+
+def confirmar(cursor, consumidor, ultimo_id):
+    """Avança a posição do consumidor até ultimo_id (não faz commit; nunca volta)."""
+    cursor.execute("""
+        UPDATE mudancas_consumidores
+        SET ultimo_id = MAX(ultimo_id, ?), data_atualizacao = ?
+        WHERE consumidor = ?
+    """, (ultimo_id, _agora(), consumidor))
+
+
+def consumir(consumidor, funcao, limite=None, tabelas=None, conn=None):
+    """
+    Entrega um lote de mudanças a funcao e confirma a posição se ela terminar sem erro.
+
+    O consumidor é registrado (a partir da próxima mudança) no primeiro uso.
+    Com filtro de tabelas a posição avança até o último id lido, e as
+    mudanças de outras tabelas nesse intervalo ficam para trás.
+
+    Args:
+        consumidor (str): Nome do consumidor
+        funcao (callable): Recebe a lista de mudanças (ver ler_mudancas)
+        limite (int, optional): Tamanho do lote. Padrão: config.CDC_LOTE
+        tabelas (iterable, optional): Filtro de tabelas
+        conn (optional): Conexão a usar (ex.: shard). Padrão: pool do banco principal
+
+    Returns:
+        int: Mudanças entregues (0 = consumidor em dia)
+    """
+    propria = conn is None
+    if propria:
+        conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        if posicao(cursor, consumidor) is None:
+            transacao_com_retentativa(conn, 'mudancas.registrar', registrar_consumidor, consumidor)
+        lote = ler_mudancas(cursor, consumidor, limite, tabelas)
+        if not lote:
+            return 0
+        try:
+            funcao(lote)
+        except Exception:
+            with _stats_lock:
+                _ESTATISTICAS['falhas_consumidor'] += 1
+            raise
+        transacao_com_retentativa(conn, 'mudancas.confirmar', confirmar, consumidor, lote[-1]['id'])
+        with _stats_lock:
+            _ESTATISTICAS['lotes'] += 1
+            _ESTATISTICAS['mudancas_lidas'] += len(lote)
+            _ESTATISTICAS['confirmacoes'] += 1
+        return len(lote)
+    finally:
+        if propria:
+            conn.close()
+
+
+def consumidores(cursor):
+    """
+    Lista os consumidores com a quantidade de mudanças ainda não confirmadas.
+
+    Returns:
+        list[dict]: consumidor, ultimo_id, pendentes e data_atualizacao
+    """
+    cursor.execute("""
+        SELECT c.consumidor, c.ultimo_id,
+               (SELECT COUNT(*) FROM mudancas_valores m WHERE m.id > c.ultimo_id),
+               c.data_atualizacao
+        FROM mudancas_consumidores c
+        ORDER BY c.consumidor
+    """)
+    return [
+        {'consumidor': nome, 'ultimo_id': ultimo, 'pendentes': pendentes, 'data_atualizacao': data}
+        for nome, ultimo, pendentes, data in cursor.fetchall()
+    ]
+
+
+def podar(cursor, retencao_dias=None):
+    """
+    Remove do registro as mudanças já confirmadas por todos os consumidores e,
+    com qualquer posição, as mais antigas que a retenção (não faz commit).
+
+    Args:
+        cursor: Cursor do banco de dados
+        retencao_dias (float, optional): Padrão: config.CDC_RETENCAO_DIAS (0 = sem limite de idade)
+
+    Returns:
+        int: Linhas removidas
+    """
+    retencao_dias = CDC_RETENCAO_DIAS if retencao_dias is None else retencao_dias
+    removidas = 0
+    cursor.execute("SELECT MIN(ultimo_id) FROM mudancas_consumidores")
+    minimo = cursor.fetchone()[0]
+    if minimo is not None:
+        cursor.execute("DELETE FROM mudancas_valores WHERE id <= ?", (minimo,))
+        removidas += max(cursor.rowcount, 0)
+    if retencao_dias > 0:
+        limite = (datetime.now(timezone.utc) - timedelta(days=retencao_dias)).strftime('%Y-%m-%dT%H:%M:%S')
+        cursor.execute("DELETE FROM mudancas_valores WHERE data_mudanca < ?", (limite,))
+        removidas += max(cursor.rowcount, 0)
+    with _stats_lock:
+        _ESTATISTICAS['podadas'] += removidas
+    return removidas
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores dos consumidores neste processo.
+
+    Returns:
+        dict: lotes, mudancas_lidas, confirmacoes, falhas_consumidor e podadas
+    """
+    with _stats_lock:
+        return dict(_ESTATISTICAS)
+
+
+if __name__ == "__main__":
+    conexao = get_connection()
+    try:
+        if '--podar' in sys.argv:
+            print(f"{transacao_com_retentativa(conexao, 'mudancas.podar', podar)} mudanças removidas")
+        else:
+            for item in consumidores(conexao.cursor()):
+                print(item)
+    finally:
+        conexao.close()
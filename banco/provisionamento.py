@@ -0,0 +1,337 @@
+# banco/provisionamento.py
+# Provisionamento em lote de usuários: contas a partir de arquivo + linhas dos formulários materializadas antes do primeiro acesso
+# Data: 18/10/2026 - Hora: 23:00
+# comando: uv run python -m banco.provisionamento usuarios.txt [--lote N] [--dry-run] [--encoding cp1252]
+#          uv run python -m banco.provisionamento --existentes   (materializa usuários já cadastrados)
+
+import csv
+import sys
+import threading
+import time
+from datetime import datetime
+
+from config import PROVISIONAMENTO_LOTE
+from banco.backends import erros_banco
+from banco.conexao import get_connection
+from banco.retentativa import transacao_com_retentativa
+from banco.shards import ativo as shards_ativos, listar_shards
+from banco.templates import obter_template
+from banco.usuarios import invalidar_usuario
+from banco.valores import TABELAS_FORMULARIO, modo_normalizado
+
+# No modo legado cada usuário precisa de uma cópia das linhas do template em
+# forms_tab e forms_resultados. Sem provisionamento essa cópia acontece no
+# primeiro render (new_user), e uma turma que entra junta faz centenas de
+# INSERT...SELECT ao mesmo tempo. Aqui a cópia é feita antes, em transações
+# de PROVISIONAMENTO_LOTE usuários, e o usuário é marcado em
+# usuarios_provisionados; o render passa a consultar só essa marca (busca
+# pela chave primária). Usuários de empresas com shard têm as linhas e a
+# marca no shard e também a marca no banco principal, de onde sai a lista
+# de --existentes.
+COLUNAS_ARQUIVO = ('user_id', 'nome', 'email', 'senha', 'perfil', 'empresa', 'idioma')
+_OBRIGATORIAS = ('nome', 'email', 'senha', 'perfil')
+
+_stats_lock = threading.Lock()
+_sem_tabela_avisado = False
+_ESTATISTICAS = {
+    'verificacoes': 0,          # consultas da marca no render
+    'provisionados': 0,         # usuários já marcados encontrados no render
+    'materializados_render': 0, # usuários copiados no render (sem provisionamento prévio)
+    'materializados_lote': 0,   # usuários copiados pelo provisionamento em lote
+    'linhas_lote': 0,           # linhas gravadas pelo provisionamento em lote
+}
+
+
+def usuario_provisionado(cursor, user_id):
+    """
+    Indica se as linhas do usuário já foram materializadas (marca em usuarios_provisionados).
+
+    Returns:
+        bool: True se o usuário está marcado; None se a tabela não existe (migração 4 pendente)
+    """
+    global _sem_tabela_avisado
+    try:
+        cursor.execute("SELECT 1 FROM usuarios_provisionados WHERE user_id = ?", (user_id,))
+        marcado = cursor.fetchone() is not None
+    except erros_banco() as e:
+        if not _sem_tabela_avisado:
+            print(f"⚠️ AVISO: usuarios_provisionados indisponível ({e}). Usando a verificação por tabela.")
+            _sem_tabela_avisado = True
+        return None
+    with _stats_lock:
+        _ESTATISTICAS['verificacoes'] += 1
+        if marcado:
+            _ESTATISTICAS['provisionados'] += 1
+    return marcado
+
+
+def _colunas_copia(cursor, tabela):
+    """Colunas copiadas do template (todas menos a chave e o user_id)."""
+    return [c for c in obter_template(cursor, tabela)['colunas'] if c not in ('ID_element', 'user_id')]
+
+
+def _sem_linhas(cursor, tabela, user_ids):
+    """Filtra os usuários que ainda não têm linhas na tabela."""
+    placeholders = ','.join(['?'] * len(user_ids))
+    cursor.execute(
+        f"SELECT DISTINCT user_id FROM {tabela} WHERE user_id IN ({placeholders})", list(user_ids)
+    )
+    com_linhas = {linha[0] for linha in cursor.fetchall()}
+    return [u for u in user_ids if u not in com_linhas]
+
+
+def materializar_usuarios(cursor, user_ids, marcar=True):
+    """
+    Copia as linhas do template para os usuários e os marca como provisionados (não faz commit).
+
+    Usuários que já têm linhas em uma tabela não são copiados de novo nela.
+    No modo normalizado não há cópia: apenas a marca é gravada.
+
+    Args:
+        cursor: Cursor do banco de dados (dentro de uma transação de escrita)
+        user_ids (list): IDs dos usuários
+        marcar (bool): Grava a marca em usuarios_provisionados
+
+    Returns:
+        int: Linhas inseridas nas tabelas de formulário
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return 0
+    linhas = 0
+    if not modo_normalizado():
+        for tabela in TABELAS_FORMULARIO:
+            pendentes = _sem_linhas(cursor, tabela, user_ids)
+            if not pendentes:
+                continue
+            colunas = ', '.join(_colunas_copia(cursor, tabela))
+            cursor.executemany(f"""
+                INSERT INTO {tabela} ({colunas}, user_id)
+                SELECT {colunas}, ?
+                FROM {tabela}
+                WHERE user_id = 0
+            """, [(user_id,) for user_id in pendentes])
+            linhas += max(cursor.rowcount, 0)
+
+    if marcar:
+        marcar_provisionados(cursor, user_ids)
+    return linhas
+
+
+def marcar_provisionados(cursor, user_ids):
+    """Grava a marca em usuarios_provisionados (usuários já marcados ficam como estão; não faz commit)."""
+    agora = datetime.now().isoformat(timespec='seconds')
+    cursor.executemany("""
+        INSERT INTO usuarios_provisionados (user_id, data_provisionamento) VALUES (?, ?)
+        ON CONFLICT (user_id) DO NOTHING
+    """, [(user_id, agora) for user_id in user_ids])
+
+
+def garantir_provisionado(cursor, user_id):
+    """
+    Caminho do render: consulta a marca e, se faltar, materializa o usuário na hora (não faz commit).
+
+    Returns:
+        bool: True se foram criadas linhas agora
+    """
+    marcado = usuario_provisionado(cursor, user_id)
+    if marcado:
+        return False
+    # Sem a tabela de marcas (migração pendente) a cópia continua, só não é marcada
+    if not materializar_usuarios(cursor, [user_id], marcar=marcado is not None):
+        return False
+    with _stats_lock:
+        _ESTATISTICAS['materializados_render'] += 1
+    return True
+
+
+def limpar_marcas(cursor):
+    """Remove todas as marcas (usado quando as tabelas de formulário são recriadas)."""
+    cursor.execute("DELETE FROM usuarios_provisionados")
+
+
+def ler_usuarios(linhas):
+    """
+    Interpreta usuários no formato do create_forms.py (texto separado por TAB, com cabeçalho).
+
+    Colunas: nome, email, senha, perfil (obrigatórias); user_id, empresa, idioma (opcionais).
+
+    Args:
+        linhas (iterable[str]): Linhas do arquivo, cabeçalho incluso
+
+    Returns:
+        list[dict]: Usuários lidos (linhas sem as colunas obrigatórias geram aviso e são ignoradas)
+    """
+    usuarios = []
+    for numero, linha in enumerate(csv.DictReader(linhas, delimiter='\t', quoting=csv.QUOTE_NONE), 2):
+        registro = {c: (linha.get(c) or '').strip() for c in COLUNAS_ARQUIVO}
+        faltando = [c for c in _OBRIGATORIAS if not registro[c]]
+        if faltando:
+            print(f"⚠️ AVISO: linha {numero} ignorada - faltam {', '.join(faltando)}")
+            continue
+        usuarios.append(registro)
+    return usuarios
+
+
+def ler_arquivo_usuarios(caminho, encoding='cp1252'):
+    """Lê o arquivo de usuários do disco (ver ler_usuarios)."""
+    with open(caminho, encoding=encoding, newline='') as arquivo:
+        return ler_usuarios(arquivo)
+
+
+def _inserir_contas(cursor, usuarios):
+    """Insere as contas novas (e-mail ainda não cadastrado) e devolve [(user_id, inserido)]."""
+    emails = [u['email'].lower() for u in usuarios]
+    placeholders = ','.join(['?'] * len(emails))
+    cursor.execute(
+        f"SELECT LOWER(email), user_id FROM usuarios WHERE LOWER(email) IN ({placeholders})", emails
+    )
+    existentes = dict(cursor.fetchall())
+    cursor.execute("SELECT COALESCE(MAX(user_id), 0) FROM usuarios")
+    proximo = cursor.fetchone()[0] + 1
+
+    novos = []
+    resultado = []
+    for usuario in usuarios:
+        email = usuario['email'].lower()
+        if email in existentes:
+            resultado.append((existentes[email], False))
+            continue
+        user_id = int(usuario['user_id']) if usuario['user_id'] else proximo
+        proximo = max(proximo, user_id + 1)
+        existentes[email] = user_id
+        novos.append((
+            user_id, usuario['nome'], usuario['email'], usuario['senha'], usuario['perfil'],
+            usuario['empresa'] or None, usuario['idioma'] or 'pt',
+        ))
+        resultado.append((user_id, True))
+
+    cursor.executemany("""
+        INSERT INTO usuarios (user_id, nome, email, senha, perfil, empresa, idioma)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, novos)
+    return resultado
+
+
+def provisionar(usuarios=None, lote=None, dry_run=False, progresso=None):
+    """
+    Cria as contas e materializa as linhas dos usuários em transações de 'lote' usuários.
+
+    Args:
+        usuarios (list[dict], optional): Contas a criar (ver ler_arquivo_usuarios).
+            None = materializa os usuários já cadastrados que ainda não foram provisionados
+        lote (int, optional): Usuários por transação. Padrão: config.PROVISIONAMENTO_LOTE
+        dry_run (bool): Se True, só conta o que seria feito
+        progresso (callable, optional): Chamado após cada lote com o relatório parcial
+
+    Returns:
+        dict: usuarios, contas_criadas, ja_existentes, linhas, lotes, segundos, linhas_por_segundo
+    """
+    lote = max(lote or PROVISIONAMENTO_LOTE, 1)
+    inicio = time.perf_counter()
+    relatorio = {'usuarios': 0, 'contas_criadas': 0, 'ja_existentes': 0, 'linhas': 0,
+                 'lotes': 0, 'segundos': 0.0, 'linhas_por_segundo': 0.0, 'dry_run': dry_run}
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        if usuarios is None:
+            cursor.execute("""
+                SELECT user_id, empresa FROM usuarios
+                WHERE user_id NOT IN (SELECT user_id FROM usuarios_provisionados)
+                ORDER BY user_id
+            """)
+            itens = cursor.fetchall()
+        else:
+            itens = list(usuarios)
+        # Empresas com shard (banco/shards.py): as linhas vão para o arquivo da empresa
+        arquivos = {empresa: arquivo for empresa, arquivo, _ in listar_shards()} if shards_ativos() else {}
+
+        if dry_run:
+            relatorio['usuarios'] = len(itens)
+            if not modo_normalizado():
+                linhas_template = sum(len(obter_template(cursor, t)['linhas']) for t in TABELAS_FORMULARIO)
+                relatorio['linhas'] = len(itens) * linhas_template
+            return relatorio
+
+        for posicao in range(0, len(itens), lote):
+            bloco = itens[posicao:posicao + lote]
+
+            def gravar_bloco(cur):
+                if usuarios is None:
+                    ids, empresas, criadas = [u for u, _ in bloco], [e for _, e in bloco], 0
+                else:
+                    contas = _inserir_contas(cur, bloco)
+                    ids = [user_id for user_id, _ in contas]
+                    empresas = [u['empresa'] for u in bloco]
+                    criadas = sum(1 for _, inserido in contas if inserido)
+                por_shard = {}
+                principal = []
+                for user_id, empresa in zip(ids, empresas):
+                    if empresa in arquivos:
+                        por_shard.setdefault(arquivos[empresa], []).append(user_id)
+                    else:
+                        principal.append(user_id)
+                return ids, criadas, materializar_usuarios(cur, principal), por_shard
+
+            ids, criadas, linhas, por_shard = transacao_com_retentativa(conn, 'provisionamento.lote', gravar_bloco)
+            for arquivo, ids_shard in por_shard.items():
+                conn_shard = get_connection(arquivo)
+                try:
+                    linhas += transacao_com_retentativa(
+                        conn_shard, 'provisionamento.lote_shard', materializar_usuarios, ids_shard)
+                finally:
+                    conn_shard.close()
+                # A lista de --existentes sai do banco principal: a marca vai para ele também,
+                # depois do commit no shard (se o shard falhar, o usuário volta na próxima execução)
+                transacao_com_retentativa(conn, 'provisionamento.marcas_shard', marcar_provisionados, ids_shard)
+            relatorio['usuarios'] += len(ids)
+            relatorio['contas_criadas'] += criadas
+            relatorio['ja_existentes'] += len(bloco) - criadas if usuarios is not None else 0
+            relatorio['linhas'] += linhas
+            relatorio['lotes'] += 1
+            relatorio['segundos'] = round(time.perf_counter() - inicio, 3)
+            relatorio['linhas_por_segundo'] = round(relatorio['linhas'] / relatorio['segundos'], 1) if relatorio['segundos'] else 0.0
+            if progresso:
+                progresso(dict(relatorio))
+    finally:
+        conn.close()
+
+    # Contas novas entram nas listas de usuarios em cache
+    if relatorio['contas_criadas']:
+        invalidar_usuario()
+    with _stats_lock:
+        _ESTATISTICAS['materializados_lote'] += relatorio['usuarios']
+        _ESTATISTICAS['linhas_lote'] += relatorio['linhas']
+    return relatorio
+
+
+def get_estatisticas():
+    """Retorna os contadores de provisionamento (render e lote)."""
+    with _stats_lock:
+        return dict(_ESTATISTICAS)
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+
+    def _valor(opcao, padrao):
+        return argumentos[argumentos.index(opcao) + 1] if opcao in argumentos else padrao
+
+    tamanho_lote = int(_valor('--lote', PROVISIONAMENTO_LOTE))
+    simulacao = '--dry-run' in argumentos
+
+    def _mostrar(parcial):
+        print(f"  lote {parcial['lotes']}: {parcial['usuarios']} usuários, {parcial['linhas']} linhas, "
+              f"{parcial['linhas_por_segundo']} linhas/s")
+
+    if '--existentes' in argumentos:
+        lista = None
+    else:
+        arquivos = [a for a in argumentos if not a.startswith('--')
+                    and a not in (_valor('--lote', None), _valor('--encoding', None))]
+        if not arquivos:
+            print("Uso: python -m banco.provisionamento usuarios.txt [--lote N] [--dry-run] [--encoding cp1252]")
+            sys.exit(1)
+        lista = ler_arquivo_usuarios(arquivos[0], encoding=_valor('--encoding', 'cp1252'))
+
+    print(provisionar(lista, lote=tamanho_lote, dry_run=simulacao, progresso=_mostrar))
@@ -0,0 +1,165 @@
+# banco/retentativa.py
+# Política única de retentativa para contenção do SQLite (backoff exponencial + jitter + prazo)
+# Data: 18/10/2026 - Hora: 17:00
+
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from config import DB_RETRY_TENTATIVAS, DB_RETRY_BASE_MS, DB_RETRY_MAX_MS, DB_RETRY_PRAZO_MS
+from banco.gravador import executar_escrita
+
+# Mesmo com busy_timeout o SQLite devolve SQLITE_BUSY na hora em alguns casos
+# (ex.: transação de leitura que tenta virar escrita em WAL). A operação
+# inteira (transação completa) é repetida, por isso ela deve fazer rollback
+# ao falhar, como já fazem as funções de gravação do projeto.
+_CODIGOS_RETENTAVEIS = {5, 6}  # SQLITE_BUSY, SQLITE_LOCKED (e seus códigos estendidos)
+_MENSAGENS_RETENTAVEIS = (
+    'database is locked',
+    'database table is locked',
+    'database schema is locked',
+    'database is busy',
+)
+# PostgreSQL (banco/backends.py): serialization_failure, deadlock_detected, lock_not_available
+_SQLSTATES_RETENTAVEIS = {'40001', '40P01', '55P03'}
+
+_stats_lock = threading.Lock()
+_ESTATISTICAS = {}  # local -> contadores
+
+
+def eh_retentavel(erro):
+    """
+    Classifica se o erro é contenção transitória (vale tentar de novo).
+
+    Args:
+        erro (Exception): Exceção capturada
+
+    Returns:
+        bool: True para SQLITE_BUSY/SQLITE_LOCKED (ou os SQLSTATE equivalentes do PostgreSQL)
+    """
+    sqlstate = getattr(erro, 'sqlstate', None) or getattr(erro, 'pgcode', None)  # psycopg / psycopg2
+    if sqlstate is not None:
+        return sqlstate in _SQLSTATES_RETENTAVEIS
+    if not isinstance(erro, sqlite3.OperationalError):
+        return False
+    codigo = getattr(erro, 'sqlite_errorcode', None)  # Python 3.11+
+    if codigo is not None and (codigo & 0xFF) in _CODIGOS_RETENTAVEIS:
+        return True
+    mensagem = str(erro).lower()
+    return any(texto in mensagem for texto in _MENSAGENS_RETENTAVEIS)
+
+
+def _contadores(local):
+    return _ESTATISTICAS.setdefault(local, {
+        'chamadas': 0,          # execuções da operação
+        'sucessos': 0,          # terminaram bem (com ou sem retentativa)
+        'retentativas': 0,      # novas tentativas após erro retentável
+        'desistencias': 0,      # esgotaram tentativas ou prazo
+        'nao_retentaveis': 0,   # falharam com erro que não é de contenção
+        'tempo_espera': 0.0,    # segundos dormindo entre tentativas
+    })
+
+
+def calcular_espera(tentativa, base_ms=None, max_ms=None):
+    """Backoff exponencial com jitter total: sorteio entre 0 e min(max, base * 2^tentativa), em segundos."""
+    base_ms = DB_RETRY_BASE_MS if base_ms is None else base_ms
+    max_ms = DB_RETRY_MAX_MS if max_ms is None else max_ms
+    return random.uniform(0, min(max_ms, base_ms * (2 ** tentativa))) / 1000
+
+
+def executar_com_retentativa(operacao, local, *args, tentativas=None, prazo_ms=None, **kwargs):
+    """
+    Executa a operação repetindo-a em erros de contenção.
+
+    Args:
+        operacao (callable): Função que executa a transação completa
+        local (str): Identificação do ponto de chamada (ex.: 'main.trocar_senha')
+        tentativas (int, optional): Máximo de tentativas. Padrão: config.DB_RETRY_TENTATIVAS
+        prazo_ms (int, optional): Prazo total. Padrão: config.DB_RETRY_PRAZO_MS
+
+    Returns:
+        O retorno da operação
+
+    Raises:
+        A última exceção quando não é retentável ou quando tentativas/prazo acabam
+    """
+    tentativas = DB_RETRY_TENTATIVAS if tentativas is None else tentativas
+    prazo = time.monotonic() + (DB_RETRY_PRAZO_MS if prazo_ms is None else prazo_ms) / 1000
+
+    with _stats_lock:
+        _contadores(local)['chamadas'] += 1
+
+    tentativa = 0
+    while True:
+        try:
+            resultado = operacao(*args, **kwargs)
+        except Exception as e:
+            if not eh_retentavel(e):
+                with _stats_lock:
+                    _contadores(local)['nao_retentaveis'] += 1
+                raise
+            espera = calcular_espera(tentativa)
+            tentativa += 1
+            if tentativa >= tentativas or time.monotonic() + espera > prazo:
+                with _stats_lock:
+                    _contadores(local)['desistencias'] += 1
+                print(f"⚠️ AVISO: {local} desistiu após {tentativa} tentativa(s): {e}")
+                raise
+            with _stats_lock:
+                contadores = _contadores(local)
+                contadores['retentativas'] += 1
+                contadores['tempo_espera'] += espera
+            time.sleep(espera)
+            continue
+
+        with _stats_lock:
+            _contadores(local)['sucessos'] += 1
+        return resultado
+
+
+def transacao_com_retentativa(conn, local, funcao, *args, **kwargs):
+    """
+    Executa funcao(cursor, ...) seguida de commit como uma transação repetível.
+
+    Em caso de erro faz rollback antes de decidir se tenta de novo. Com o
+    gravador único ligado (banco/gravador.py) a transação é executada pela
+    thread do gravador, junto com as gravações das outras páginas.
+
+    Args:
+        conn: Conexão com o banco de dados
+        local (str): Identificação do ponto de chamada
+        funcao (callable): Recebe o cursor e executa os comandos (sem commit)
+
+    Returns:
+        O retorno de funcao
+    """
+    def _transacao():
+        return executar_escrita(conn, funcao, *args, **kwargs)
+    return executar_com_retentativa(_transacao, local)
+
+
+def com_retentativa(local, tentativas=None, prazo_ms=None):
+    """
+    Decorador com a mesma política de executar_com_retentativa.
+
+    Uso:
+        @com_retentativa('texto_manager.set_user_language')
+        def gravar(...):
+            ...
+    """
+    def decorador(funcao):
+        @wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            return executar_com_retentativa(
+                funcao, local, *args, tentativas=tentativas, prazo_ms=prazo_ms, **kwargs
+            )
+        return envoltorio
+    return decorador
+
+
+def get_estatisticas():
+    """Retorna os contadores de retentativa por ponto de chamada."""
+    with _stats_lock:
+        return {local: dict(contadores) for local, contadores in _ESTATISTICAS.items()}
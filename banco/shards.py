@@ -0,0 +1,426 @@
+# banco/shards.py
+# Shards por empresa: um arquivo SQLite por empresa, banco principal como diretório (login, usuarios, textos)
+# Data: 19/10/2026 - Hora: 00:30
+# comando: uv run python -m banco.shards --listar
+#          uv run python -m banco.shards --criar "Empresa X" [--dry-run]
+#          uv run python -m banco.shards --sincronizar-templates [--alterados]
+
+import re
+import sys
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from config import DB_SHARDING, SHARD_DIR, SHARD_LEITORES
+from banco.backends import erros_banco, get_backend
+from banco.conexao import get_connection
+
+# Com DB_SHARDING=1 as linhas de formulário e o log de acessos dos usuários
+# de uma empresa com shard (tabela diretorio_shards, migração 6) ficam em
+# SHARD_DIR/empresa_<nome>.db, e um workshop grande de uma empresa disputa só
+# o lock desse arquivo. O banco principal continua sendo o diretório: login,
+# usuarios, textos e as empresas sem shard. As conexões de shard anexam o
+# principal como 'diretorio', então consultas que juntam usuarios continuam
+# funcionando sem alteração. Páginas de administração leem todos os bancos
+# em paralelo com ler_em_todos() e juntam os resultados. Manutenção (backup,
+# otimização, arquivamento do log, poda do CDC) e migrações percorrem todos os
+# arquivos do diretório (arquivos_shards()). Cada shard guarda em
+# template_origem (migração 8) o carimbo template_versao do principal que
+# copiou; quando o do principal muda, sincronizar_templates(somente_alterados=True)
+# copia o template de novo.
+TABELAS_BASE = ('forms_tab', 'forms_resultados', 'forms_insumos', 'log_acessos')
+# Tabelas com linhas por usuário movidas para o shard (as ausentes no principal são ignoradas)
+TABELAS_USUARIO = ('forms_tab', 'forms_resultados', 'forms_tab_valores', 'forms_resultados_valores',
+                   'log_acessos', 'usuarios_provisionados')
+TABELAS_TEMPLATE = ('forms_tab', 'forms_resultados')  # linhas user_id = 0 copiadas para cada shard
+# Linhas copiadas pela sincronização (forms_insumos é todo template)
+_COPIA_TEMPLATE = (('forms_tab', 'user_id = 0'), ('forms_resultados', 'user_id = 0'), ('forms_insumos', '1'))
+
+_lock = threading.Lock()
+_destino_usuario = {}  # user_id -> arquivo do shard (só usuários de empresas com shard)
+
+_ESTATISTICAS = {
+    'roteamentos': 0,           # consultas de destino por usuário
+    'roteados_shard': 0,        # usuários encaminhados para um shard
+    'leituras_paralelas': 0,    # chamadas de ler_em_todos
+    'bancos_lidos': 0,          # bancos consultados pelas leituras paralelas
+    'falhas_leitura': 0,        # bancos que falharam em uma leitura paralela
+    'tempo_leitura': 0.0,       # segundos nas leituras paralelas
+}
+
+
+def ativo():
+    """Indica se o roteamento por empresa está ligado (config.DB_SHARDING, só no SQLite)."""
+    return DB_SHARDING and get_backend().nome == 'sqlite'
+
+
+def arquivo_da_empresa(empresa):
+    """Caminho do shard de uma empresa (nome sem acentos, minúsculo, com '_')."""
+    nome = unicodedata.normalize('NFKD', empresa).encode('ascii', 'ignore').decode().lower()
+    nome = re.sub(r'[^a-z0-9]+', '_', nome).strip('_') or 'empresa'
+    return SHARD_DIR / f"empresa_{nome}.db"
+
+
+def invalidar_diretorio():
+    """Descarta o mapa usuário -> shard deste processo (após criar shards)."""
+    with _lock:
+        _destino_usuario.clear()
+
+
+def banco_do_usuario(user_id):
+    """
+    Banco onde estão os dados do usuário.
+
+    Usuários de empresas com shard ficam em cache; os demais são conferidos
+    a cada chamada (busca pela chave), para que um shard criado em outro
+    processo passe a valer sem reinício.
+
+    Returns:
+        str | None: Caminho do shard, ou None para o banco principal
+    """
+    if not ativo() or user_id is None:
+        return None
+    with _lock:
+        _ESTATISTICAS['roteamentos'] += 1
+        destino = _destino_usuario.get(user_id)
+    if destino is not None:
+        return destino
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT d.arquivo
+            FROM usuarios u
+            JOIN diretorio_shards d ON d.empresa = u.empresa
+            WHERE u.user_id = ?
+        """, (user_id,))
+        linha = cursor.fetchone()
+    except erros_banco():
+        linha = None  # migração 6 pendente: tudo no banco principal
+    finally:
+        conn.close()
+
+    if linha is None:
+        return None
+    with _lock:
+        _destino_usuario[user_id] = linha[0]
+        _ESTATISTICAS['roteados_shard'] += 1
+    return linha[0]
+
+
+def conexao_do_usuario(user_id, leitura=False):
+    """Conexão do pool para o banco do usuário (shard da empresa ou principal; leitura: ver get_connection)."""
+    return get_connection(banco_do_usuario(user_id), leitura=leitura)
+
+
+def destinos():
+    """Bancos com dados de usuários: None (principal) seguido dos shards do diretório."""
+    if not ativo():
+        return [None]
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT arquivo FROM diretorio_shards ORDER BY empresa")
+        return [None] + [linha[0] for linha in cursor.fetchall()]
+    except erros_banco():
+        return [None]
+    finally:
+        conn.close()
+
+
+def _ler_destino(destino, funcao, args, kwargs):
+    conn = get_connection(destino)
+    try:
+        return funcao(conn, *args, **kwargs)
+    finally:
+        conn.close()
+
+
+def ler_em_todos(funcao, *args, **kwargs):
+    """
+    Executa funcao(conn, ...) em cada banco (principal + shards) em paralelo.
+
+    Um banco que falha gera aviso e fica fora do resultado: a página de
+    administração mostra o que foi possível ler.
+
+    Args:
+        funcao (callable): Recebe a conexão do banco e devolve o resultado parcial
+
+    Returns:
+        list[tuple]: (destino, resultado) na ordem de destinos(); destino None = principal
+    """
+    alvos = destinos()
+    inicio = time.perf_counter()
+    resultados = []
+    falhas = 0
+    if len(alvos) == 1:
+        resultados.append((alvos[0], _ler_destino(alvos[0], funcao, args, kwargs)))
+    else:
+        with ThreadPoolExecutor(max_workers=min(SHARD_LEITORES, len(alvos)), thread_name_prefix='shard') as executor:
+            futuros = [(destino, executor.submit(_ler_destino, destino, funcao, args, kwargs)) for destino in alvos]
+            for destino, futuro in futuros:
+                try:
+                    resultados.append((destino, futuro.result()))
+                except Exception as e:
+                    falhas += 1
+                    print(f"⚠️ AVISO: leitura do banco {destino or 'principal'} falhou: {e}")
+    with _lock:
+        _ESTATISTICAS['leituras_paralelas'] += 1
+        _ESTATISTICAS['bancos_lidos'] += len(alvos)
+        _ESTATISTICAS['falhas_leitura'] += falhas
+        _ESTATISTICAS['tempo_leitura'] += time.perf_counter() - inicio
+    return resultados
+
+
+def _ddl_sem_chave_estrangeira(conn, tabela):
+    """DDL da tabela no banco principal, sem FOREIGN KEY (usuarios fica no diretório)."""
+    linha = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (tabela,)
+    ).fetchone()
+    if linha is None:
+        return None
+    sql = re.sub(r'^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?', 'CREATE TABLE IF NOT EXISTS ', linha[0],
+                 flags=re.IGNORECASE)
+    return re.sub(r',\s*FOREIGN\s+KEY[^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)', '', sql, flags=re.IGNORECASE)
+
+
+def _tabelas_existentes(conn, esquema='main'):
+    return {linha[0] for linha in conn.execute(f"SELECT name FROM {esquema}.sqlite_master WHERE type = 'table'")}
+
+
+def _colunas(conn, tabela):
+    return [linha[1] for linha in conn.execute(f"PRAGMA main.table_info({tabela})")]
+
+
+def _versoes_template(conn, tabela_carimbo):
+    """Carimbos {tabela: versao} de main.template_versao ou shard.template_origem."""
+    return dict(conn.execute(f"SELECT tabela, versao FROM {tabela_carimbo}").fetchall())
+
+
+def _registrar_origem(conn):
+    """Grava no shard anexado os carimbos do principal que acabaram de ser copiados (sem commit)."""
+    conn.execute("DELETE FROM shard.template_origem")
+    conn.execute("INSERT INTO shard.template_origem (tabela, versao) SELECT tabela, versao FROM main.template_versao")
+
+
+def criar_shard(empresa, dry_run=False):
+    """
+    Cria o shard da empresa e move para ele as linhas dos usuários dela.
+
+    O shard recebe o template (user_id = 0), forms_insumos e as linhas por
+    usuário; a cópia, a remoção no principal e o registro no diretório são
+    uma única transação. Meses do log já arquivados (banco/arquivo_log.py)
+    continuam nos arquivos mensais do principal.
+
+    Args:
+        empresa (str): Valor de usuarios.empresa
+        dry_run (bool): Se True, só informa quantas linhas seriam movidas
+
+    Returns:
+        dict: arquivo, usuarios e linhas movidas por tabela
+    """
+    from banco.migracoes import aplicar_migracoes  # migracoes -> provisionamento -> shards
+
+    if get_backend().nome != 'sqlite':
+        raise RuntimeError("shards por empresa só se aplicam ao SQLite")
+    if not SHARD_DIR.exists():
+        raise FileNotFoundError(f"pasta de shards '{SHARD_DIR}' não existe")
+
+    arquivo = arquivo_da_empresa(empresa)
+    # Conexão do pool sem transação aberta (ATTACH exige autocommit)
+    principal = get_connection()
+    try:
+        if principal.execute("SELECT 1 FROM diretorio_shards WHERE empresa = ?", (empresa,)).fetchone():
+            raise ValueError(f"empresa '{empresa}' já tem shard")
+        user_ids = [linha[0] for linha in principal.execute(
+            "SELECT user_id FROM usuarios WHERE empresa = ? AND user_id <> 0", (empresa,)
+        )]
+        if not user_ids:
+            raise ValueError(f"nenhum usuário com empresa '{empresa}'")
+        existentes = _tabelas_existentes(principal)
+        movidas = [t for t in TABELAS_USUARIO if t in existentes]
+
+        principal.execute("CREATE TEMP TABLE IF NOT EXISTS shard_usuarios (user_id INTEGER PRIMARY KEY)")
+        principal.execute("DELETE FROM temp.shard_usuarios")
+        principal.executemany("INSERT INTO temp.shard_usuarios VALUES (?)", [(u,) for u in user_ids])
+        principal.commit()
+        filtro = "user_id IN (SELECT user_id FROM temp.shard_usuarios)"
+
+        relatorio = {'empresa': empresa, 'arquivo': str(arquivo), 'usuarios': len(user_ids),
+                     'linhas': {}, 'dry_run': dry_run}
+        if dry_run:
+            for tabela in movidas:
+                relatorio['linhas'][tabela] = principal.execute(
+                    f"SELECT COUNT(*) FROM {tabela} WHERE {filtro}").fetchone()[0]
+            return relatorio
+        if arquivo.exists():
+            raise FileExistsError(f"'{arquivo}' já existe e não está no diretório")
+
+        # 1) Estrutura: tabelas base com o DDL do principal + migrações (índices, gatilhos, _valores...)
+        shard = get_connection(str(arquivo))  # o backend abre o arquivo novo já em WAL
+        try:
+            for tabela in TABELAS_BASE:
+                ddl = _ddl_sem_chave_estrangeira(principal, tabela)
+                if ddl:
+                    shard.execute(ddl)
+            shard.commit()
+            aplicar_migracoes(conn=shard)
+        finally:
+            shard.close()
+
+        # 2) Dados: cópia + remoção no principal + diretório em uma transação
+        principal.execute("ATTACH DATABASE ? AS shard", (str(arquivo),))
+        try:
+            no_shard = _tabelas_existentes(principal, 'shard')
+            principal.execute("BEGIN IMMEDIATE")
+            for tabela in TABELAS_TEMPLATE:
+                colunas = ', '.join(_colunas(principal, tabela))
+                principal.execute(f"INSERT INTO shard.{tabela} ({colunas}) SELECT {colunas} FROM main.{tabela} WHERE user_id = 0")
+            if 'forms_insumos' in existentes:
+                colunas = ', '.join(_colunas(principal, 'forms_insumos'))
+                principal.execute(f"INSERT INTO shard.forms_insumos ({colunas}) SELECT {colunas} FROM main.forms_insumos")
+            _registrar_origem(principal)
+            for tabela in movidas:
+                if tabela not in no_shard:
+                    continue
+                colunas = ', '.join(_colunas(principal, tabela))
+                principal.execute(f"INSERT INTO shard.{tabela} ({colunas}) SELECT {colunas} FROM main.{tabela} WHERE {filtro}")
+                relatorio['linhas'][tabela] = principal.execute(
+                    f"DELETE FROM main.{tabela} WHERE {filtro}").rowcount
+            principal.execute(
+                "INSERT INTO main.diretorio_shards (empresa, arquivo, data_criacao) VALUES (?, ?, ?)",
+                (empresa, str(arquivo), datetime.now().isoformat(timespec='seconds'))
+            )
+            principal.commit()
+        except Exception:
+            principal.rollback()
+            raise
+        finally:
+            principal.execute("DETACH DATABASE shard")
+    finally:
+        principal.execute("DROP TABLE IF EXISTS temp.shard_usuarios")
+        principal.close()
+
+    invalidar_diretorio()
+    return relatorio
+
+
+def sincronizar_templates(somente_alterados=False):
+    """
+    Copia o template (user_id = 0) e forms_insumos do principal para os shards.
+
+    Alterações de layout feitas pelo create_forms.py/CRUD valem para o banco
+    principal. Com somente_alterados=True (inicialização do app e agendador
+    de manutenção) só recebem a cópia os shards cujo template_origem difere
+    do template_versao do principal. Os gatilhos do shard renovam o carimbo
+    dele e o cache de templates de cada processo recarrega sozinho. Um shard
+    que falha não impede os demais; o erro é levantado no fim.
+
+    Args:
+        somente_alterados (bool): Pula os shards já sincronizados com o carimbo atual
+
+    Returns:
+        dict: {arquivo: linhas copiadas} dos shards sincronizados
+    """
+    if get_backend().nome != 'sqlite':
+        raise RuntimeError("shards por empresa só se aplicam ao SQLite")
+    arquivos = arquivos_shards()
+    copiadas, falhas = {}, {}
+    if not arquivos:
+        return copiadas
+    # Conexão do pool sem transação aberta (ATTACH exige autocommit)
+    principal = get_connection()
+    try:
+        atuais = _versoes_template(principal, 'main.template_versao')
+        for arquivo in arquivos:
+            principal.execute("ATTACH DATABASE ? AS shard", (arquivo,))
+            try:
+                if somente_alterados and _versoes_template(principal, 'shard.template_origem') == atuais:
+                    continue
+                principal.execute("BEGIN IMMEDIATE")
+                total = 0
+                for tabela, condicao in _COPIA_TEMPLATE:
+                    # Sem ID_element: os ids do principal podem colidir com linhas criadas no shard
+                    colunas = ', '.join(c for c in _colunas(principal, tabela) if c != 'ID_element')
+                    principal.execute(f"DELETE FROM shard.{tabela} WHERE {condicao}")
+                    total += principal.execute(
+                        f"INSERT INTO shard.{tabela} ({colunas}) SELECT {colunas} FROM main.{tabela} WHERE {condicao}"
+                    ).rowcount
+                _registrar_origem(principal)
+                principal.commit()
+                copiadas[arquivo] = total
+            except Exception as e:
+                principal.rollback()
+                falhas[arquivo] = str(e)
+                print(f"⚠️ AVISO: template do shard {arquivo} não sincronizado: {e}")
+            finally:
+                principal.execute("DETACH DATABASE shard")
+    finally:
+        principal.close()
+    if falhas:
+        raise RuntimeError(f"{len(falhas)} shard(s) sem sincronizar: {falhas}")
+    return copiadas
+
+
+def listar_shards():
+    """Empresas com shard: [(empresa, arquivo, data_criacao)]."""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT empresa, arquivo, data_criacao FROM diretorio_shards ORDER BY empresa")
+        return cursor.fetchall()
+    except erros_banco():
+        return []
+    finally:
+        conn.close()
+
+
+def arquivos_shards():
+    """
+    Arquivos de shard do diretório, para manutenção e migrações (mesmo com DB_SHARDING desligado).
+
+    Um arquivo registrado que não está no disco gera aviso e fica de fora:
+    abrir uma conexão com ele criaria um banco vazio no lugar.
+
+    Returns:
+        list[str]: Caminhos dos shards existentes, na ordem de listar_shards()
+    """
+    if get_backend().nome != 'sqlite':
+        return []
+    arquivos = []
+    for empresa, arquivo, _ in listar_shards():
+        if Path(arquivo).exists():
+            arquivos.append(arquivo)
+        else:
+            print(f"⚠️ AVISO: shard da empresa '{empresa}' não encontrado: {arquivo}")
+    return arquivos
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores de roteamento e das leituras paralelas.
+
+    Returns:
+        dict: roteamentos, roteados_shard, leituras_paralelas, bancos_lidos, falhas_leitura,
+              tempo_leitura, usuarios_em_cache e habilitado
+    """
+    with _lock:
+        stats = dict(_ESTATISTICAS)
+        stats['usuarios_em_cache'] = len(_destino_usuario)
+    stats['habilitado'] = ativo()
+    return stats
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    if '--criar' in argumentos:
+        print(criar_shard(argumentos[argumentos.index('--criar') + 1], dry_run='--dry-run' in argumentos))
+    elif '--sincronizar-templates' in argumentos:
+        print(sincronizar_templates(somente_alterados='--alterados' in argumentos))
+    else:
+        for empresa, arquivo, data_criacao in listar_shards():
+            print(f"{empresa}\t{arquivo}\t{data_criacao}")
@@ -0,0 +1,66 @@
+# banco/snapshot.py
+# Leitura em snapshot consistente (transação de leitura em conexão WAL somente leitura)
+# Data: 18/10/2026 - Hora: 16:00
+
+import time
+from pathlib import Path
+from contextlib import contextmanager
+
+from config import DB_SHARDING
+from banco.backends import get_backend
+from banco.instrumentacao import ConexaoInstrumentada
+
+# Em modo WAL um leitor com transação aberta enxerga sempre a mesma versão
+# do banco, sem bloquear os gravadores e sem ser bloqueado por eles. A
+# conexão é separada do pool (banco/conexao.py) porque o pool devolve a mesma
+# conexão da thread, que a página usa também para gravar.
+_ESTATISTICAS = {
+    'snapshots': 0,         # snapshots abertos
+    'tempo_total': 0.0,     # segundos com snapshot aberto
+    'maior_duracao': 0.0,   # snapshot mais longo (s)
+}
+
+
+@contextmanager
+def snapshot_leitura(db_path=None):
+    """
+    Abre uma transação de leitura e fixa o snapshot do banco até o fim do bloco.
+
+    Uso:
+        with snapshot_leitura() as conn:
+            cursor = conn.cursor()
+            ...  # todas as consultas veem o mesmo estado do banco
+
+    Args:
+        db_path (Path|str, optional): Caminho do banco. Padrão: o do backend configurado
+
+    Yields:
+        sqlite3.Connection: Conexão somente leitura com o snapshot aberto
+    """
+    backend = get_backend()
+    principal = str(backend.destino_padrao())
+    destino = str(db_path or principal)
+    conn = backend.abrir_leitor(destino, ConexaoInstrumentada)
+    inicio = time.perf_counter()
+    try:
+        if DB_SHARDING and backend.nome == 'sqlite' and destino != principal:
+            # Shard de empresa: usuarios vem do principal; a chave separa o cache de templates
+            conn.execute("ATTACH DATABASE ? AS diretorio", (f"{Path(principal).resolve().as_uri()}?mode=ro",))
+            conn._chave_pool = destino
+        # SQLite: transação WAL fixada na primeira leitura; PostgreSQL: REPEATABLE READ
+        backend.iniciar_snapshot(conn)
+        yield conn
+    finally:
+        try:
+            conn.rollback()
+        finally:
+            conn.close()
+            duracao = time.perf_counter() - inicio
+            _ESTATISTICAS['snapshots'] += 1
+            _ESTATISTICAS['tempo_total'] += duracao
+            _ESTATISTICAS['maior_duracao'] = max(_ESTATISTICAS['maior_duracao'], duracao)
+
+
+def get_estatisticas():
+    """Retorna os contadores dos snapshots de leitura."""
+    return dict(_ESTATISTICAS)
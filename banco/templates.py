@@ -0,0 +1,249 @@
+# banco/templates.py
+# Cache por processo das linhas de template (user_id = 0) e de forms_insumos, com carimbo de versão
+# Data: 18/10/2026 - Hora: 20:00
+
+import threading
+import time
+
+from config import TEMPLATE_VERIFICACAO_MS
+from banco.backends import erros_banco, get_backend
+
+# O layout (type_element, math_element, msg_element, select_element, e_row,
+# e_col, col_len...) é igual para todos os usuários e só muda quando o admin
+# reimporta pelo create_forms.py ou edita no CRUD. Os gatilhos da migração 3
+# incrementam template_versao a cada alteração dessas linhas; o cache compara
+# o carimbo (no máximo uma vez a cada TEMPLATE_VERIFICACAO_MS) e só relê o
+# template quando ele mudou. Cada banco (principal ou shard de empresa,
+# banco/shards.py) tem seus próprios carimbos, então o cache é separado por banco.
+TABELAS_TEMPLATE = ('forms_tab', 'forms_resultados', 'forms_insumos')
+
+# forms_insumos é tabela de referência: todas as linhas fazem parte do template
+_CONSULTAS = {
+    'forms_tab': "SELECT * FROM forms_tab WHERE user_id = 0 ORDER BY ID_element",
+    'forms_resultados': "SELECT * FROM forms_resultados WHERE user_id = 0 ORDER BY ID_element",
+    'forms_insumos': "SELECT * FROM forms_insumos ORDER BY ID_element",
+}
+
+_cache_lock = threading.Lock()
+_cache = {}                 # (banco, tabela) -> template carregado
+_versoes = {}               # banco -> {tabela: carimbo lido por último}
+_ultima_verificacao = {}    # banco -> time.monotonic() da última leitura de template_versao
+_sem_carimbo_avisado = False
+
+_ESTATISTICAS = {
+    'acertos': 0,           # pedidos atendidos pelo cache
+    'carregamentos': 0,     # leituras completas do template
+    'verificacoes': 0,      # leituras de template_versao
+    'invalidacoes': 0,      # templates descartados (carimbo novo ou invalidar_templates)
+    'tempo_carga': 0.0,     # segundos gastos carregando templates
+}
+
+
+def _ler_versoes(cursor):
+    """Lê os carimbos de template_versao; None se a tabela não existe (migração 3 pendente)."""
+    global _sem_carimbo_avisado
+    try:
+        cursor.execute("SELECT tabela, versao FROM template_versao")
+        return dict(cursor.fetchall())
+    except erros_banco() as e:
+        if not _sem_carimbo_avisado:
+            print(f"⚠️ AVISO: template_versao indisponível ({e}). Cache de templates desativado.")
+            _sem_carimbo_avisado = True
+        return None
+
+
+def _banco(cursor):
+    """Identifica o banco do cursor (chave do pool de conexões); None = banco principal."""
+    chave = getattr(cursor.connection, '_chave_pool', None)
+    return None if chave == str(get_backend().destino_padrao()) else chave
+
+
+def _verificar_versoes(cursor, banco):
+    """Descarta os templates do banco cujo carimbo mudou. Retorna False se não há carimbo."""
+    agora = time.monotonic()
+    with _cache_lock:
+        if banco in _versoes and agora - _ultima_verificacao.get(banco, 0.0) < TEMPLATE_VERIFICACAO_MS / 1000:
+            return True
+
+    versoes = _ler_versoes(cursor)
+    with _cache_lock:
+        _ESTATISTICAS['verificacoes'] += 1
+        if versoes is None:
+            for tabela in TABELAS_TEMPLATE:
+                _cache.pop((banco, tabela), None)
+            _versoes.pop(banco, None)
+            return False
+        atuais = _versoes.setdefault(banco, {})
+        for tabela in TABELAS_TEMPLATE:
+            versao = versoes.get(tabela, 0)
+            template = _cache.get((banco, tabela))
+            if template is not None and template['versao'] != versao:
+                del _cache[(banco, tabela)]
+                _ESTATISTICAS['invalidacoes'] += 1
+            atuais[tabela] = versao
+        _ultima_verificacao[banco] = agora
+    return True
+
+
+def _carregar(cursor, tabela, versao):
+    inicio = time.perf_counter()
+    cursor.execute(_CONSULTAS[tabela])
+    linhas = cursor.fetchall()
+    colunas = [descricao[0] for descricao in cursor.description]
+    indices = {coluna: i for i, coluna in enumerate(colunas)}
+    posicao_nome = indices['name_element']
+
+    por_nome = {}
+    for linha in linhas:  # ORDER BY ID_element: em nomes duplicados prevalece a linha mais recente
+        if linha[posicao_nome]:
+            por_nome[linha[posicao_nome]] = linha
+
+    with _cache_lock:
+        _ESTATISTICAS['carregamentos'] += 1
+        _ESTATISTICAS['tempo_carga'] += time.perf_counter() - inicio
+    return {
+        'versao': versao,
+        'colunas': colunas,
+        'indices': indices,
+        'linhas': linhas,
+        'por_nome': por_nome,
+    }
+
+
+def obter_template(cursor, tabela):
+    """
+    Retorna o template da tabela, do cache quando o carimbo de versão não mudou.
+
+    Args:
+        cursor: Cursor do banco de dados
+        tabela (str): forms_tab, forms_resultados ou forms_insumos
+
+    Returns:
+        dict: versao, colunas, indices {coluna: posição}, linhas (tuplas, ordem de
+              ID_element) e por_nome {name_element: linha}
+    """
+    if tabela not in _CONSULTAS:
+        raise ValueError(f"Tabela sem template: {tabela}")
+
+    banco = _banco(cursor)
+    if _verificar_versoes(cursor, banco):
+        with _cache_lock:
+            template = _cache.get((banco, tabela))
+            if template is not None:
+                _ESTATISTICAS['acertos'] += 1
+                return template
+            versao = _versoes.get(banco, {}).get(tabela, 0)
+        template = _carregar(cursor, tabela, versao)
+        with _cache_lock:
+            # Só guarda se ninguém viu carimbo mais novo durante a carga
+            if _versoes.get(banco, {}).get(tabela, 0) == versao:
+                _cache[(banco, tabela)] = template
+        return template
+
+    # Sem carimbo não há como saber quando invalidar: lê sempre do banco
+    return _carregar(cursor, tabela, None)
+
+
+def filtrar_template(template, filtros=None, tipos=None, ordem='e_row, e_col'):
+    """
+    Seleciona e ordena as linhas do template em memória (equivalente ao WHERE/ORDER BY).
+
+    Args:
+        template (dict): Retorno de obter_template
+        filtros (dict, optional): Igualdades {coluna: valor}
+        tipos (list, optional): type_element aceitos
+        ordem (str): Colunas do ORDER BY, com ASC/DESC opcional (ex.: 'ID_element DESC')
+
+    Returns:
+        list[tuple]: Linhas completas do template
+    """
+    indices = template['indices']
+    condicoes = [(indices[coluna], valor) for coluna, valor in (filtros or {}).items()]
+    tipos = set(tipos) if tipos else None
+    posicao_tipo = indices['type_element']
+
+    linhas = [
+        linha for linha in template['linhas']
+        if all(linha[posicao] == valor for posicao, valor in condicoes)
+        and (tipos is None or linha[posicao_tipo] in tipos)
+    ]
+
+    # Ordenações estáveis da última coluna para a primeira; NULL primeiro, como no SQLite
+    for parte in reversed([p.split() for p in ordem.split(',') if p.strip()]):
+        posicao = indices[parte[0]]
+        decrescente = len(parte) > 1 and parte[1].upper() == 'DESC'
+        linhas.sort(key=lambda linha: (linha[posicao] is not None, linha[posicao]), reverse=decrescente)
+    return linhas
+
+
+def buscar_insumo(cursor, nome, coluna='math_element', padrao=None):
+    """
+    Busca uma coluna de forms_insumos pelo name_element, a partir do cache.
+
+    Returns:
+        Valor da coluna ou 'padrao' se o insumo não existe
+    """
+    template = obter_template(cursor, 'forms_insumos')
+    linha = template['por_nome'].get(nome)
+    return padrao if linha is None else linha[template['indices'][coluna]]
+
+
+def tipos_do_template(cursor, tabela='forms_tab'):
+    """
+    Função name_element -> type_element do template em cache.
+
+    Returns:
+        callable: Devolve o type_element, ou None se a célula não existe no template
+    """
+    template = obter_template(cursor, tabela)
+    posicao = template['indices']['type_element']
+    por_nome = template['por_nome']
+    return lambda nome: por_nome[nome][posicao] if nome in por_nome else None
+
+
+def invalidar_templates(tabela=None):
+    """
+    Descarta templates do cache deste processo (os demais processos percebem pelo carimbo).
+
+    Args:
+        tabela (str, optional): Tabela a descartar, em todos os bancos. Padrão: todas
+    """
+    with _cache_lock:
+        alvos = [chave for chave in _cache if tabela is None or chave[1] == tabela]
+        for alvo in alvos:
+            del _cache[alvo]
+            _ESTATISTICAS['invalidacoes'] += 1
+        _ultima_verificacao.clear()  # próxima leitura confere o carimbo no banco
+
+
+def marcar_templates_alterados(cursor, tabelas=TABELAS_TEMPLATE):
+    """
+    Incrementa o carimbo das tabelas (não faz commit).
+
+    Usado quando a tabela é recriada: as linhas inseridas antes dos gatilhos
+    voltarem (create_forms.py + migrações) não passaram por eles.
+    """
+    cursor.executemany("""
+        INSERT INTO template_versao (tabela, versao) VALUES (?, 1)
+        ON CONFLICT (tabela) DO UPDATE SET versao = versao + 1
+    """, [(tabela,) for tabela in tabelas])
+    invalidar_templates()
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores do cache de templates.
+
+    Returns:
+        dict: acertos, carregamentos, verificacoes, invalidacoes, tempo_carga e
+              versões/linhas dos templates em cache
+    """
+    with _cache_lock:
+        stats = dict(_ESTATISTICAS)
+        stats['templates'] = {
+            (tabela if banco is None else f"{banco}:{tabela}"): {
+                'versao': template['versao'], 'linhas': len(template['linhas'])
+            }
+            for (banco, tabela), template in _cache.items()
+        }
+    return stats
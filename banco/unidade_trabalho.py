@@ -0,0 +1,177 @@
+# banco/unidade_trabalho.py
+# Unidade de trabalho: agrupa as gravações de uma passada de renderização
+# Data: 18/10/2026 - Hora: 11:00
+
+import threading
+
+from banco.gravador import executar_escrita
+from banco.valores import buscar_celulas, gravar_valores, marcar_alterado
+
+_TOLERANCIA = 1e-9
+_NAO_INFORMADO = object()
+
+_stats_lock = threading.Lock()
+_ESTATISTICAS = {
+    'passadas': 0,          # flushes executados
+    'registradas': 0,       # gravações pedidas pelas páginas
+    'gravadas': 0,          # linhas efetivamente enviadas ao banco
+    'sem_alteracao': 0,     # descartadas porque o valor não mudou
+    'coalescidas': 0,       # gravações evitadas (repetidas na passada + sem alteração)
+    'ultimo_relatorio': None,
+}
+
+
+def _iguais(a, b):
+    """Compara valores do banco considerando floats com tolerância."""
+    if a is None or b is None:
+        return a is b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(float(a) - float(b)) <= _TOLERANCIA
+    return a == b
+
+
+class UnidadeTrabalho:
+    """
+    Coleta as alterações de value_element/str_element feitas durante uma
+    passada de renderização e grava tudo em uma única transação no final.
+
+    Uso:
+        uow = UnidadeTrabalho('forms_tab')
+        uow.registrar_leitura(user_id, name, value, str_value)
+        uow.registrar(user_id, name, value_element=10.0)
+        ...
+        relatorio = uow.flush(conn)
+    """
+
+    def __init__(self, tabela='forms_tab'):
+        self.tabela = tabela
+        self._originais = {}   # (user_id, name) -> {'value_element': .., 'str_element': ..}
+        self._pendentes = {}   # (user_id, name) -> {campo: valor}
+        self._registradas = 0
+
+    def registrar_leitura(self, user_id, name_element, value_element=_NAO_INFORMADO,
+                          str_element=_NAO_INFORMADO):
+        """Guarda o valor lido do banco, usado para descartar gravações sem efeito."""
+        original = self._originais.setdefault((user_id, name_element), {})
+        if value_element is not _NAO_INFORMADO:
+            original.setdefault('value_element', value_element)
+        if str_element is not _NAO_INFORMADO:
+            original.setdefault('str_element', str_element)
+
+    def registrar(self, user_id, name_element, value_element=_NAO_INFORMADO,
+                  str_element=_NAO_INFORMADO):
+        """Agenda a gravação de uma célula; a última gravação da passada prevalece."""
+        chave = (user_id, name_element)
+        pendente = self._pendentes.setdefault(chave, {})
+        atual = dict(self._originais.get(chave, {}), **pendente)
+        alterou = False
+        for campo, valor in (('value_element', value_element), ('str_element', str_element)):
+            if valor is not _NAO_INFORMADO:
+                alterou = alterou or campo not in atual or not _iguais(atual[campo], valor)
+                pendente[campo] = valor
+        self._registradas += 1
+        # Leituras da passada (fórmulas) já enxergam o valor pendente: versão nova
+        if alterou:
+            marcar_alterado(user_id)
+
+    def obter(self, user_id, name_element, campo, padrao=None):
+        """Retorna o valor pendente da célula (leitura das próprias gravações) ou o padrão."""
+        return self._pendentes.get((user_id, name_element), {}).get(campo, padrao)
+
+    def atual(self, user_id, name_element, campo, padrao=None):
+        """Valor pendente da célula ou, sem pendência, o lido na passada (registrar_leitura); senão o padrão."""
+        chave = (user_id, name_element)
+        if campo in self._pendentes.get(chave, {}):
+            return self._pendentes[chave][campo]
+        return self._originais.get(chave, {}).get(campo, padrao)
+
+    def pendentes(self, user_id, campo='value_element'):
+        """Dicionário {name_element: valor} das gravações pendentes de um usuário."""
+        return {
+            name: campos[campo]
+            for (uid, name), campos in self._pendentes.items()
+            if uid == user_id and campo in campos
+        }
+
+    def _completar_originais(self, cursor):
+        """Busca em lote o valor atual das células pendentes que não foram lidas na passada."""
+        faltantes = {}
+        for chave in self._pendentes:
+            original = self._originais.get(chave, {})
+            if 'value_element' not in original or 'str_element' not in original:
+                faltantes.setdefault(chave[0], []).append(chave[1])
+
+        for user_id, nomes in faltantes.items():
+            for name, (value, str_value) in buscar_celulas(cursor, self.tabela, user_id, nomes).items():
+                original = self._originais.setdefault((user_id, name), {})
+                original.setdefault('value_element', value)
+                original.setdefault('str_element', str_value)
+
+    def flush(self, conn):
+        """
+        Grava as alterações pendentes em uma transação com executemany.
+        Com o gravador único ligado a transação vai para a fila dele.
+
+        Args:
+            conn: Conexão com o banco de dados
+
+        Returns:
+            dict: registradas, gravadas, sem_alteracao e coalescidas (evitadas) desta passada
+        """
+        relatorio = {
+            'tabela': self.tabela,
+            'registradas': self._registradas,
+            'gravadas': 0,
+            'sem_alteracao': 0,
+            'coalescidas': 0,
+        }
+
+        if self._pendentes:
+            cursor = conn.cursor()
+            self._completar_originais(cursor)
+
+            alteracoes = []
+            for (user_id, name), campos in self._pendentes.items():
+                original = self._originais.get((user_id, name), {})
+                alterados = {
+                    campo: valor for campo, valor in campos.items()
+                    if campo not in original or not _iguais(original[campo], valor)
+                }
+                if not alterados:
+                    relatorio['sem_alteracao'] += 1
+                    continue
+                alteracoes.append((user_id, name, alterados))
+
+            if alteracoes:
+                # executemany agrupado por campos alterados (UPDATE legado ou upsert normalizado),
+                # pelo gravador único quando ligado
+                # A versão dos usuários já mudou em registrar; se a gravação falha,
+                # muda de novo para descartar o que foi memorizado com os pendentes
+                try:
+                    executar_escrita(conn, gravar_valores, self.tabela, alteracoes, marcar=False)
+                except Exception:
+                    for user_id in {user_id for user_id, _, _ in alteracoes}:
+                        marcar_alterado(user_id)
+                    raise
+            relatorio['gravadas'] = len(alteracoes)
+
+            # Valores gravados passam a ser a nova referência da unidade
+            for chave, campos in self._pendentes.items():
+                self._originais.setdefault(chave, {}).update(campos)
+
+        relatorio['coalescidas'] = relatorio['registradas'] - relatorio['gravadas']
+        self._pendentes = {}
+        self._registradas = 0
+
+        with _stats_lock:
+            _ESTATISTICAS['passadas'] += 1
+            for campo in ('registradas', 'gravadas', 'sem_alteracao', 'coalescidas'):
+                _ESTATISTICAS[campo] += relatorio[campo]
+            _ESTATISTICAS['ultimo_relatorio'] = dict(relatorio)
+        return relatorio
+
+
+def get_estatisticas():
+    """Retorna os contadores acumulados das unidades de trabalho do processo."""
+    with _stats_lock:
+        return dict(_ESTATISTICAS)
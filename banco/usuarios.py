@@ -0,0 +1,157 @@
+# banco/usuarios.py
+# Cache de leitura (TTL + LRU) dos cadastros de usuarios: nome, email, empresa, perfil e idioma
+# Data: 19/10/2026 - Hora: 02:30
+
+import threading
+import time
+from collections import OrderedDict
+
+from config import USUARIOS_CACHE_TTL_S, USUARIOS_CACHE_MAX
+from banco.backends import info_colunas
+from banco.conexao import get_connection
+
+# Boas-vindas, análise de âncoras, administração e idioma (texto_manager)
+# liam o mesmo usuário em usuarios a cada rerun. Aqui o registro fica em
+# memória no processo por até USUARIOS_CACHE_TTL_S segundos, com no máximo
+# USUARIOS_CACHE_MAX registros (o menos usado sai primeiro). Quem grava em
+# usuarios neste processo (trocar senha, idioma, CRUD, provisionamento)
+# chama invalidar_usuario; o TTL limita o tempo de um registro desatualizado
+# por gravações de outro processo. A senha não é guardada: o login continua
+# consultando o banco.
+COLUNAS_USUARIO = ('user_id', 'nome', 'email', 'empresa', 'perfil', 'idioma')
+
+_lock = threading.Lock()
+_registros = OrderedDict()   # user_id -> (expira_em, dict)
+_listas = {}                 # perfil -> (expira_em, list[dict])
+_ESTATISTICAS = {
+    'acertos': 0,
+    'faltas': 0,           # consultas ao banco
+    'expirados': 0,        # faltas por TTL vencido
+    'descartados': 0,      # removidos pelo limite de tamanho (LRU)
+    'invalidacoes': 0,
+}
+
+
+def _chave(user_id):
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return user_id
+
+
+def _colunas_select(cursor):
+    """Colunas de COLUNAS_USUARIO presentes na tabela (bancos antigos não têm idioma)."""
+    existentes = {coluna[1] for coluna in info_colunas(cursor, 'usuarios')}
+    return [c if c in existentes else f"NULL AS {c}" for c in COLUNAS_USUARIO]
+
+
+def _consultar(sql_where, parametros):
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(_colunas_select(cursor))} FROM usuarios {sql_where}", parametros)
+        return [dict(zip(COLUNAS_USUARIO, linha)) for linha in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def _guardar(chave, registro):
+    with _lock:
+        _registros[chave] = (time.monotonic() + USUARIOS_CACHE_TTL_S, registro)
+        _registros.move_to_end(chave)
+        while len(_registros) > max(USUARIOS_CACHE_MAX, 1):
+            _registros.popitem(last=False)
+            _ESTATISTICAS['descartados'] += 1
+
+
+def obter_usuario(user_id):
+    """
+    Retorna o cadastro do usuário, do cache quando possível.
+
+    Args:
+        user_id (int|str): ID do usuário
+
+    Returns:
+        dict: Chaves de COLUNAS_USUARIO (cópia), ou None se o usuário não existe
+    """
+    if user_id is None:
+        return None
+    chave = _chave(user_id)
+    with _lock:
+        item = _registros.get(chave)
+        if item is not None:
+            if item[0] > time.monotonic():
+                _registros.move_to_end(chave)
+                _ESTATISTICAS['acertos'] += 1
+                return dict(item[1])
+            del _registros[chave]
+            _ESTATISTICAS['expirados'] += 1
+        _ESTATISTICAS['faltas'] += 1
+
+    # Usuário inexistente não é guardado: um cadastro novo aparece na hora
+    registros = _consultar("WHERE user_id = ?", (chave,))
+    if not registros:
+        return None
+    _guardar(chave, registros[0])
+    return dict(registros[0])
+
+
+def listar_usuarios(perfil=None):
+    """
+    Lista os cadastros (ordenados por nome), do cache quando possível.
+
+    Args:
+        perfil (str, optional): Só usuários deste perfil
+
+    Returns:
+        list[dict]: Registros com as chaves de COLUNAS_USUARIO
+    """
+    with _lock:
+        item = _listas.get(perfil)
+        if item is not None and item[0] > time.monotonic():
+            _ESTATISTICAS['acertos'] += 1
+            return [dict(r) for r in item[1]]
+        _ESTATISTICAS['faltas'] += 1
+
+    if perfil is None:
+        registros = _consultar("ORDER BY nome", ())
+    else:
+        registros = _consultar("WHERE perfil = ? ORDER BY nome", (perfil,))
+    with _lock:
+        _listas[perfil] = (time.monotonic() + USUARIOS_CACHE_TTL_S, registros)
+    for registro in registros:
+        _guardar(_chave(registro['user_id']), registro)
+    return [dict(r) for r in registros]
+
+
+def invalidar_usuario(user_id=None):
+    """
+    Descarta o cadastro em cache após gravar em usuarios.
+
+    Args:
+        user_id (int|str, optional): Usuário alterado. Se None, descarta todos
+    """
+    with _lock:
+        if user_id is None:
+            _registros.clear()
+        else:
+            _registros.pop(_chave(user_id), None)
+        # Nome, empresa ou perfil podem ter mudado: as listas são refeitas
+        _listas.clear()
+        _ESTATISTICAS['invalidacoes'] += 1
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores do cache de usuarios.
+
+    Returns:
+        dict: acertos, faltas, expirados, descartados, invalidacoes, taxa_acerto, registros e listas
+    """
+    with _lock:
+        stats = dict(_ESTATISTICAS)
+        stats['registros'] = len(_registros)
+        stats['listas'] = len(_listas)
+    consultas = stats['acertos'] + stats['faltas']
+    stats['taxa_acerto'] = round(stats['acertos'] / consultas, 3) if consultas else 0.0
+    return stats
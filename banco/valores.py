@@ -0,0 +1,357 @@
+# banco/valores.py
+# Acesso aos valores dos formulários (modo legado ou normalizado)
+# Data: 18/10/2026 - Hora: 14:00
+# comando: uv run python -m banco.valores --migrar   (copia dados legados para o modo normalizado)
+
+import sys
+import threading
+
+from config import STORAGE_MODE
+from banco.templates import filtrar_template, obter_template
+
+# No modo 'legado' cada usuário tem uma cópia completa das linhas do template
+# (user_id = 0) em forms_tab/forms_resultados. No modo 'normalizado' as linhas
+# do template ficam só uma vez (views <tabela>_template) e cada usuário tem
+# apenas as células que alterou em <tabela>_valores (user_id, name_element,
+# value_element, str_element). O layout vem do cache de templates
+# (banco/templates.py) e as leituras buscam no banco só os valores do usuário.
+TABELAS_FORMULARIO = ('forms_tab', 'forms_resultados')
+
+_COLUNAS_VALOR = ('value_element', 'str_element')
+
+# Versão das células de cada usuário neste processo: muda a cada gravação
+# (gravar_valores, zerar_valores, CRUD) e a cada alteração registrada em uma
+# unidade de trabalho. Resultados memorizados (calculo/memo.py) guardam a
+# versão com que foram calculados e deixam de valer quando ela muda.
+_versoes_lock = threading.Lock()
+_versoes = {}           # user_id -> contador
+_versao_geral = 0       # muda quando todos os usuários são invalidados
+
+
+def versao_valores(user_id):
+    """Versão atual das células do usuário neste processo (tupla comparável por igualdade)."""
+    with _versoes_lock:
+        return (_versao_geral, _versoes.get(user_id, 0))
+
+
+def marcar_alterado(user_id=None):
+    """
+    Registra que células do usuário mudaram (invalida resultados memorizados).
+
+    Args:
+        user_id (int, optional): Usuário alterado. Se None, todos os usuários
+    """
+    global _versao_geral
+    with _versoes_lock:
+        if user_id is None:
+            _versao_geral += 1
+            _versoes.clear()
+        else:
+            _versoes[user_id] = _versoes.get(user_id, 0) + 1
+
+
+def modo_normalizado():
+    """Indica se o armazenamento normalizado está ativo (config.STORAGE_MODE)."""
+    return STORAGE_MODE == 'normalizado'
+
+
+def tabela_valores(tabela):
+    """Nome da tabela estreita de valores por usuário da tabela de formulário."""
+    return f"{tabela}_valores"
+
+
+def _filtros_sql(filtros, tipos, prefixo):
+    """Monta as condições extras do WHERE e seus parâmetros."""
+    condicoes = []
+    params = []
+    for coluna, valor in (filtros or {}).items():
+        condicoes.append(f"{prefixo}{coluna} = ?")
+        params.append(valor)
+    if tipos:
+        condicoes.append(f"{prefixo}type_element IN ({','.join(['?'] * len(tipos))})")
+        params.extend(tipos)
+    return ''.join(f" AND {c}" for c in condicoes), params
+
+
+def _valores_usuario(cursor, tabela, user_id, filtros=None, tipos=None):
+    """
+    Lê só name_element, value_element e str_element do usuário.
+
+    Returns:
+        dict|None: {name_element: (value_element, str_element)}; None no modo
+                   legado quando o usuário não tem linhas no filtro
+    """
+    if not modo_normalizado():
+        where, params = _filtros_sql(filtros, tipos, '')
+        # ORDER BY ID_element: em nomes duplicados prevalece a linha mais recente
+        cursor.execute(f"""
+            SELECT name_element, value_element, str_element
+            FROM {tabela}
+            WHERE user_id = ?{where}
+            ORDER BY ID_element
+        """, [user_id] + params)
+        linhas = cursor.fetchall()
+        if not linhas:
+            return None
+        return {name: (value, str_value) for name, value, str_value in linhas}
+
+    cursor.execute(f"""
+        SELECT name_element, value_element, str_element
+        FROM {tabela_valores(tabela)}
+        WHERE user_id = ?
+    """, (user_id,))
+    return {name: (value, str_value) for name, value, str_value in cursor.fetchall()}
+
+
+def _mesclar(linha_template, indices, valores_usuario):
+    """value_element/str_element da célula: do usuário quando existir, senão do template."""
+    name = linha_template[indices['name_element']]
+    value = linha_template[indices['value_element']]
+    str_value = linha_template[indices['str_element']]
+    proprios = valores_usuario.get(name) if name else None
+    if proprios is None:
+        return value, str_value
+    if not modo_normalizado():
+        return proprios
+    # Normalizado: NULL na tabela de valores equivale a "não alterado" (COALESCE)
+    return (proprios[0] if proprios[0] is not None else value,
+            proprios[1] if proprios[1] is not None else str_value)
+
+
+def buscar_elementos(cursor, tabela, user_id, colunas=None, filtros=None, tipos=None,
+                     ordem='e_row, e_col'):
+    """
+    Busca as linhas de um usuário com o mesmo formato do modo legado.
+
+    O layout vem do cache de templates (banco/templates.py); do banco são
+    lidos apenas os valores do usuário.
+
+    Args:
+        cursor: Cursor do banco de dados
+        tabela (str): forms_tab ou forms_resultados
+        user_id (int): ID do usuário
+        colunas (list, optional): Colunas desejadas, na ordem da tupla. Padrão: todas
+        filtros (dict, optional): Igualdades extras {coluna: valor} (ex.: section)
+        tipos (list, optional): type_element aceitos
+        ordem (str): Colunas do ORDER BY
+
+    Returns:
+        list[tuple]: Linhas na ordem de 'colunas'
+    """
+    template = obter_template(cursor, tabela)
+    indices = template['indices']
+    colunas = list(colunas or template['colunas'])
+
+    linhas = filtrar_template(template, filtros, tipos, ordem)
+    if not linhas:
+        return []
+    valores_usuario = _valores_usuario(cursor, tabela, user_id, filtros, tipos)
+    if valores_usuario is None:
+        return []
+
+    resultado = []
+    for linha in linhas:
+        value, str_value = _mesclar(linha, indices, valores_usuario)
+        proprios = {'user_id': user_id, 'value_element': value, 'str_element': str_value}
+        resultado.append(tuple(
+            proprios[coluna] if coluna in proprios else linha[indices[coluna]]
+            for coluna in colunas
+        ))
+    return resultado
+
+
+def buscar_celulas(cursor, tabela, user_id, nomes):
+    """
+    Busca value_element e str_element de várias células em uma só consulta.
+
+    Returns:
+        dict: {name_element: (value_element, str_element)}
+    """
+    nomes = list(dict.fromkeys(n for n in nomes if n))
+    if not nomes:
+        return {}
+    placeholders = ','.join(['?'] * len(nomes))
+
+    if not modo_normalizado():
+        # ORDER BY ID_element: em nomes duplicados prevalece a linha mais recente
+        cursor.execute(f"""
+            SELECT name_element, value_element, str_element
+            FROM {tabela}
+            WHERE user_id = ? AND name_element IN ({placeholders})
+            ORDER BY ID_element
+        """, [user_id] + nomes)
+        return {name: (value, str_value) for name, value, str_value in cursor.fetchall()}
+
+    # Normalizado: valores alterados do banco, padrões do template em cache
+    template = obter_template(cursor, tabela)
+    cursor.execute(f"""
+        SELECT name_element, value_element, str_element
+        FROM {tabela_valores(tabela)}
+        WHERE user_id = ? AND name_element IN ({placeholders})
+    """, [user_id] + nomes)
+    valores_usuario = {name: (value, str_value) for name, value, str_value in cursor.fetchall()}
+    return {
+        name: _mesclar(template['por_nome'][name], template['indices'], valores_usuario)
+        for name in nomes if name in template['por_nome']
+    }
+
+
+def buscar_valores(cursor, tabela, user_id, nomes, campo='value_element'):
+    """
+    Busca um campo (value_element ou str_element) de várias células.
+
+    Returns:
+        dict: {name_element: valor}; células inexistentes ficam de fora
+    """
+    indice = 0 if campo == 'value_element' else 1
+    return {name: valores[indice] for name, valores in buscar_celulas(cursor, tabela, user_id, nomes).items()}
+
+
+def gravar_valores(cursor, tabela, alteracoes, marcar=True):
+    """
+    Grava alterações de células com executemany (não faz commit).
+
+    Args:
+        cursor: Cursor do banco de dados
+        tabela (str): forms_tab ou forms_resultados
+        alteracoes (list): [(user_id, name_element, {'value_element': .., 'str_element': ..})]
+        marcar (bool): Muda a versão dos usuários (False quando já foi mudada ao registrar)
+
+    Returns:
+        int: Quantidade de células enviadas ao banco
+    """
+    grupos = {}
+    for user_id, name, campos in alteracoes:
+        chave = tuple(c for c in _COLUNAS_VALOR if c in campos)
+        if chave and name:
+            grupos.setdefault(chave, []).append((user_id, name, campos))
+
+    for campos_grupo, itens in grupos.items():
+        if not modo_normalizado():
+            sets = ', '.join(f"{c} = ?" for c in campos_grupo)
+            cursor.executemany(f"""
+                UPDATE {tabela}
+                SET {sets}
+                WHERE name_element = ? AND user_id = ?
+            """, [tuple(campos[c] for c in campos_grupo) + (name, user_id) for user_id, name, campos in itens])
+            continue
+
+        # Upsert na tabela de valores: campos não informados vêm do template
+        select = ', '.join(
+            '?' if c in campos_grupo else f"t.{c}" for c in _COLUNAS_VALOR
+        )
+        updates = ', '.join(f"{c} = excluded.{c}" for c in campos_grupo)
+        cursor.executemany(f"""
+            INSERT INTO {tabela_valores(tabela)} (user_id, name_element, value_element, str_element)
+            SELECT ?, t.name_element, {select}
+            FROM {tabela}_template t
+            WHERE t.name_element = ?
+            ON CONFLICT (user_id, name_element) DO UPDATE SET {updates}
+        """, [
+            (user_id,) + tuple(campos[c] for c in _COLUNAS_VALOR if c in campos_grupo) + (name,)
+            for user_id, name, campos in itens
+        ])
+
+    if marcar:
+        for user_id in {user_id for user_id, _, _ in alteracoes}:
+            marcar_alterado(user_id)
+    return len(alteracoes)
+
+
+def zerar_valores(cursor, tabela, user_id, tipos):
+    """
+    Zera value_element das células do usuário com os tipos informados (não faz commit).
+
+    Returns:
+        int: Registros afetados
+    """
+    placeholders = ','.join(['?'] * len(tipos))
+    marcar_alterado(user_id)
+    if not modo_normalizado():
+        cursor.execute(f"""
+            UPDATE {tabela}
+            SET value_element = 0.0
+            WHERE user_id = ?
+            AND value_element IS NOT NULL
+            AND type_element IN ({placeholders})
+        """, [user_id] + list(tipos))
+        return cursor.rowcount
+
+    cursor.execute(f"""
+        INSERT INTO {tabela_valores(tabela)} (user_id, name_element, value_element, str_element)
+        SELECT ?, t.name_element, 0.0, t.str_element
+        FROM {tabela}_template t
+        WHERE t.value_element IS NOT NULL
+        AND t.name_element != ''
+        AND t.type_element IN ({placeholders})
+        ON CONFLICT (user_id, name_element) DO UPDATE SET value_element = 0.0
+    """, [user_id] + list(tipos))
+    return cursor.rowcount
+
+
+def usuario_tem_dados(cursor, tabela, user_id):
+    """Indica se o usuário já possui registros/valores na tabela de formulário."""
+    alvo = tabela_valores(tabela) if modo_normalizado() else tabela
+    cursor.execute(f"SELECT 1 FROM {alvo} WHERE user_id = ? LIMIT 1", (user_id,))
+    return cursor.fetchone() is not None
+
+
+def contar_usuarios_com_dados(cursor, tabela, perfil='usuario'):
+    """Conta usuários do perfil informado que possuem dados na tabela de formulário."""
+    alvo = tabela_valores(tabela) if modo_normalizado() else tabela
+    cursor.execute(f"""
+        SELECT COUNT(DISTINCT user_id)
+        FROM {alvo}
+        WHERE user_id IN (SELECT user_id FROM usuarios WHERE perfil = ?)
+    """, (perfil,))
+    return cursor.fetchone()[0]
+
+
+def migrar_para_normalizado(conn, remover_legado=False):
+    """
+    Copia os valores dos usuários do modo legado para as tabelas <tabela>_valores.
+
+    Só são copiadas as células cujo valor difere do template. Com
+    remover_legado=True as linhas copiadas por usuário (user_id <> 0) são
+    apagadas das tabelas legadas ao final.
+
+    Returns:
+        dict: {tabela: células copiadas}
+    """
+    cursor = conn.cursor()
+    copiadas = {}
+    try:
+        for tabela in TABELAS_FORMULARIO:
+            cursor.execute(f"""
+                INSERT INTO {tabela_valores(tabela)} (user_id, name_element, value_element, str_element)
+                SELECT u.user_id, u.name_element, u.value_element, u.str_element
+                FROM {tabela} u
+                JOIN {tabela}_template t ON t.name_element = u.name_element
+                WHERE u.user_id <> 0
+                AND u.name_element != ''
+                AND (u.value_element IS NOT t.value_element OR u.str_element IS NOT t.str_element)
+                ON CONFLICT (user_id, name_element) DO UPDATE SET
+                    value_element = excluded.value_element,
+                    str_element = excluded.str_element
+            """)
+            copiadas[tabela] = cursor.rowcount
+            if remover_legado:
+                cursor.execute(f"DELETE FROM {tabela} WHERE user_id <> 0")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return copiadas
+
+
+if __name__ == "__main__":
+    if '--migrar' in sys.argv:
+        from banco.conexao import get_connection
+        from banco.migracoes import aplicar_migracoes
+
+        conn = get_connection()
+        try:
+            aplicar_migracoes(conn=conn)
+            print(migrar_para_normalizado(conn, remover_legado='--remover-legado' in sys.argv))
+        finally:
+            conn.close()
@@ -0,0 +1,160 @@
+# benchmarks/formulas.py
+# Benchmark das fórmulas do template: antigo caminho re.findall/re.sub/safe_div/eval contra compilar + avaliar
+# Data: 19/10/2026 - Hora: 19:00
+# comando: uv run python -m benchmarks.formulas [--amostras N] [--semente S]
+
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from config import DB_PATH
+from banco.migracoes import aplicar_migracoes
+from banco.templates import obter_template
+from calculo.formulas import ErroFormula, calcular, compilar
+from calculo.grafo import TIPOS_FORMULA
+
+# Lê todos os math_element das células fórmula dos templates (forms_tab e
+# forms_resultados) numa cópia temporária de data/calcrh2.db, apagada no fim:
+# o banco real não é alterado. Cada fórmula é avaliada com os mesmos conjuntos
+# sorteados de valores pelos dois caminhos:
+# - antigo: o corpo de _calculate_formula_cached (paginas/form_model.py antes
+#   de calculo/formulas.py), sem o st.cache_data, que só evitava o trabalho
+#   quando fórmula e valores se repetiam;
+# - novo: calcular, isto é, compilar (em cache por texto) + avaliar e o mesmo
+#   arredondamento da exibição.
+# A primeira rodada do novo caminho inclui a compilação de cada texto e é
+# medida à parte. As divergências contadas são esperadas só onde a semântica
+# mudou (ver o cabeçalho de calculo/formulas.py).
+_RE_REFERENCIA = r'(?:Insumos!)?[A-Z]{1,2}[0-9]+'
+
+
+def _antigo(formula_str, values_dict):
+    """Caminho antigo: substituição das referências por texto, safe_div por regex e eval."""
+    try:
+        if isinstance(formula_str, str):
+            formula_clean = formula_str.replace(',', '.')
+            if formula_clean.replace('.', '', 1).isdigit():
+                return float(formula_clean)
+        processed_formula = str(formula_str)
+        for ref in re.findall(_RE_REFERENCIA, processed_formula):
+            processed_formula = re.sub(r'\b' + re.escape(ref) + r'\b', str(values_dict.get(ref, 0.0)),
+                                       processed_formula)
+        processed_formula = processed_formula.replace(',', '.')
+
+        def safe_div(x, y):
+            if abs(float(y)) < 1e-10:
+                return 0.0
+            return x / y
+
+        processed_formula = re.sub(r'(\d+\.?\d*|\([^)]+\))\s*/\s*(\d+\.?\d*|\([^)]+\))', r'safe_div(\1, \2)',
+                                   processed_formula)
+        result = float(eval(processed_formula, {'safe_div': safe_div, '__builtins__': None}, {}))
+        formatted_result = f"{result:,.0f}" if abs(result) >= 1 else f"{result:,.3f}"
+        formatted_result = formatted_result.replace(',', 'TEMP').replace('.', ',').replace('TEMP', '.')
+        return float(formatted_result.replace('.', '').replace(',', '.'))
+    except Exception:
+        return 0.0
+
+
+def _formulas(cursor):
+    """math_element de todas as células fórmula dos templates (com repetições, como na página)."""
+    textos = []
+    for tabela in ('forms_tab', 'forms_resultados'):
+        template = obter_template(cursor, tabela)
+        indices = template['indices']
+        for linha in template['linhas']:
+            texto = linha[indices['math_element']]
+            if linha[indices['type_element']] in TIPOS_FORMULA and texto:
+                textos.append(str(texto))
+    return textos
+
+
+def _medir(funcao, casos):
+    """Avalia cada (texto, valores) e devolve os resultados e o tempo por avaliação (µs)."""
+    inicio = time.perf_counter()
+    resultados = [funcao(texto, valores) for texto, valores in casos]
+    return resultados, (time.perf_counter() - inicio) / len(casos) * 1e6
+
+
+def executar(amostras=200, semente=1):
+    """
+    Mede os dois caminhos em todas as fórmulas do template.
+
+    Args:
+        amostras (int): Conjuntos de valores sorteados por fórmula
+        semente (int): Semente do sorteio dos valores
+
+    Returns:
+        dict: formulas, distintas, invalidas, avaliacoes, antigo_us, novo_frio_us
+              (primeira rodada, com a compilação), novo_us (mediana das demais rodadas),
+              aceleracao e divergencias
+    """
+    with tempfile.TemporaryDirectory() as pasta:
+        copia = Path(pasta) / DB_PATH.name
+        shutil.copy2(DB_PATH, copia)
+        conn = sqlite3.connect(copia)
+        try:
+            aplicar_migracoes(conn=conn)
+            textos = _formulas(conn.cursor())
+        finally:
+            conn.close()
+
+    sorteio = random.Random(semente)
+    rodadas = []
+    for _ in range(amostras):
+        rodada = []
+        for texto in textos:
+            referencias = dict.fromkeys(re.findall(_RE_REFERENCIA, texto))
+            rodada.append((texto, {ref: round(sorteio.uniform(-1000, 1000), 3) for ref in referencias}))
+        rodadas.append(rodada)
+
+    casos = [caso for rodada in rodadas for caso in rodada]
+    antigos, antigo_us = _medir(_antigo, casos)
+    novos, novo_frio_us = _medir(calcular, rodadas[0])
+    tempos = [novo_frio_us]
+    for rodada in rodadas[1:]:
+        resultados, tempo = _medir(calcular, rodada)
+        novos.extend(resultados)
+        tempos.append(tempo)
+    invalidas = 0
+    for texto in set(textos):
+        try:
+            compilar(texto)
+        except ErroFormula:
+            invalidas += 1
+    novo_us = statistics.median(tempos[1:]) if len(tempos) > 1 else novo_frio_us
+    return {
+        'formulas': len(textos),
+        'distintas': len(set(textos)),
+        'invalidas': invalidas,
+        'avaliacoes': len(casos),
+        'antigo_us': round(antigo_us, 3),
+        'novo_frio_us': round(novo_frio_us, 3),
+        'novo_us': round(novo_us, 3),
+        'aceleracao': round(antigo_us / novo_us, 1) if novo_us else None,
+        'divergencias': sum(1 for antigo, novo in zip(antigos, novos) if antigo != novo),
+    }
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+
+    def _valor(opcao, padrao):
+        return argumentos[argumentos.index(opcao) + 1] if opcao in argumentos else padrao
+
+    resultado = executar(
+        amostras=int(_valor('--amostras', 200)),
+        semente=int(_valor('--semente', 1)),
+    )
+    print(f"{resultado['formulas']} fórmulas no template ({resultado['distintas']} distintas, "
+          f"{resultado['invalidas']} inválidas), {resultado['avaliacoes']} avaliações por caminho")
+    print(f"  antigo (re.sub + safe_div + eval): {resultado['antigo_us']} µs por avaliação")
+    print(f"  novo (compilar + avaliar): {resultado['novo_us']} µs por avaliação "
+          f"(primeira rodada, com a compilação: {resultado['novo_frio_us']} µs)")
+    print(f"  {resultado['aceleracao']}x mais rápido, {resultado['divergencias']} resultados diferentes")
@@ -0,0 +1,128 @@
+# benchmarks/gravador_concorrencia.py
+# Benchmark do gravador único (banco/gravador.py): gravações concorrentes com o modo desligado e ligado
+# Data: 19/10/2026 - Hora: 15:00
+# comando: uv run python -m benchmarks.gravador_concorrencia [--threads 8,32] [--gravacoes N]
+
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from config import DB_PATH
+from banco import backends, gravador
+from banco.conexao import fechar_conexoes, get_connection
+from banco.retentativa import transacao_com_retentativa
+
+# Cada thread faz o que uma página faz: pega a conexão de leitura do pool,
+# grava uma linha em log_acessos por transacao_com_retentativa e lê de volta.
+# Roda numa cópia temporária de data/calcrh2.db (apagada no fim): o banco
+# real não é alterado. O modo do gravador é trocado entre as rodadas no
+# próprio processo (gravador.DB_GRAVADOR_UNICO), com a cópia no lugar do
+# DB_PATH do backend.
+
+
+def _gravar(cursor, user_id, passo):
+    cursor.execute(
+        "INSERT INTO log_acessos (user_id, data_acesso, programa, acao, hora_acesso) VALUES (?, ?, ?, ?, ?)",
+        (user_id, '2026-10-19', 'benchmark', f'gravacao {passo}', '15:00:00')
+    )
+
+
+def _pagina(user_id, gravacoes, inicio, latencias, erros):
+    inicio.wait()
+    for passo in range(gravacoes):
+        conn = get_connection(leitura=True)
+        try:
+            antes = time.perf_counter()
+            transacao_com_retentativa(conn, 'benchmark.gravador', _gravar, user_id, passo)
+            latencias.append(time.perf_counter() - antes)
+            conn.execute("SELECT COUNT(*) FROM log_acessos WHERE user_id = ?", (user_id,)).fetchone()
+        except Exception as e:
+            erros.append(str(e))
+        finally:
+            conn.close()
+
+
+def _rodada(threads, gravacoes, ligado):
+    """Uma rodada com o modo indicado; devolve gravações/s e latências (ms)."""
+    gravador.DB_GRAVADOR_UNICO = ligado
+    latencias, erros = [], []
+    inicio = threading.Barrier(threads + 1)
+    paginas = [
+        threading.Thread(target=_pagina, args=(1000 + i, gravacoes, inicio, latencias, erros))
+        for i in range(threads)
+    ]
+    for pagina in paginas:
+        pagina.start()
+    inicio.wait()
+    relogio = time.perf_counter()
+    for pagina in paginas:
+        pagina.join()
+    duracao = time.perf_counter() - relogio
+    gravador.encerrar()
+    fechar_conexoes()
+
+    ordenadas = sorted(latencias)
+    return {
+        'gravacoes_s': round(len(latencias) / duracao),
+        'p50_ms': round(statistics.median(ordenadas) * 1000, 2),
+        'p99_ms': round(ordenadas[min(len(ordenadas) - 1, int(0.99 * len(ordenadas)))] * 1000, 2),
+        'maior_ms': round(ordenadas[-1] * 1000, 2),
+        'erros': len(erros),
+    }
+
+
+def executar(threads=(8, 32), gravacoes=150):
+    """
+    Mede as mesmas rodadas com o gravador único desligado e ligado.
+
+    Args:
+        threads (iterable): Quantidades de threads (páginas simultâneas)
+        gravacoes (int): Gravações de uma linha por thread
+
+    Returns:
+        list: {threads, desligado, ligado} com gravacoes_s, p50_ms, p99_ms, maior_ms e erros
+    """
+    original = (backends.DB_PATH, gravador.DB_GRAVADOR_UNICO)
+    resultados = []
+    with tempfile.TemporaryDirectory() as pasta:
+        copia = Path(pasta) / DB_PATH.name
+        origem = sqlite3.connect(f"{DB_PATH.resolve().as_uri()}?mode=ro", uri=True)
+        destino = sqlite3.connect(copia)
+        try:
+            origem.backup(destino)
+        finally:
+            destino.close()
+            origem.close()
+        backends.DB_PATH = copia
+        try:
+            for quantidade in threads:
+                resultados.append({
+                    'threads': quantidade,
+                    'desligado': _rodada(quantidade, gravacoes, False),
+                    'ligado': _rodada(quantidade, gravacoes, True),
+                })
+        finally:
+            backends.DB_PATH, gravador.DB_GRAVADOR_UNICO = original
+            fechar_conexoes()
+    return resultados
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+
+    def _valor(opcao, padrao):
+        return argumentos[argumentos.index(opcao) + 1] if opcao in argumentos else padrao
+
+    gravacoes = int(_valor('--gravacoes', 150))
+    threads = [int(t) for t in _valor('--threads', '8,32').split(',')]
+    print(f"{gravacoes} gravações por thread (INSERT em log_acessos + leitura)")
+    for resultado in executar(threads, gravacoes):
+        for modo in ('desligado', 'ligado'):
+            medida = resultado[modo]
+            print(f"  {resultado['threads']:>3} threads, gravador {modo:<9}: {medida['gravacoes_s']} gravações/s, "
+                  f"p50 {medida['p50_ms']} ms, p99 {medida['p99_ms']} ms, maior {medida['maior_ms']} ms, "
+                  f"erros {medida['erros']}")
@@ -0,0 +1,103 @@
+# benchmarks/login_email.py
+# Benchmark do login por e-mail com 100 mil usuários: consulta do main.py sem e com o índice LOWER(email) (migração 5)
+# Data: 19/10/2026 - Hora: 14:00
+# comando: uv run python -m benchmarks.login_email [--usuarios N] [--consultas N] [--semente S]
+
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from config import DB_PATH
+from banco.migracoes import aplicar_migracoes
+
+# Mede a consulta de login do main.py (authenticate_user) numa cópia
+# temporária de data/calcrh2.db, apagada no fim: o banco real não é alterado.
+# A cópia recebe N usuários sintéticos e a mesma amostra de e-mails
+# (misturando maiúsculas, como digitados no login) é consultada antes e
+# depois de aplicar as migrações, que criam idx_usuarios_email_lower.
+SQL_LOGIN = "SELECT id, user_id, perfil, nome FROM usuarios WHERE LOWER(email) = LOWER(?) AND senha = ?"
+
+
+def _povoar(conn, usuarios):
+    """Acrescenta usuários sintéticos (user_id acima dos existentes)."""
+    inicio = conn.execute("SELECT COALESCE(MAX(user_id), 0) FROM usuarios").fetchone()[0] + 1
+    conn.executemany(
+        "INSERT INTO usuarios (user_id, nome, email, senha, perfil, empresa, idioma) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(uid, f"Usuário {uid}", f"usuario{uid}@empresa{uid % 50}.com.br", f"senha{uid}", 'usuario',
+          f"Empresa {uid % 50}", 'pt') for uid in range(inicio, inicio + usuarios)]
+    )
+    conn.commit()
+    return list(range(inicio, inicio + usuarios))
+
+
+def _medir(conn, amostra):
+    """Executa o login para cada (e-mail, senha) e devolve os tempos (ms) e o plano."""
+    plano = [linha[-1] for linha in conn.execute(f"EXPLAIN QUERY PLAN {SQL_LOGIN}", amostra[0])]
+    tempos = []
+    for email, senha in amostra:
+        inicio = time.perf_counter()
+        encontrado = conn.execute(SQL_LOGIN, (email, senha)).fetchone()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        if encontrado is None:
+            raise RuntimeError(f"login não encontrado: {email}")
+    return {
+        'plano': plano,
+        'mediana_ms': round(statistics.median(tempos), 4),
+        'p95_ms': round(sorted(tempos)[int(len(tempos) * 0.95) - 1], 4),
+        'maior_ms': round(max(tempos), 4),
+    }
+
+
+def executar(usuarios=100_000, consultas=200, semente=1):
+    """
+    Mede o login sem e com o índice de expressão.
+
+    Args:
+        usuarios (int): Usuários sintéticos acrescentados à cópia
+        consultas (int): Logins medidos em cada fase
+        semente (int): Semente do sorteio dos e-mails
+
+    Returns:
+        dict: usuarios, consultas, antes e depois (plano, mediana_ms, p95_ms, maior_ms)
+    """
+    with tempfile.TemporaryDirectory() as pasta:
+        copia = Path(pasta) / DB_PATH.name
+        shutil.copy2(DB_PATH, copia)
+        conn = sqlite3.connect(copia)
+        try:
+            conn.execute("DROP INDEX IF EXISTS idx_usuarios_email_lower")
+            ids = _povoar(conn, usuarios)
+            sorteio = random.Random(semente)
+            amostra = [
+                (f"USUARIO{uid}@Empresa{uid % 50}.com.br", f"senha{uid}")
+                for uid in sorteio.sample(ids, min(consultas, len(ids)))
+            ]
+            antes = _medir(conn, amostra)
+            aplicar_migracoes(conn=conn)
+            depois = _medir(conn, amostra)
+        finally:
+            conn.close()
+    return {'usuarios': usuarios, 'consultas': len(amostra), 'antes': antes, 'depois': depois}
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+
+    def _valor(opcao, padrao):
+        return argumentos[argumentos.index(opcao) + 1] if opcao in argumentos else padrao
+
+    resultado = executar(
+        usuarios=int(_valor('--usuarios', 100_000)),
+        consultas=int(_valor('--consultas', 200)),
+        semente=int(_valor('--semente', 1)),
+    )
+    print(f"{resultado['usuarios']} usuários extras, {resultado['consultas']} logins por fase")
+    for fase in ('antes', 'depois'):
+        medida = resultado[fase]
+        print(f"  {fase}: {' | '.join(medida['plano'])}")
+        print(f"    mediana {medida['mediana_ms']} ms, p95 {medida['p95_ms']} ms, maior {medida['maior_ms']} ms")
@@ -0,0 +1,158 @@
+# calculo/condicoes.py
+# Tabelas de mapeamento das células condicaoH (resposta do selectbox -> valor), compiladas uma vez por versão do template
+# Data: 19/10/2026 - Hora: 09:30
+
+import threading
+
+from banco.templates import obter_template
+from banco.valores import buscar_valores
+
+# Cada condicaoH do template guarda no math_element o selectbox de que
+# depende e no select_element o mapeamento "10 pontos:10|20 pontos:20|...".
+# O mapeamento é igual para todos os usuários: aqui ele vira um dicionário
+# uma única vez por template carregado (muda quando o template muda, como o
+# grafo de calculo/grafo.py), em vez de ser dividido e convertido a cada
+# disparo. Mapeamento malformado (par com mais de um ':' ou valor não
+# numérico) fica inválido por inteiro e a célula não é atualizada, como antes.
+# As respostas dos selectboxes vêm da unidade de trabalho da passada (valor
+# pendente ou linha lida pela página); só as que a página não leu são
+# buscadas, todas numa consulta.
+_MAX_TABELAS = 8  # templates (bancos) com mapeamentos em memória
+_AUSENTE = object()
+
+_lock = threading.Lock()
+_tabelas = {}  # id(template) -> (template, {condicaoH: (selectbox, mapeamento ou None)})
+_ESTATISTICAS = {
+    'compilacoes': 0,           # templates compilados
+    'mapeamentos': 0,           # condicaoH compiladas (somadas entre compilações)
+    'invalidos': 0,             # mapeamentos malformados
+    'resolucoes': 0,            # respostas convertidas em valor
+    'sem_correspondencia': 0,   # resposta ausente ou fora do mapeamento
+    'respostas_da_passada': 0,  # respostas lidas da unidade de trabalho (sem consulta)
+    'respostas_consultadas': 0, # respostas que a página não tinha lido
+    'consultas': 0,             # consultas em lote dessas respostas
+}
+
+
+def compilar_mapeamento(texto):
+    """
+    Converte "rótulo:valor|rótulo:valor|..." em dicionário.
+
+    Returns:
+        dict|None: {rótulo: float}; None se o texto estiver malformado
+    """
+    mapeamento = {}
+    for par in str(texto).strip('"').split('|'):
+        if ':' not in par:
+            continue
+        try:
+            chave, valor = par.split(':')
+            mapeamento[chave.strip()] = float(valor.strip())
+        except ValueError:
+            return None
+    return mapeamento
+
+
+def obter_condicoes(cursor, tabela='forms_tab'):
+    """
+    Retorna as condicaoH do template com o mapeamento já compilado.
+
+    Args:
+        cursor: Cursor do banco de dados
+        tabela (str): forms_tab ou forms_resultados
+
+    Returns:
+        dict: {condicaoH: (selectbox, mapeamento)} com mapeamento None se malformado
+    """
+    template = obter_template(cursor, tabela)
+    with _lock:
+        item = _tabelas.get(id(template))
+        if item is not None and item[0] is template:
+            return item[1]
+
+    indices = template['indices']
+    condicoes = {}
+    invalidos = 0
+    for linha in template['linhas']:
+        nome, selectbox, texto = (linha[indices['name_element']], linha[indices['math_element']],
+                                  linha[indices['select_element']])
+        if linha[indices['type_element']] != 'condicaoH' or not nome or not selectbox or not texto:
+            continue
+        mapeamento = compilar_mapeamento(texto)
+        invalidos += mapeamento is None
+        condicoes[nome] = (str(selectbox).strip(), mapeamento)
+
+    with _lock:
+        if len(_tabelas) >= _MAX_TABELAS:
+            _tabelas.clear()
+        _tabelas[id(template)] = (template, condicoes)
+        _ESTATISTICAS['compilacoes'] += 1
+        _ESTATISTICAS['mapeamentos'] += len(condicoes)
+        _ESTATISTICAS['invalidos'] += invalidos
+    return condicoes
+
+
+def carregar_respostas(cursor, uow, user_id, selectboxes, tabela='forms_tab'):
+    """
+    Respostas (str_element) dos selectboxes do usuário.
+
+    Args:
+        cursor: Cursor do banco de dados
+        uow (UnidadeTrabalho): Unidade de trabalho da passada
+        user_id (int): ID do usuário
+        selectboxes (iterable): Nomes dos selectboxes
+        tabela (str): forms_tab ou forms_resultados
+
+    Returns:
+        dict: {selectbox: resposta ou None}
+    """
+    respostas, faltantes = {}, []
+    for nome in set(selectboxes):
+        resposta = uow.atual(user_id, nome, 'str_element', _AUSENTE)
+        if resposta is _AUSENTE:
+            faltantes.append(nome)
+        else:
+            respostas[nome] = resposta
+
+    if faltantes:
+        lidas = buscar_valores(cursor, tabela, user_id, faltantes, campo='str_element')
+        for nome in faltantes:
+            respostas[nome] = lidas.get(nome)
+            uow.registrar_leitura(user_id, nome, str_element=lidas.get(nome))
+
+    with _lock:
+        _ESTATISTICAS['respostas_da_passada'] += len(respostas) - len(faltantes)
+        _ESTATISTICAS['respostas_consultadas'] += len(faltantes)
+        _ESTATISTICAS['consultas'] += bool(faltantes)
+    return respostas
+
+
+def resolver(mapeamento, resposta):
+    """
+    Valor da condicaoH para a resposta do selectbox.
+
+    Args:
+        mapeamento (dict|None): Saída de compilar_mapeamento
+        resposta (str|None): str_element do selectbox
+
+    Returns:
+        float|None: Valor mapeado, ou None se não há correspondência
+    """
+    valor = None
+    if mapeamento and resposta is not None:
+        valor = mapeamento.get(str(resposta).strip())
+    with _lock:
+        _ESTATISTICAS['resolucoes' if valor is not None else 'sem_correspondencia'] += 1
+    return valor
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores dos mapeamentos.
+
+    Returns:
+        dict: compilacoes, mapeamentos, invalidos, resolucoes, sem_correspondencia,
+              respostas_da_passada, respostas_consultadas e consultas
+    """
+    with _lock:
+        return dict(_ESTATISTICAS)
@@ -0,0 +1,138 @@
+# calculo/diferencial.py
+# Conferência diferencial e benchmark do núcleo de fórmulas: calcular (página e recálculo por usuário) x avaliar_vetor (lote)
+# Data: 19/10/2026 - Hora: 07:30
+# comando: uv run python -m calculo.diferencial [--amostras N] [--semente S] [--sem-banco]
+
+import random
+import sys
+import time
+
+import numpy as np
+
+from banco.snapshot import snapshot_leitura
+from banco.templates import obter_template, tipos_do_template
+from calculo.formulas import ErroFormula, calcular, compilar, formula_de_data
+from calculo.grafo import TIPOS_FORMULA
+from calculo.vetorial import avaliar_vetor
+
+# O corpus reúne todo math_element de fórmula dos templates (forms_tab e
+# forms_resultados) e os casos de borda abaixo. Para cada fórmula são
+# sorteados conjuntos de valores das referências (zeros, NULL, negativos,
+# frações e valores grandes) e o resultado escalar de calcular (usado pela
+# página e por form_model_recalc) é comparado, amostra por amostra, com o de
+# avaliar_vetor (usado por calculo/vetorial.py e calculo/recalculo.py). Uma
+# divergência significa que a página e o recálculo em lote gravariam valores
+# diferentes para o mesmo usuário. O código de saída é 1 se houver divergência;
+# tests/test_formulas.py roda a mesma conferência numa cópia do banco.
+CASOS_BORDA = (
+    '10', '0,5', 'A1', '-A1', 'A1+A12', 'A12-A1', 'A1*A12/A2', 'A1/0', 'A1/(A2-A2)',
+    '(A1+A2)/(A3+0,0000000001)', 'A1**2', 'A1**0,5', '2**A1', '-A1**2', 'A1-B1',
+    'Insumos!D10*A1', 'AB12+A1', '1,5*(A1-A2)/3', 'A1/A2/A3', 'A1-A2-A3', 'D1-D2',
+)
+_DATAS = ('D1', 'D2')  # células tratadas como input_data nos casos de borda
+
+_VALORES = (0.0, None, 1.0, -1.0, 0.5, -0.25, 2.0, 3.0, 10.0, 0.0004, 0.0005, 0.0015, 1e-12,
+            123.5, 124.5, -2.5, 99999.999, 1e6)
+
+
+def montar_corpus(cursor=None):
+    """
+    Textos a conferir: casos de borda e, com cursor, as fórmulas dos templates.
+
+    Returns:
+        list[tuple]: (origem, texto, data) com data = formula_de_data do texto
+    """
+    corpus = [('borda', texto, formula_de_data(texto, lambda nome: 'input_data' if nome in _DATAS else None))
+              for texto in CASOS_BORDA]
+    if cursor is None:
+        return corpus
+    for tabela in ('forms_tab', 'forms_resultados'):
+        template = obter_template(cursor, tabela)
+        tipo = tipos_do_template(cursor, tabela)
+        indices = template['indices']
+        vistos = set()
+        for linha in template['linhas']:
+            texto = linha[indices['math_element']]
+            if linha[indices['type_element']] in TIPOS_FORMULA and texto and texto not in vistos:
+                vistos.add(texto)
+                corpus.append((tabela, str(texto), formula_de_data(str(texto), tipo)))
+    return corpus
+
+
+def _amostras(referencias, quantidade, sorteio):
+    """Valores das referências por amostra: a primeira com tudo zero, as demais sorteadas."""
+    amostras = [{ref: 0.0 for ref in referencias}]
+    for _ in range(quantidade - 1):
+        amostras.append({
+            ref: sorteio.choice(_VALORES) if sorteio.random() < 0.5 else round(sorteio.uniform(-1000, 1000), 3)
+            for ref in referencias
+        })
+    return amostras
+
+
+def conferir(corpus, amostras=200, semente=1):
+    """
+    Compara calcular e avaliar_vetor em todas as amostras e mede os dois.
+
+    Args:
+        corpus (list): Saída de montar_corpus
+        amostras (int): Conjuntos de valores por fórmula
+        semente (int): Semente do sorteio (conferência reproduzível)
+
+    Returns:
+        dict: formulas, invalidas, comparacoes, divergencias (até 20 exemplos),
+              total_divergencias, escalar_us (por avaliação) e vetor_ns (por célula)
+    """
+    sorteio = random.Random(semente)
+    relatorio = {'formulas': len(corpus), 'invalidas': 0, 'comparacoes': 0, 'divergencias': [],
+                 'total_divergencias': 0, 'escalar_us': 0.0, 'vetor_ns': 0.0}
+    tempo_escalar = tempo_vetor = 0.0
+    for origem, texto, data in corpus:
+        try:
+            referencias = compilar(texto).referencias
+        except ErroFormula:
+            relatorio['invalidas'] += 1
+            referencias = ()
+        conjuntos = _amostras(referencias, amostras, sorteio)
+
+        inicio = time.perf_counter()
+        escalares = [calcular(texto, valores, data) for valores in conjuntos]
+        tempo_escalar += time.perf_counter() - inicio
+
+        colunas = {ref: np.array([v[ref] or 0.0 for v in conjuntos], dtype=float) for ref in referencias}
+        inicio = time.perf_counter()
+        vetor = avaliar_vetor(texto, colunas, len(conjuntos), data)
+        tempo_vetor += time.perf_counter() - inicio
+
+        for valores, escalar, vetorial in zip(conjuntos, escalares, vetor.tolist()):
+            relatorio['comparacoes'] += 1
+            if escalar != vetorial and not (abs(escalar) == float('inf') and escalar == vetorial):
+                relatorio['total_divergencias'] += 1
+                if len(relatorio['divergencias']) < 20:
+                    relatorio['divergencias'].append(
+                        {'origem': origem, 'formula': texto, 'valores': valores,
+                         'calcular': escalar, 'avaliar_vetor': vetorial})
+    if relatorio['comparacoes']:
+        relatorio['escalar_us'] = round(tempo_escalar / relatorio['comparacoes'] * 1e6, 3)
+        relatorio['vetor_ns'] = round(tempo_vetor / relatorio['comparacoes'] * 1e9, 1)
+    return relatorio
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+
+    def _valor(opcao, padrao):
+        return argumentos[argumentos.index(opcao) + 1] if opcao in argumentos else padrao
+
+    if '--sem-banco' in argumentos:
+        corpus_atual = montar_corpus()
+    else:
+        # Conexão somente leitura: a conferência não altera o banco (nem o modo do journal)
+        with snapshot_leitura() as conexao:
+            corpus_atual = montar_corpus(conexao.cursor())
+    resultado = conferir(corpus_atual, amostras=int(_valor('--amostras', 200)), semente=int(_valor('--semente', 1)))
+    for divergencia in resultado['divergencias']:
+        print(divergencia)
+    resultado.pop('divergencias')
+    print(resultado)
+    sys.exit(1 if resultado['total_divergencias'] else 0)
@@ -0,0 +1,332 @@
+# calculo/formulas.py
+# Compilador das fórmulas de math_element: análise uma única vez, validação das referências e função reutilizável por texto
+# Data: 19/10/2026 - Hora: 03:30
+
+import itertools
+import re
+import threading
+
+# As fórmulas usam números (vírgula ou ponto decimal), referências a células
+# (A12, AB3, Insumos!D10), + - * / ** e parênteses. O texto é dividido em
+# tokens e analisado uma vez (descida recursiva) em uma árvore de tuplas; a
+# árvore vira uma expressão Python gerada só a partir de nós validados
+# (números, nomes de célula como texto e operadores) e compilada em uma
+# função valores -> float. A função fica em cache pelo texto da fórmula, e
+# cada avaliação é uma chamada direta, sem regex nem eval de texto.
+#
+# Semântica: referência sem valor ou com valor NULL vale 0.0 e a fórmula
+# segue com as demais células; toda divisão por número com |y| < 1e-10
+# resulta 0.0, em qualquer ponto da fórmula. Diferenças para as antigas
+# versões com eval (re.sub + safe_div por regex): lá um valor NULL virava o
+# texto 'None' e a fórmula inteira valia 0.0, e safe_div só cobria divisões
+# entre número e número ou parênteses simples - as demais (ex.: A1/A2/A3 ou
+# divisor com parênteses aninhados) levantavam ZeroDivisionError e a fórmula
+# inteira valia 0.0. Agora só a célula NULL ou a divisão por zero vale 0.0.
+_RE_TOKEN = re.compile(r"""
+    (?P<espaco>\s+)
+  | (?P<numero>\d+(?:[.,]\d+)?|[.,]\d+)
+  | (?P<ref>(?:Insumos!)?[A-Z]+[0-9]+)
+  | (?P<op>\*\*|[-+*/()])
+""", re.VERBOSE)
+
+# Diferença entre duas células input_data (A1 - B2): resultado em meses
+_RE_FORMULA_DATA = re.compile(r'^\s*([A-Z][0-9]+)\s*-\s*([A-Z][0-9]+)\s*$')
+DIAS_POR_MES = 30.44
+
+_MAX_FORMULAS = 4096  # textos distintos em cache (o template tem dezenas)
+
+_ids = itertools.count(1)  # id das compilações (não reaproveitado, ao contrário de id())
+_cache_lock = threading.Lock()
+_cache = {}  # texto -> Formula ou ErroFormula
+_ESTATISTICAS = {
+    'compilacoes': 0,   # textos analisados e compilados
+    'acertos': 0,       # compilações atendidas pelo cache
+    'erros': 0,         # textos inválidos (sintaxe)
+}
+
+
+class ErroFormula(ValueError):
+    """Fórmula com sintaxe inválida (posicao: índice do caractere no texto)."""
+
+    def __init__(self, mensagem, texto, posicao):
+        super().__init__(f"{mensagem} na posição {posicao} de '{texto}'")
+        self.texto = texto
+        self.posicao = posicao
+
+
+def safe_div(x, y):
+    """Divisão que devolve 0.0 quando o divisor é (quase) zero."""
+    if abs(y) < 1e-10:
+        return 0.0
+    return x / y
+
+
+def tokenizar(texto):
+    """
+    Divide a fórmula em tokens.
+
+    Returns:
+        list[tuple]: (tipo, valor, posicao) com tipo 'numero', 'ref' ou 'op'
+    """
+    tokens = []
+    posicao = 0
+    while posicao < len(texto):
+        match = _RE_TOKEN.match(texto, posicao)
+        if not match:
+            raise ErroFormula(f"caractere inesperado '{texto[posicao]}'", texto, posicao)
+        tipo = match.lastgroup
+        if tipo != 'espaco':
+            tokens.append((tipo, match.group(), posicao))
+        posicao = match.end()
+    return tokens
+
+
+class _Analisador:
+    """Descida recursiva: expr := termo (+|- termo)*, termo := unario (*|/ unario)*,
+    unario := (+|-) unario | potencia, potencia := atomo (** unario)?"""
+
+    def __init__(self, texto):
+        self.texto = texto
+        self.tokens = tokenizar(texto)
+        self.indice = 0
+
+    def _atual(self):
+        return self.tokens[self.indice] if self.indice < len(self.tokens) else (None, None, len(self.texto))
+
+    def _consumir(self, *operadores):
+        tipo, valor, _ = self._atual()
+        if tipo == 'op' and valor in operadores:
+            self.indice += 1
+            return valor
+        return None
+
+    def analisar(self):
+        if not self.tokens:
+            raise ErroFormula("fórmula vazia", self.texto, 0)
+        arvore = self._expr()
+        tipo, valor, posicao = self._atual()
+        if tipo is not None:
+            raise ErroFormula(f"'{valor}' inesperado", self.texto, posicao)
+        return arvore
+
+    def _expr(self):
+        no = self._termo()
+        while (op := self._consumir('+', '-')):
+            no = ('bin', op, no, self._termo())
+        return no
+
+    def _termo(self):
+        no = self._unario()
+        while (op := self._consumir('*', '/')):
+            no = ('bin', op, no, self._unario())
+        return no
+
+    def _unario(self):
+        if self._consumir('-'):
+            return ('neg', self._unario())
+        if self._consumir('+'):
+            return self._unario()
+        return self._potencia()
+
+    def _potencia(self):
+        no = self._atomo()
+        if self._consumir('**'):
+            return ('bin', '**', no, self._unario())
+        return no
+
+    def _atomo(self):
+        tipo, valor, posicao = self._atual()
+        if tipo == 'numero':
+            self.indice += 1
+            return ('num', float(valor.replace(',', '.')))
+        if tipo == 'ref':
+            self.indice += 1
+            return ('ref', valor)
+        if self._consumir('('):
+            no = self._expr()
+            if not self._consumir(')'):
+                raise ErroFormula("')' esperado", self.texto, self._atual()[2])
+            return no
+        raise ErroFormula("fim inesperado" if tipo is None else f"'{valor}' inesperado", self.texto, posicao)
+
+
+def analisar(texto):
+    """
+    Analisa a fórmula e devolve a árvore.
+
+    Returns:
+        tuple: ('num', float) | ('ref', nome) | ('neg', no) | ('bin', op, esq, dir)
+
+    Raises:
+        ErroFormula: Sintaxe inválida
+    """
+    return _Analisador(texto).analisar()
+
+
+def _gerar(no):
+    """Expressão Python equivalente ao nó (só números, nomes entre aspas e operadores)."""
+    tipo = no[0]
+    if tipo == 'num':
+        return repr(no[1])
+    if tipo == 'ref':
+        return f"(v.get({no[1]!r}) or 0.0)"
+    if tipo == 'neg':
+        return f"(-{_gerar(no[1])})"
+    _, op, esquerda, direita = no
+    if op == '/':
+        return f"safe_div({_gerar(esquerda)}, {_gerar(direita)})"
+    return f"({_gerar(esquerda)} {op} {_gerar(direita)})"
+
+
+def _referencias(no, encontradas):
+    if no[0] == 'ref':
+        encontradas.setdefault(no[1], None)
+    elif no[0] == 'neg':
+        _referencias(no[1], encontradas)
+    elif no[0] == 'bin':
+        _referencias(no[2], encontradas)
+        _referencias(no[3], encontradas)
+    return encontradas
+
+
+class Formula:
+    """Fórmula compilada: id (único no processo), texto, arvore, referencias (na ordem do texto)
+    e avaliar(valores) -> float."""
+
+    __slots__ = ('id', 'texto', 'arvore', 'referencias', 'avaliar')
+
+    def __init__(self, texto, arvore):
+        self.id = next(_ids)
+        self.texto = texto
+        self.arvore = arvore
+        self.referencias = tuple(_referencias(arvore, {}))
+        codigo = compile(f"lambda v: float({_gerar(arvore)})", f"<formula {texto}>", 'eval')
+        self.avaliar = eval(codigo, {'__builtins__': {}, 'float': float, 'safe_div': safe_div})
+
+    def referencias_invalidas(self, nomes):
+        """Referências que não estão em nomes (ex.: name_element do template); Insumos! fica de fora."""
+        return [ref for ref in self.referencias if not ref.startswith('Insumos!') and ref not in nomes]
+
+
+def compilar(texto):
+    """
+    Compila a fórmula (ou devolve a compilação em cache para o mesmo texto).
+
+    Args:
+        texto (str): Conteúdo de math_element
+
+    Returns:
+        Formula: Com avaliar(valores) -> float, onde valores é {name_element: número}
+
+    Raises:
+        ErroFormula: Sintaxe inválida (o erro também fica em cache)
+    """
+    texto = str(texto)
+    with _cache_lock:
+        item = _cache.get(texto)
+        if item is not None:
+            _ESTATISTICAS['acertos'] += 1
+    if item is None:
+        try:
+            item = Formula(texto, analisar(texto))
+        except ErroFormula as e:
+            print(f"⚠️ AVISO: fórmula inválida: {e}")
+            item = e
+        with _cache_lock:
+            if len(_cache) >= _MAX_FORMULAS:
+                _cache.clear()
+            _cache[texto] = item
+            _ESTATISTICAS['compilacoes'] += 1
+            if isinstance(item, ErroFormula):
+                _ESTATISTICAS['erros'] += 1
+    if isinstance(item, ErroFormula):
+        raise item
+    return item
+
+
+def arredondar(valor):
+    """
+    Arredondamento da exibição (o mesmo do antigo vaivém pelo formato brasileiro):
+    inteiro se |valor| >= 1, senão 3 casas.
+    """
+    return float(f"{valor:.0f}") if abs(valor) >= 1 else float(f"{valor:.3f}")
+
+
+def formula_de_data(texto, tipo_de):
+    """
+    Indica se a fórmula é a diferença entre duas datas (duas células input_data).
+
+    Args:
+        texto (str): Conteúdo de math_element
+        tipo_de (callable): name_element -> type_element (ex.: pelo template)
+
+    Returns:
+        tuple|None: (data_final, data_inicial) ou None
+    """
+    match = _RE_FORMULA_DATA.match(str(texto))
+    if match and all(tipo_de(ref) == 'input_data' for ref in match.groups()):
+        return match.groups()
+    return None
+
+
+def calcular(texto, valores, data=None):
+    """
+    Valor de uma célula fórmula: a regra única usada pela página, pelo recálculo
+    por usuário e pelo recálculo em lote (calculo/vetorial.py segue a mesma).
+
+    - número direto (ex.: '10' ou '0,5'): o próprio número;
+    - diferença de datas (data, ver formula_de_data): meses entre os
+      value_element das duas células (dias desde 1900), nunca negativo;
+    - demais: fórmula compilada, com o arredondamento da exibição;
+    - fórmula inválida ou erro de cálculo: 0.0.
+
+    Args:
+        texto (str): Conteúdo de math_element
+        valores (dict): {name_element: value_element} das referências
+        data (tuple, optional): Resultado de formula_de_data para esta fórmula
+
+    Returns:
+        float: Resultado
+    """
+    if isinstance(texto, (int, float)):
+        return float(texto)
+    texto = str(texto)
+    numero = texto.strip().replace(',', '.')
+    if numero.replace('.', '', 1).isdigit():
+        return float(numero)
+    try:
+        if data:
+            final, inicial = data
+            return max(0.0, ((valores.get(final) or 0.0) - (valores.get(inicial) or 0.0)) / DIAS_POR_MES)
+        resultado = compilar(texto).avaliar(valores)
+        return 0.0 if resultado != resultado else arredondar(resultado)  # NaN vale 0.0
+    except (ErroFormula, ArithmeticError, TypeError, ValueError):
+        return 0.0
+
+
+def avaliar(texto, valores):
+    """
+    Avalia a fórmula com os valores das células; fórmula inválida vale 0.0.
+
+    Args:
+        texto (str): Conteúdo de math_element
+        valores (dict): {name_element: número}
+
+    Returns:
+        float: Resultado
+    """
+    try:
+        return compilar(texto).avaliar(valores)
+    except (ErroFormula, ArithmeticError, TypeError):
+        return 0.0
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores do compilador neste processo.
+
+    Returns:
+        dict: compilacoes, acertos, erros e formulas (textos em cache)
+    """
+    with _cache_lock:
+        return dict(_ESTATISTICAS, formulas=len(_cache))
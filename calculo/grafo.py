@@ -0,0 +1,229 @@
+# calculo/grafo.py
+# Grafo de dependências das células de forms_tab (fórmulas e condicaoH) com ordem topológica, ciclos e propagação de alterações
+# Data: 19/10/2026 - Hora: 04:30
+# comando: uv run python -m calculo.grafo   (resumo do grafo do template no banco principal)
+
+import sys
+import threading
+from collections import deque
+
+from banco.templates import obter_template
+from calculo.formulas import ErroFormula, compilar
+
+# As arestas saem do template (user_id = 0), igual para todos os usuários:
+# uma fórmula (formula/formulaH) depende das células citadas no math_element,
+# e uma condicaoH depende do selectbox indicado no seu math_element. Alterar
+# uma resposta marca como sujas só as células que dependem dela, direta ou
+# indiretamente, e devolve essas células em ordem topológica para o
+# recálculo, como numa planilha. Células em ciclo (ou que dependem de um
+# ciclo) ficam fora da ordem e geram aviso na construção do grafo. O grafo
+# fica em cache junto com o template carregado: muda quando o template muda.
+TIPOS_FORMULA = ('formula', 'formulaH')
+TIPOS_CALCULADOS = TIPOS_FORMULA + ('condicaoH',)
+
+_MAX_GRAFOS = 8  # templates (bancos) com grafo em memória
+
+_lock = threading.Lock()
+_grafos = {}  # id(template) -> (template, GrafoCelulas)
+_propagacoes = deque(maxlen=200)  # (alteradas, tocadas) das últimas propagações
+_ESTATISTICAS = {
+    'grafos_construidos': 0,
+    'propagacoes': 0,
+    'celulas_alteradas': 0,     # células informadas como alteradas
+    'celulas_tocadas': 0,       # células recalculadas por causa delas
+    'maior_propagacao': 0,
+}
+
+
+class GrafoCelulas:
+    """
+    Dependências entre as células calculadas de um template.
+
+    Atributos:
+        tipos (dict): célula calculada -> type_element
+        expressoes (dict): célula calculada -> math_element
+        dependencias (dict): célula calculada -> tuple das células que ela lê
+        dependentes (dict): célula -> list das células calculadas que a leem
+        ordem (list): células calculadas em ordem topológica (sem as afetadas por ciclos)
+        ciclos (list[list]): componentes com dependência circular
+    """
+
+    def __init__(self, linhas, indices):
+        posicao_nome = indices['name_element']
+        posicao_tipo = indices['type_element']
+        posicao_math = indices['math_element']
+
+        self.tipos = {}
+        self.expressoes = {}
+        self.dependencias = {}
+        self.dependentes = {}
+        for linha in linhas:
+            nome, tipo, expressao = linha[posicao_nome], linha[posicao_tipo], linha[posicao_math]
+            if not nome or tipo not in TIPOS_CALCULADOS or not expressao:
+                continue
+            expressao = str(expressao).strip()
+            if tipo == 'condicaoH':
+                referencias = (expressao,)
+            else:
+                try:
+                    referencias = compilar(expressao).referencias
+                except ErroFormula:
+                    referencias = ()  # aviso já registrado pelo compilador
+            self.tipos[nome] = tipo
+            self.expressoes[nome] = expressao
+            self.dependencias[nome] = referencias
+            for referencia in referencias:
+                self.dependentes.setdefault(referencia, []).append(nome)
+
+        self.ordem, pendentes = self._ordenar()
+        self.ciclos = self._ciclos(pendentes)
+        self._posicao = {nome: i for i, nome in enumerate(self.ordem)}
+        if self.ciclos:
+            descricao = '; '.join(' -> '.join(ciclo) for ciclo in self.ciclos)
+            print(f"⚠️ AVISO: dependência circular entre células ({descricao}); "
+                  f"{len(pendentes)} célula(s) fora do recálculo incremental")
+
+    def _ordenar(self):
+        """Kahn: ordem topológica das células calculadas; devolve também as que sobraram (ciclos)."""
+        grau = {
+            nome: sum(1 for ref in referencias if ref in self.tipos)
+            for nome, referencias in self.dependencias.items()
+        }
+        fila = deque(nome for nome, g in grau.items() if g == 0)
+        ordem = []
+        while fila:
+            nome = fila.popleft()
+            ordem.append(nome)
+            for dependente in self.dependentes.get(nome, ()):
+                grau[dependente] -= 1
+                if grau[dependente] == 0:
+                    fila.append(dependente)
+        ordenadas = set(ordem)
+        return ordem, [nome for nome in self.dependencias if nome not in ordenadas]
+
+    def _ciclos(self, pendentes):
+        """Componentes fortemente conexas (Tarjan) com mais de uma célula ou auto-referência."""
+        restantes = set(pendentes)
+        indice, menor, pilha, na_pilha = {}, {}, [], set()
+        ciclos = []
+
+        def visitar(nome):
+            indice[nome] = menor[nome] = len(indice)
+            pilha.append(nome)
+            na_pilha.add(nome)
+            for ref in self.dependencias.get(nome, ()):
+                if ref not in restantes:
+                    continue
+                if ref not in indice:
+                    visitar(ref)
+                    menor[nome] = min(menor[nome], menor[ref])
+                elif ref in na_pilha:
+                    menor[nome] = min(menor[nome], indice[ref])
+            if menor[nome] == indice[nome]:
+                componente = []
+                while True:
+                    topo = pilha.pop()
+                    na_pilha.discard(topo)
+                    componente.append(topo)
+                    if topo == nome:
+                        break
+                if len(componente) > 1 or nome in self.dependencias.get(nome, ()):
+                    ciclos.append(sorted(componente))
+
+        for nome in pendentes:
+            if nome not in indice:
+                visitar(nome)
+        return ciclos
+
+    def propagar(self, alteradas):
+        """
+        Marca como sujas as células que dependem (transitivamente) das alteradas.
+
+        Args:
+            alteradas (iterable): Nomes das células alteradas (respostas, inputs, datas)
+
+        Returns:
+            list: Células sujas em ordem topológica (pronta para o recálculo)
+        """
+        alteradas = list(alteradas)
+        sujas = set()
+        fila = deque(alteradas)
+        while fila:
+            for dependente in self.dependentes.get(fila.popleft(), ()):
+                if dependente not in sujas and dependente in self._posicao:
+                    sujas.add(dependente)
+                    fila.append(dependente)
+        ordenadas = sorted(sujas, key=self._posicao.__getitem__)
+        _registrar_propagacao(len(alteradas), len(ordenadas))
+        return ordenadas
+
+    def resumo(self):
+        """Contagens do grafo (células calculadas, arestas, ciclos, fora da ordem)."""
+        return {
+            'celulas_calculadas': len(self.tipos),
+            'arestas': sum(len(refs) for refs in self.dependencias.values()),
+            'ciclos': len(self.ciclos),
+            'fora_da_ordem': len(self.tipos) - len(self.ordem),
+        }
+
+
+def _registrar_propagacao(alteradas, tocadas):
+    with _lock:
+        _ESTATISTICAS['propagacoes'] += 1
+        _ESTATISTICAS['celulas_alteradas'] += alteradas
+        _ESTATISTICAS['celulas_tocadas'] += tocadas
+        _ESTATISTICAS['maior_propagacao'] = max(_ESTATISTICAS['maior_propagacao'], tocadas)
+        _propagacoes.append((alteradas, tocadas))
+
+
+def obter_grafo(cursor, tabela='forms_tab'):
+    """
+    Retorna o grafo do template da tabela (reconstruído só quando o template muda).
+
+    Args:
+        cursor: Cursor do banco de dados
+        tabela (str): forms_tab ou forms_resultados
+
+    Returns:
+        GrafoCelulas: Grafo do template atual
+    """
+    template = obter_template(cursor, tabela)
+    with _lock:
+        item = _grafos.get(id(template))
+        if item is not None and item[0] is template:
+            return item[1]
+    grafo = GrafoCelulas(template['linhas'], template['indices'])
+    with _lock:
+        if len(_grafos) >= _MAX_GRAFOS:
+            _grafos.clear()
+        _grafos[id(template)] = (template, grafo)
+        _ESTATISTICAS['grafos_construidos'] += 1
+    return grafo
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores de propagação.
+
+    Returns:
+        dict: grafos_construidos, propagacoes, celulas_alteradas, celulas_tocadas,
+              maior_propagacao, media_tocadas e ultimas (alteradas, tocadas) mais recentes
+    """
+    with _lock:
+        stats = dict(_ESTATISTICAS)
+        ultimas = list(_propagacoes)[-20:]
+    stats['media_tocadas'] = round(stats['celulas_tocadas'] / stats['propagacoes'], 2) if stats['propagacoes'] else 0.0
+    stats['ultimas'] = ultimas[::-1]
+    return stats
+
+
+if __name__ == "__main__":
+    from banco.conexao import get_connection
+    conexao = get_connection()
+    try:
+        grafo_atual = obter_grafo(conexao.cursor(), sys.argv[1] if len(sys.argv) > 1 else 'forms_tab')
+        print(grafo_atual.resumo())
+        for celula in grafo_atual.ordem:
+            print(f"  {celula} ({grafo_atual.tipos[celula]}) <- {', '.join(grafo_atual.dependencias[celula])}")
+    finally:
+        conexao.close()
@@ -0,0 +1,90 @@
+# calculo/memo.py
+# Memorização dos resultados de fórmulas por (fórmula compilada, usuário, versão das células do usuário), com limite LRU
+# Data: 19/10/2026 - Hora: 08:30
+
+import threading
+from collections import OrderedDict
+
+from config import FORMULAS_MEMO_MAX
+from banco.valores import marcar_alterado, versao_valores
+
+# Antes o resultado ficava em st.cache_data(ttl=300), com chave no texto da
+# fórmula, no dicionário de valores (serializado e com hash a cada chamada) e
+# no usuário: uma entrada por combinação de respostas, descartada pelo
+# relógio. Aqui a chave é (id da fórmula compilada, células de data, usuário,
+# versão das células do usuário em banco/valores.py). Um acerto dispensa a
+# consulta dos valores e o cálculo. A versão muda a cada alteração registrada
+# ou gravada neste processo, então um resultado nunca é servido com entradas
+# diferentes das usadas no cálculo; entradas de versões antigas não são mais
+# acessadas e saem pelo limite LRU (FORMULAS_MEMO_MAX). Gravações feitas por
+# outro processo (recálculo em lote, outra instância) não mudam a versão
+# local; por isso o formulário invalida o usuário antes do recálculo completo
+# da primeira passada de cada sessão.
+_lock = threading.Lock()
+_entradas = OrderedDict()  # chave -> resultado
+_ESTATISTICAS = {
+    'acertos': 0,
+    'faltas': 0,           # resultados calculados
+    'descartados': 0,      # removidos pelo limite de tamanho (LRU)
+    'limpezas': 0,
+}
+
+
+def memorizar(formula, user_id, calcular_valor, data=None):
+    """
+    Retorna o resultado memorizado da fórmula para o usuário ou calcula e guarda.
+
+    Args:
+        formula (Formula): Fórmula compilada (calculo.formulas.compilar)
+        user_id (int): ID do usuário
+        calcular_valor (callable): Sem argumentos; busca os valores e calcula (só em falta)
+        data (tuple, optional): Resultado de formula_de_data (faz parte da chave)
+
+    Returns:
+        float: Resultado
+    """
+    chave = (formula.id, data, user_id, versao_valores(user_id))
+    with _lock:
+        if chave in _entradas:
+            _entradas.move_to_end(chave)
+            _ESTATISTICAS['acertos'] += 1
+            return _entradas[chave]
+        _ESTATISTICAS['faltas'] += 1
+
+    valor = calcular_valor()
+    with _lock:
+        _entradas[chave] = valor
+        while len(_entradas) > max(FORMULAS_MEMO_MAX, 1):
+            _entradas.popitem(last=False)
+            _ESTATISTICAS['descartados'] += 1
+    return valor
+
+
+def invalidar(user_id=None):
+    """
+    Descarta os resultados do usuário (muda a versão das células dele).
+
+    Args:
+        user_id (int, optional): Usuário. Se None, descarta todos e libera a memória
+    """
+    marcar_alterado(user_id)
+    if user_id is None:
+        with _lock:
+            _entradas.clear()
+            _ESTATISTICAS['limpezas'] += 1
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores da memorização.
+
+    Returns:
+        dict: acertos, faltas, descartados, limpezas, entradas, maximo e taxa_acerto
+    """
+    with _lock:
+        stats = dict(_ESTATISTICAS)
+        stats['entradas'] = len(_entradas)
+    stats['maximo'] = FORMULAS_MEMO_MAX
+    consultas = stats['acertos'] + stats['faltas']
+    stats['taxa_acerto'] = round(stats['acertos'] / consultas, 3) if consultas else 0.0
+    return stats
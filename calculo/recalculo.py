@@ -0,0 +1,200 @@
+# calculo/recalculo.py
+# Recálculo das fórmulas fora do Streamlit: usuários divididos entre processos, gravação por um único gravador em lote
+# Data: 19/10/2026 - Hora: 06:30
+# comando: uv run python -m calculo.recalculo [--empresa NOME] [--de ID] [--ate ID] [--processos N] [--dry-run] [--listar]
+
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import RECALC_LOTE_GRAVACAO, RECALC_PROCESSOS, RECALC_USUARIOS_POR_TAREFA
+from banco.backends import get_backend
+from banco.conexao import get_connection
+from banco.shards import ativo as shards_ativos, listar_shards
+from calculo.vetorial import calcular_alteracoes, gravar_alteracoes
+
+# Os usuários escolhidos (todos, uma empresa ou uma faixa de user_id) são
+# separados por banco (principal ou shard da empresa) e divididos em partes
+# de RECALC_USUARIOS_POR_TAREFA. Cada processo do pool mantém uma conexão de
+# leitura por banco e calcula a sua parte com calculo/vetorial.py (matriz
+# NumPy); só devolve as células que mudaram. As gravações não saem dos
+# processos de cálculo: o processo principal é o único gravador e grava em
+# transações de até RECALC_LOTE_GRAVACAO células por banco, enquanto as
+# outras partes continuam sendo calculadas. Os processos são iniciados com
+# 'spawn' para não herdar as conexões abertas do processo principal.
+_conexoes_trabalhador = {}  # destino -> conexão de leitura deste processo de cálculo
+
+
+def _calcular_parte(destino, tabela, user_ids, formulas):
+    """Executado nos processos do pool: avalia uma parte dos usuários (não grava)."""
+    conn = _conexoes_trabalhador.get(destino)
+    if conn is None:
+        conn = _conexoes_trabalhador[destino] = get_connection(destino)
+    resumo, alteracoes = calcular_alteracoes(conn.cursor(), tabela, user_ids, formulas)
+    return destino, resumo, alteracoes
+
+
+def selecionar_usuarios(empresa=None, de=None, ate=None):
+    """
+    Usuários a recalcular, agrupados pelo banco onde estão as células.
+
+    Args:
+        empresa (str, optional): Só os usuários desta empresa
+        de (int, optional): Menor user_id
+        ate (int, optional): Maior user_id
+
+    Returns:
+        dict: {destino: [user_id, ...]} com destino = caminho do banco (principal ou shard)
+    """
+    condicoes, parametros = ["user_id <> 0"], []
+    if empresa is not None:
+        condicoes.append("empresa = ?")
+        parametros.append(empresa)
+    if de is not None:
+        condicoes.append("user_id >= ?")
+        parametros.append(de)
+    if ate is not None:
+        condicoes.append("user_id <= ?")
+        parametros.append(ate)
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT user_id, empresa FROM usuarios
+            WHERE {' AND '.join(condicoes)}
+            ORDER BY user_id
+        """, parametros)
+        linhas = cursor.fetchall()
+    finally:
+        conn.close()
+
+    principal = str(get_backend().destino_padrao())
+    arquivos = {e: a for e, a, _ in listar_shards()} if shards_ativos() else {}
+    grupos = {}
+    for user_id, empresa_usuario in linhas:
+        grupos.setdefault(arquivos.get(empresa_usuario, principal), []).append(user_id)
+    return grupos
+
+
+def recalcular(empresa=None, de=None, ate=None, tabela='forms_tab', formulas=None, processos=None,
+               usuarios_por_tarefa=None, dry_run=False, progresso=None):
+    """
+    Recalcula as fórmulas dos usuários selecionados em paralelo.
+
+    Args:
+        empresa, de, ate: Filtros de selecionar_usuarios
+        tabela (str): forms_tab ou forms_resultados
+        formulas (list, optional): Só estas fórmulas e as que dependem delas
+        processos (int, optional): Processos de cálculo. Padrão: config.RECALC_PROCESSOS (0 = um por CPU)
+        usuarios_por_tarefa (int, optional): Padrão: config.RECALC_USUARIOS_POR_TAREFA
+        dry_run (bool): Se True, só conta (e devolve) as células que mudariam
+        progresso (callable, optional): Chamado após cada parte com o relatório parcial
+
+    Returns:
+        dict: usuarios_selecionados, usuarios, partes, avaliadas, alteradas, gravadas,
+              por_celula, segundos, usuarios_por_segundo, celulas_por_segundo, dry_run
+              e alteracoes (só no dry_run: [(user_id, name_element, novo)])
+    """
+    processos = processos or RECALC_PROCESSOS or os.cpu_count() or 1
+    tamanho = max(usuarios_por_tarefa or RECALC_USUARIOS_POR_TAREFA, 1)
+    inicio = time.perf_counter()
+
+    grupos = selecionar_usuarios(empresa, de, ate)
+    partes = [
+        (destino, ids[k:k + tamanho])
+        for destino, ids in grupos.items()
+        for k in range(0, len(ids), tamanho)
+    ]
+    relatorio = {'usuarios_selecionados': sum(len(ids) for ids in grupos.values()), 'usuarios': 0,
+                 'partes': len(partes), 'partes_concluidas': 0, 'avaliadas': 0, 'alteradas': 0,
+                 'gravadas': 0, 'por_celula': {}, 'segundos': 0.0, 'usuarios_por_segundo': 0.0,
+                 'celulas_por_segundo': 0.0, 'dry_run': dry_run}
+    if dry_run:
+        relatorio['alteracoes'] = []
+
+    pendentes = {}  # destino -> alterações aguardando o gravador
+    conexoes = {}   # destino -> conexão de escrita do processo principal
+
+    def gravar(destino, todas=False):
+        fila = pendentes.get(destino, [])
+        while fila and (todas or len(fila) >= RECALC_LOTE_GRAVACAO):
+            lote, pendentes[destino] = fila[:RECALC_LOTE_GRAVACAO], fila[RECALC_LOTE_GRAVACAO:]
+            fila = pendentes[destino]
+            if destino not in conexoes:
+                conexoes[destino] = get_connection(destino)
+            relatorio['gravadas'] += gravar_alteracoes(conexoes[destino], tabela, lote)
+
+    def receber(destino, resumo, alteracoes):
+        relatorio['usuarios'] += resumo['usuarios']
+        relatorio['avaliadas'] += resumo['avaliadas']
+        relatorio['alteradas'] += len(alteracoes)
+        for _, nome, _ in alteracoes:
+            relatorio['por_celula'][nome] = relatorio['por_celula'].get(nome, 0) + 1
+        if dry_run:
+            relatorio['alteracoes'].extend((uid, nome, campos['value_element']) for uid, nome, campos in alteracoes)
+        else:
+            pendentes.setdefault(destino, []).extend(alteracoes)
+            gravar(destino)
+        relatorio['partes_concluidas'] += 1
+        segundos = time.perf_counter() - inicio
+        relatorio['segundos'] = round(segundos, 3)
+        relatorio['usuarios_por_segundo'] = round(relatorio['usuarios'] / segundos, 1) if segundos else 0.0
+        relatorio['celulas_por_segundo'] = round(relatorio['avaliadas'] / segundos, 1) if segundos else 0.0
+        if progresso:
+            progresso({k: v for k, v in relatorio.items() if k not in ('por_celula', 'alteracoes')})
+
+    try:
+        if processos == 1 or len(partes) <= 1:
+            # Uma parte (ou um processo): cálculo aqui mesmo, sem pool
+            for destino, ids in partes:
+                receber(*_calcular_parte(destino, tabela, ids, formulas))
+        else:
+            contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=min(processos, len(partes)), mp_context=contexto) as executor:
+                futuros = [executor.submit(_calcular_parte, destino, tabela, ids, formulas) for destino, ids in partes]
+                for futuro in as_completed(futuros):
+                    receber(*futuro.result())
+        for destino in list(pendentes):
+            gravar(destino, todas=True)
+    finally:
+        for conn in conexoes.values():
+            conn.close()
+
+    segundos = time.perf_counter() - inicio
+    relatorio['segundos'] = round(segundos, 3)
+    return relatorio
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+
+    def _valor(opcao, padrao=None):
+        return argumentos[argumentos.index(opcao) + 1] if opcao in argumentos else padrao
+
+    def _mostrar(parcial):
+        print(f"  parte {parcial['partes_concluidas']}/{parcial['partes']}: "
+              f"{parcial['usuarios']}/{parcial['usuarios_selecionados']} usuários, "
+              f"{parcial['alteradas']} células alteradas, {parcial['usuarios_por_segundo']} usuários/s, "
+              f"{parcial['celulas_por_segundo']} células/s", flush=True)
+
+    de_id, ate_id = _valor('--de'), _valor('--ate')
+    formulas_alvo = _valor('--formulas')
+    resultado = recalcular(
+        empresa=_valor('--empresa'),
+        de=int(de_id) if de_id is not None else None,
+        ate=int(ate_id) if ate_id is not None else None,
+        tabela=_valor('--tabela', 'forms_tab'),
+        formulas=formulas_alvo.split(',') if formulas_alvo else None,
+        processos=int(_valor('--processos', 0)),
+        usuarios_por_tarefa=int(_valor('--por-tarefa', 0)),
+        dry_run='--dry-run' in argumentos,
+        progresso=_mostrar,
+    )
+    if '--listar' in argumentos:
+        for user_id, nome, novo in resultado.get('alteracoes', []):
+            print(f"{user_id}\t{nome}\t{novo}")
+    resultado.pop('alteracoes', None)
+    print(resultado)
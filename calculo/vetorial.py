@@ -0,0 +1,342 @@
+# calculo/vetorial.py
+# Recálculo das fórmulas de todos os usuários de uma vez: matriz usuários x células (NumPy) e gravação em lote
+# Data: 19/10/2026 - Hora: 05:30
+# comando: uv run python -m calculo.vetorial [--dry-run]
+
+import sys
+import threading
+import time
+
+import numpy as np
+
+from config import RECALC_LOTE_GRAVACAO
+from banco.conexao import get_connection
+from banco.retentativa import transacao_com_retentativa
+from banco.templates import obter_template, tipos_do_template
+from banco.valores import gravar_valores, modo_normalizado, tabela_valores
+from calculo.formulas import DIAS_POR_MES, ErroFormula, arredondar, compilar, formula_de_data
+from calculo.grafo import TIPOS_FORMULA, obter_grafo
+
+# Quando uma fórmula do template é corrigida, todos os respondentes precisam
+# ser recalculados. Em vez de usuário por usuário (uma consulta por célula),
+# os value_element de todos os usuários são lidos em uma consulta para uma
+# matriz densa (linha = usuário, coluna = célula lida ou calculada). Cada
+# fórmula, na ordem topológica do grafo (calculo/grafo.py), vira uma
+# expressão NumPy sobre colunas inteiras, gerada da mesma árvore do
+# compilador (calculo/formulas.py); o resultado entra na matriz antes das
+# fórmulas que dependem dele. Só as células cujo valor mudou são gravadas,
+# em transações de até RECALC_LOTE_GRAVACAO células.
+#
+# A regra de cada célula é a de calculo.formulas.calcular (a mesma da página
+# e do recálculo por usuário), aplicada a colunas: NULL ou célula ausente vale
+# 0.0, divisão por |y| < 1e-10 vale 0.0, resultado inválido (NaN, potência
+# complexa ou com estouro) vale 0.0, arredondamento da exibição, e diferença
+# entre duas datas (input_data - input_data) em meses, sem arredondamento.
+# python -m calculo.diferencial confere as duas versões em todas as fórmulas.
+_lock = threading.Lock()
+_expressoes = {}  # texto -> função colunas -> vetor (ou None se inválida)
+_ESTATISTICAS = {
+    'execucoes': 0,
+    'usuarios': 0,             # linhas da matriz (somadas entre execuções)
+    'celulas_avaliadas': 0,    # usuários x fórmulas
+    'celulas_gravadas': 0,     # valores que mudaram
+    'ultima': None,            # resumo da última execução
+}
+
+
+def _div(x, y):
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    resultado = np.divide(x, y, out=np.zeros(x.shape), where=np.abs(y) >= 1e-10)
+    # Resultado inválido no divisor (ou no dividendo, se a divisão acontece) invalida a fórmula
+    resultado[np.isnan(y) | (np.isnan(x) & (np.abs(y) >= 1e-10))] = np.nan
+    return resultado
+
+
+def _pot_escalar(x, y):
+    try:
+        resultado = x ** y
+    except (OverflowError, ZeroDivisionError):
+        return np.nan
+    return resultado if isinstance(resultado, float) else np.nan  # base negativa: complexo
+
+
+def _pot(x, y):
+    # Elemento a elemento com o ** do Python (np.power difere na última casa binária);
+    # erro ou resultado complexo vira NaN, que invalida a fórmula como no cálculo escalar
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return np.array([_pot_escalar(a, b) for a, b in zip(x.ravel().tolist(), y.ravel().tolist())],
+                    dtype=float).reshape(x.shape)
+
+
+def _gerar(no):
+    """Expressão NumPy equivalente ao nó da árvore (c: nome -> coluna)."""
+    tipo = no[0]
+    if tipo == 'num':
+        return repr(no[1])
+    if tipo == 'ref':
+        return f"c[{no[1]!r}]"
+    if tipo == 'neg':
+        return f"(-{_gerar(no[1])})"
+    _, op, esquerda, direita = no
+    if op == '/':
+        return f"_div({_gerar(esquerda)}, {_gerar(direita)})"
+    if op == '**':
+        return f"_pot({_gerar(esquerda)}, {_gerar(direita)})"
+    return f"({_gerar(esquerda)} {op} {_gerar(direita)})"
+
+
+def compilar_vetorial(texto):
+    """
+    Compila a fórmula para avaliação sobre colunas.
+
+    Args:
+        texto (str): Conteúdo de math_element
+
+    Returns:
+        callable|None: Função (colunas: dict nome -> np.ndarray) -> valor ou vetor; None se inválida
+    """
+    with _lock:
+        if texto in _expressoes:
+            return _expressoes[texto]
+    try:
+        formula = compilar(texto)
+        codigo = compile(f"lambda c: {_gerar(formula.arvore)}", f"<vetorial {texto}>", 'eval')
+        funcao = eval(codigo, {'__builtins__': {}, '_div': _div, '_pot': _pot})
+    except ErroFormula:
+        funcao = None  # aviso já registrado pelo compilador
+    with _lock:
+        _expressoes[texto] = funcao
+    return funcao
+
+
+def _arredondar(valores):
+    """Arredondamento da exibição: inteiro se |x| >= 1, senão 3 casas (exato como em arredondar)."""
+    resultado = np.round(valores)
+    pequenos = np.flatnonzero(np.abs(valores) < 1)
+    # np.round(x, 3) escala por 1000 e pode divergir do arredondamento decimal exato
+    resultado[pequenos] = [arredondar(float(v)) for v in valores[pequenos]]
+    return resultado
+
+
+def avaliar_vetor(texto, colunas, tamanho, data=None):
+    """
+    Avalia a fórmula para todos os usuários de uma vez (versão em colunas de calcular).
+
+    Args:
+        texto (str): Conteúdo de math_element
+        colunas (dict): name_element -> np.ndarray com os value_element (NULL = 0.0)
+        tamanho (int): Quantidade de usuários (linhas)
+        data (tuple, optional): Resultado de formula_de_data para esta fórmula
+
+    Returns:
+        np.ndarray: Resultado por usuário
+    """
+    zeros = np.zeros(tamanho)
+    colunas = colunas if isinstance(colunas, _Colunas) else _Colunas(colunas, zeros)
+    numero = str(texto).strip().replace(',', '.')
+    if numero.replace('.', '', 1).isdigit():
+        return np.full(tamanho, float(numero))
+    with np.errstate(all='ignore'):
+        if data:
+            final, inicial = data
+            return np.maximum((colunas[final] - colunas[inicial]) / DIAS_POR_MES, 0.0)
+        funcao = compilar_vetorial(str(texto))
+        if funcao is None:
+            return zeros
+        resultado = np.broadcast_to(np.asarray(funcao(colunas), dtype=float), zeros.shape).copy()
+        resultado[np.isnan(resultado)] = 0.0
+        return _arredondar(resultado)
+
+
+def _numero(valor):
+    try:
+        return float(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _carregar_matriz(cursor, tabela, nomes, user_ids):
+    """
+    Lê os value_element das células para a matriz.
+
+    Returns:
+        tuple: (usuarios: list, matriz: np.ndarray usuários x nomes, nulos: np.ndarray bool)
+    """
+    coluna = {nome: j for j, nome in enumerate(nomes)}
+    marcadores = ','.join(['?'] * len(nomes))
+    filtro, parametros = "", list(nomes)
+    if user_ids is not None:
+        filtro = f" AND user_id IN ({','.join(['?'] * len(user_ids))})"
+        parametros += list(user_ids)
+
+    if modo_normalizado():
+        # Padrões do template; o usuário só tem as células que alterou
+        template = obter_template(cursor, tabela)
+        posicao_valor = template['indices']['value_element']
+        padrao = [_numero(template['por_nome'][n][posicao_valor]) if n in template['por_nome'] else None
+                  for n in nomes]
+        cursor.execute(f"""
+            SELECT user_id, name_element, value_element
+            FROM {tabela_valores(tabela)}
+            WHERE name_element IN ({marcadores}){filtro}
+        """, parametros)
+    else:
+        padrao = [None] * len(nomes)
+        # ORDER BY ID_element: em nomes duplicados prevalece a linha mais recente
+        cursor.execute(f"""
+            SELECT user_id, name_element, value_element
+            FROM {tabela}
+            WHERE user_id <> 0 AND name_element IN ({marcadores}){filtro}
+            ORDER BY ID_element
+        """, parametros)
+    linhas = cursor.fetchall()
+
+    usuarios = sorted({linha[0] for linha in linhas})
+    linha_usuario = {user_id: i for i, user_id in enumerate(usuarios)}
+    nulos = np.tile(np.array([p is None for p in padrao], dtype=bool), (len(usuarios), 1))
+    matriz = np.tile(np.array([p or 0.0 for p in padrao], dtype=float), (len(usuarios), 1))
+    for user_id, nome, valor in linhas:
+        i, j = linha_usuario[user_id], coluna[nome]
+        numero = _numero(valor)
+        matriz[i, j] = numero or 0.0
+        nulos[i, j] = numero is None
+    return usuarios, matriz, nulos
+
+
+class _Colunas(dict):
+    """Colunas da matriz por nome; referência sem coluna (ex.: Insumos!) vale 0.0."""
+
+    def __init__(self, colunas, zeros):
+        super().__init__(colunas)
+        self._zeros = zeros
+
+    def __missing__(self, nome):
+        return self._zeros
+
+
+def calcular_alteracoes(cursor, tabela='forms_tab', user_ids=None, formulas=None):
+    """
+    Avalia as fórmulas sobre a matriz e devolve as células cujo valor mudou (não grava).
+
+    Args:
+        cursor: Cursor do banco de dados
+        tabela (str): forms_tab ou forms_resultados
+        user_ids (list, optional): Só estes usuários. Padrão: todos com dados na tabela
+        formulas (list, optional): Só estas fórmulas e as que dependem delas
+
+    Returns:
+        tuple: (resumo: dict com usuarios, formulas, avaliadas, alteradas, tempo_carga e tempo_calculo,
+                alteracoes: list [(user_id, name_element, {'value_element': novo})] para gravar_valores)
+    """
+    inicio = time.perf_counter()
+    grafo = obter_grafo(cursor, tabela)
+    tipo = tipos_do_template(cursor, tabela)
+    celulas = set(grafo.ordem if formulas is None else grafo.propagar(formulas) + list(formulas))
+    alvo = [nome for nome in grafo.ordem if nome in celulas and grafo.tipos[nome] in TIPOS_FORMULA]
+    nomes = list(dict.fromkeys(
+        ref for nome in alvo for ref in (nome,) + tuple(grafo.dependencias[nome])
+    ))
+    resumo = {'usuarios': 0, 'formulas': len(alvo), 'avaliadas': 0, 'alteradas': 0,
+              'tempo_carga': 0.0, 'tempo_calculo': 0.0}
+    if not alvo or (user_ids is not None and not user_ids):
+        return resumo, []
+
+    usuarios, matriz, nulos = _carregar_matriz(cursor, tabela, nomes, user_ids)
+    resumo['usuarios'] = len(usuarios)
+    resumo['tempo_carga'] = round(time.perf_counter() - inicio, 3)
+    inicio = time.perf_counter()
+
+    coluna = {nome: j for j, nome in enumerate(nomes)}
+    zeros = np.zeros(len(usuarios))
+    # Visões das colunas: o resultado gravado na matriz já vale para as fórmulas seguintes
+    colunas = _Colunas({nome: matriz[:, j] for nome, j in coluna.items()}, zeros)
+    alteracoes = []
+    for nome in alvo:
+        j = coluna[nome]
+        antigo = matriz[:, j].copy()
+        texto = grafo.expressoes[nome]
+        novo = avaliar_vetor(texto, colunas, len(usuarios), data=formula_de_data(texto, tipo))
+        matriz[:, j] = novo
+        mudou = nulos[:, j] | (np.abs(novo - antigo) > 1e-9)
+        alteracoes.extend(
+            (usuarios[i], nome, {'value_element': float(novo[i])}) for i in np.flatnonzero(mudou)
+        )
+    resumo['avaliadas'] = len(usuarios) * len(alvo)
+    resumo['alteradas'] = len(alteracoes)
+    resumo['tempo_calculo'] = round(time.perf_counter() - inicio, 3)
+    with _lock:
+        _ESTATISTICAS['execucoes'] += 1
+        _ESTATISTICAS['usuarios'] += resumo['usuarios']
+        _ESTATISTICAS['celulas_avaliadas'] += resumo['avaliadas']
+        _ESTATISTICAS['ultima'] = dict(resumo)
+    return resumo, alteracoes
+
+
+def gravar_alteracoes(conn, tabela, alteracoes, lote=None):
+    """
+    Grava as alterações em transações de até lote células.
+
+    Args:
+        conn: Conexão do banco das células
+        tabela (str): forms_tab ou forms_resultados
+        alteracoes (list): Saída de calcular_alteracoes
+        lote (int, optional): Células por transação. Padrão: config.RECALC_LOTE_GRAVACAO
+
+    Returns:
+        int: Células gravadas
+    """
+    lote = max(lote or RECALC_LOTE_GRAVACAO, 1)
+    gravadas = 0
+    for k in range(0, len(alteracoes), lote):
+        gravadas += transacao_com_retentativa(
+            conn, 'vetorial.gravar', gravar_valores, tabela, alteracoes[k:k + lote]
+        )
+    with _lock:
+        _ESTATISTICAS['celulas_gravadas'] += gravadas
+    return gravadas
+
+
+def recalcular_todos(conn=None, tabela='forms_tab', user_ids=None, dry_run=False, formulas=None):
+    """
+    Recalcula as fórmulas de todos os usuários (ou dos informados) e grava as que mudaram.
+
+    Args:
+        conn (optional): Conexão a usar (ex.: shard). Padrão: pool do banco principal
+        tabela (str): forms_tab ou forms_resultados
+        user_ids (list, optional): Só estes usuários. Padrão: todos com dados na tabela
+        dry_run (bool): Se True, calcula e conta as mudanças sem gravar
+        formulas (list, optional): Só estas fórmulas e as que dependem delas
+
+    Returns:
+        dict: usuarios, formulas, avaliadas, alteradas, gravadas, tempo_carga,
+              tempo_calculo, tempo_gravacao e dry_run
+    """
+    propria = conn is None
+    if propria:
+        conn = get_connection()
+    try:
+        resumo, alteracoes = calcular_alteracoes(conn.cursor(), tabela, user_ids, formulas)
+        resumo.update(gravadas=0, tempo_gravacao=0.0, dry_run=dry_run)
+        if not dry_run and alteracoes:
+            inicio = time.perf_counter()
+            resumo['gravadas'] = gravar_alteracoes(conn, tabela, alteracoes)
+            resumo['tempo_gravacao'] = round(time.perf_counter() - inicio, 3)
+        return resumo
+    finally:
+        if propria:
+            conn.close()
+
+
+def get_estatisticas():
+    """
+    Retorna os contadores do recálculo em lote neste processo.
+
+    Returns:
+        dict: execucoes, usuarios, celulas_avaliadas, celulas_gravadas e ultima
+    """
+    with _lock:
+        return dict(_ESTATISTICAS)
+
+
+if __name__ == "__main__":
+    print(recalcular_todos(dry_run='--dry-run' in sys.argv))
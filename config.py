@@ -26,3 +26,89 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 # Caminho do banco de dados
 DB_PATH = DATA_DIR / 'calcrh2.db'
+
+# Parâmetros do gerenciador de conexões (banco/conexao.py)
+# Podem ser ajustados por variável de ambiente no Render
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '20000'))   # espera por lock de escrita
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))       # cache de páginas por conexão
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(128 * 1024 * 1024)))  # leitura via mmap (bytes)
+DB_POOL_IDLE_MAX = int(os.getenv('DB_POOL_IDLE_MAX', '16'))          # conexões ociosas mantidas abertas
+
+# Armazenamento dos valores dos formulários (banco/valores.py)
+# 'legado': cada usuário recebe cópia das linhas do template (user_id = 0)
+# 'normalizado': template único + tabelas <tabela>_valores só com as células alteradas
+STORAGE_MODE = os.getenv('STORAGE_MODE', 'legado')
+
+# Gravação assíncrona do log de acessos (banco/log_assincrono.py)
+LOG_FILA_MAX = int(os.getenv('LOG_FILA_MAX', '10000'))          # registros aguardando gravação (acima disso descarta)
+LOG_LOTE_MAX = int(os.getenv('LOG_LOTE_MAX', '200'))            # grava ao juntar N registros...
+LOG_INTERVALO_MS = int(os.getenv('LOG_INTERVALO_MS', '500'))    # ...ou após T ms do primeiro registro do lote
+
+# Política de retentativa para contenção do SQLite (banco/retentativa.py)
+DB_RETRY_TENTATIVAS = int(os.getenv('DB_RETRY_TENTATIVAS', '8'))     # tentativas no total (1 = sem retentativa)
+DB_RETRY_BASE_MS = int(os.getenv('DB_RETRY_BASE_MS', '50'))          # espera base, dobra a cada tentativa
+DB_RETRY_MAX_MS = int(os.getenv('DB_RETRY_MAX_MS', '2000'))          # teto de uma espera
+DB_RETRY_PRAZO_MS = int(os.getenv('DB_RETRY_PRAZO_MS', '10000'))     # prazo total da operação
+
+# Instrumentação das consultas (banco/instrumentacao.py)
+DB_INSTRUMENTACAO = os.getenv('DB_INSTRUMENTACAO', '1') == '1'      # mede cada execute/executemany
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '200'))       # acima disso vai para o log de lentas
+SLOW_QUERY_LOG = DATA_DIR / 'slow_queries.log'                       # JSON por linha, com EXPLAIN QUERY PLAN
+SLOW_QUERY_LOG_MAX_KB = int(os.getenv('SLOW_QUERY_LOG_MAX_KB', '1024'))  # acima disso o log passa a slow_queries.log.1 (um antigo é mantido)
+SLOW_QUERY_FILA_MAX = int(os.getenv('SLOW_QUERY_FILA_MAX', '1000'))      # lentas aguardando EXPLAIN e gravação (acima disso descarta)
+
+# Backend de armazenamento (banco/backends.py)
+# 'sqlite' (padrão): arquivo em DB_PATH. 'postgres': DATABASE_URL, permite várias instâncias do app
+DB_BACKEND = os.getenv('DB_BACKEND', 'sqlite').lower()
+DATABASE_URL = os.getenv('DATABASE_URL', '')
+
+# Cache de templates por processo (banco/templates.py)
+TEMPLATE_VERIFICACAO_MS = int(os.getenv('TEMPLATE_VERIFICACAO_MS', '1000'))  # intervalo mínimo entre leituras do carimbo de versão
+
+# Manutenção do banco em segundo plano (banco/manutencao.py)
+BACKUP_DIR = Path(os.getenv('BACKUP_DIR', str(DATA_DIR)))                      # pasta dos backups (deve existir)
+BACKUP_INTERVALO_H = float(os.getenv('BACKUP_INTERVALO_H', '24'))               # backup online a cada N horas (0 = desligado)
+BACKUP_MANTER = int(os.getenv('BACKUP_MANTER', '7'))                             # backups guardados (os mais antigos são apagados)
+BACKUP_PAGINAS_PASSO = int(os.getenv('BACKUP_PAGINAS_PASSO', '256'))             # páginas copiadas por passo do Connection.backup
+BACKUP_PAUSA_MS = int(os.getenv('BACKUP_PAUSA_MS', '50'))                        # pausa entre passos (libera o banco para os gravadores)
+OTIMIZAR_INTERVALO_H = float(os.getenv('OTIMIZAR_INTERVALO_H', '6'))             # ANALYZE + PRAGMA optimize a cada N horas (0 = desligado)
+
+# Arquivamento mensal do log de acessos (banco/arquivo_log.py)
+LOG_ARQUIVO_DIR = Path(os.getenv('LOG_ARQUIVO_DIR', str(DATA_DIR)))      # pasta dos arquivos log_acessos_AAAA_MM.db (deve existir)
+LOG_MESES_QUENTES = int(os.getenv('LOG_MESES_QUENTES', '3'))              # meses mantidos no banco principal (mês atual incluso)
+LOG_ARQUIVAR_INTERVALO_H = float(os.getenv('LOG_ARQUIVAR_INTERVALO_H', '24'))  # verificação de meses fechados (0 = desligado)
+
+# Provisionamento em lote de usuários (banco/provisionamento.py)
+PROVISIONAMENTO_LOTE = int(os.getenv('PROVISIONAMENTO_LOTE', '200'))   # usuários por transação ao materializar as linhas dos formulários
+
+# Gravador único opcional (banco/gravador.py)
+# '1': uma thread dona da conexão de escrita executa as gravações de todas as páginas, com group commit
+DB_GRAVADOR_UNICO = os.getenv('DB_GRAVADOR_UNICO', '0') == '1'
+GRAVADOR_FILA_MAX = int(os.getenv('GRAVADOR_FILA_MAX', '1000'))       # pedidos aguardando (acima disso a página espera)
+GRAVADOR_LOTE_MAX = int(os.getenv('GRAVADOR_LOTE_MAX', '64'))         # pedidos por commit
+GRAVADOR_JANELA_MS = float(os.getenv('GRAVADOR_JANELA_MS', '0'))      # espera extra por pedidos (0: agrupa o que chegou durante o commit anterior)
+GRAVADOR_ESPERA_MS = int(os.getenv('GRAVADOR_ESPERA_MS', '30000'))    # prazo da página esperando o resultado
+
+# Shards por empresa (banco/shards.py)
+# '1': empresas cadastradas em diretorio_shards usam o próprio arquivo; o banco principal vira diretório
+DB_SHARDING = os.getenv('DB_SHARDING', '0') == '1'
+SHARD_DIR = Path(os.getenv('SHARD_DIR', str(DATA_DIR)))          # pasta dos arquivos empresa_<nome>.db (deve existir)
+SHARD_LEITORES = int(os.getenv('SHARD_LEITORES', '8'))            # threads das leituras paralelas (monitor, administração)
+
+# Registro de mudanças das células (banco/mudancas.py)
+CDC_LOTE = int(os.getenv('CDC_LOTE', '500'))                          # mudanças entregues por lote a um consumidor
+CDC_RETENCAO_DIAS = float(os.getenv('CDC_RETENCAO_DIAS', '30'))       # mudanças mais antigas são podadas mesmo sem confirmação (0 = sem limite)
+
+# Cache dos cadastros de usuarios (banco/usuarios.py)
+USUARIOS_CACHE_TTL_S = float(os.getenv('USUARIOS_CACHE_TTL_S', '300'))  # validade de um registro (limita o atraso de gravações de outro processo)
+USUARIOS_CACHE_MAX = int(os.getenv('USUARIOS_CACHE_MAX', '5000'))       # registros mantidos (o menos usado sai primeiro)
+
+# Recálculo das fórmulas de todos os usuários em lote (calculo/vetorial.py)
+RECALC_LOTE_GRAVACAO = int(os.getenv('RECALC_LOTE_GRAVACAO', '5000'))   # células alteradas gravadas por transação
+
+# Recálculo em linha de comando (calculo/recalculo.py)
+RECALC_PROCESSOS = int(os.getenv('RECALC_PROCESSOS', '0'))                     # processos de cálculo (0 = um por CPU)
+RECALC_USUARIOS_POR_TAREFA = int(os.getenv('RECALC_USUARIOS_POR_TAREFA', '500'))  # usuários por parte entregue a um processo
+
+# Memorização dos resultados de fórmulas na página (calculo/memo.py)
+FORMULAS_MEMO_MAX = int(os.getenv('FORMULAS_MEMO_MAX', '20000'))   # resultados guardados (o menos usado sai primeiro)
@@ -13,6 +13,8 @@ import sys
 
 from pathlib import Path
 from config import DB_PATH, DATA_DIR  # Adicione esta importação
+from banco.migracoes import aplicar_migracoes_em_todos, formatar_relatorio
+from banco.shards import sincronizar_templates
 
 def clean_string(value):
     """Limpa strings de aspas e apóstrofos extras."""
@@ -337,6 +339,22 @@ def select_import_file(table_name):
         return txt_file
     return None
 
+def reaplicar_migracoes(conn):
+    """
+    Recria índices e demais objetos das migrações após reconstruir uma tabela,
+    no banco principal e nos shards de empresa, e recopia para os shards o
+    template que mudou.
+    """
+    try:
+        relatorios = aplicar_migracoes_em_todos(conn=conn)
+        for destino, relatorio in relatorios.items():
+            print(f"[{destino or 'principal'}]")
+            print(formatar_relatorio(relatorio))
+        if len(relatorios) > 1:
+            print(f"Templates sincronizados: {sincronizar_templates(somente_alterados=True)}")
+    except Exception as e:
+        print(f"Aviso: falha ao reaplicar migrações: {str(e)}")
+
 def check_database():
     """Verifica se a pasta data e o banco de dados existem."""
     root = tk.Tk()
@@ -462,6 +480,7 @@ def create_database():
                     continue
 
             conn.commit()
+            reaplicar_migracoes(conn)
             messagebox.showinfo("Sucesso", 
                 f"Dados importados com sucesso para a tabela '{table_name}'\n"
                 f"Total de registros processados: {len(df)}")
@@ -594,6 +613,7 @@ def create_database_forms():
                     continue
 
             conn.commit()
+            reaplicar_migracoes(conn)
             messagebox.showinfo("Sucesso", 
                 f"Dados importados com sucesso para a tabela '{table_name}'\n"
                 f"Total de registros processados: {len(df)}")
@@ -688,6 +708,7 @@ def create_database_usuarios():
                     continue
 
             conn.commit()
+            reaplicar_migracoes(conn)
             messagebox.showinfo("Sucesso", 
                 f"Dados importados com sucesso para a tabela '{table_name}'\n"
                 f"Total de usuários processados: {len(df)}")
@@ -6,11 +6,18 @@
 # Multi-lingua - Seletor de idioma na tela de login
 
 import streamlit as st
-import sqlite3
 from datetime import datetime, timedelta
 import time
 import sys
 from config import DB_PATH, DATA_DIR
+from banco.conexao import get_connection
+from banco.backends import banco_disponivel
+from banco.migracoes import aplicar_migracoes_em_todos, formatar_relatorio
+from banco.manutencao import iniciar_agendador
+from banco.valores import zerar_valores
+from banco.retentativa import transacao_com_retentativa
+from banco.shards import conexao_do_usuario, sincronizar_templates
+from banco.usuarios import obter_usuario, invalidar_usuario
 import os
 import streamlit.components.v1 as components
 from texto_manager import get_texto, set_user_language
@@ -96,7 +103,7 @@ def authenticate_user():
         """, unsafe_allow_html=True)
     
     # Verifica se o banco existe
-    if not DB_PATH.exists():
+    if not banco_disponivel():
         st.error(get_texto('main_057', 'Banco de dados não encontrado').format(caminho=DB_PATH))
         return False, None
         
@@ -153,8 +160,9 @@ def authenticate_user():
                 else:
                     clean_email = email.strip()
 
-                    conn = sqlite3.connect(DB_PATH)
+                    conn = get_connection()
                     cursor = conn.cursor()
+                    # LOWER(email) igual ao índice idx_usuarios_email_lower (migração 5)
                     cursor.execute("""
                         SELECT id, user_id, perfil, nome FROM usuarios WHERE LOWER(email) = LOWER(?) AND senha = ?
                     """, (clean_email, password))
@@ -200,20 +208,10 @@ def show_welcome():
         
     """, unsafe_allow_html=True)
     
-    # Buscar dados do usuário
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT email, empresa 
-        FROM usuarios 
-        WHERE user_id = ?
-    """, (st.session_state.get('user_id'),))
-    user_info = cursor.fetchone()
+    # Buscar dados do usuário (cache de usuarios: sem consulta a cada rerun)
+    user_info = obter_usuario(st.session_state.get('user_id')) or {}
     
-    # Removemos a consulta de contagem de formulários
-    conn.close()
-    
-    empresa = user_info[1] if user_info[1] is not None else "Não informada"
+    empresa = user_info.get('empresa') if user_info.get('empresa') is not None else "Não informada"
     
     # Layout em colunas usando st.columns
     col1, col2, col3 = st.columns(3)
@@ -295,7 +293,7 @@ def trocar_senha():
                 return
             
             try:
-                conn = sqlite3.connect(DB_PATH)
+                conn = get_connection()
                 cursor = conn.cursor()
                 
                 # Verificar se a senha atual está correta
@@ -310,14 +308,16 @@ def trocar_senha():
                     return
                 
                 # Atualizar a senha
-                cursor.execute("""
-                    UPDATE usuarios 
-                    SET senha = ? 
-                    WHERE user_id = ?
-                """, (nova_senha, st.session_state["user_id"]))
-                
-                conn.commit()
+                transacao_com_retentativa(
+                    conn, 'main.trocar_senha',
+                    lambda cur: cur.execute("""
+                        UPDATE usuarios 
+                        SET senha = ? 
+                        WHERE user_id = ?
+                    """, (nova_senha, st.session_state["user_id"]))
+                )
                 conn.close()
+                invalidar_usuario(st.session_state["user_id"])
                 
                 # Registrar a ação no monitor
                 registrar_acesso(
@@ -398,23 +398,21 @@ def zerar_value_element():
     if st.button(get_texto('main_033', 'Zerar Valores')):
         if confirma:
             try:
-                conn = sqlite3.connect(DB_PATH)
+                conn = conexao_do_usuario(st.session_state["user_id"])
                 cursor = conn.cursor()
                 
                 # Atualiza value_element para 0.0 para os tipos especificados
-                cursor.execute("""
-                    UPDATE forms_tab 
-                    SET value_element = 0.0 
-                    WHERE user_id = ? 
-                    AND value_element IS NOT NULL
-                    AND type_element IN ('input', 'formula', 'formulaH', 'selectbox')
-                """, (st.session_state["user_id"],))
-                
-                registros_afetados = cursor.rowcount
+                registros_afetados = transacao_com_retentativa(
+                    conn, 'main.zerar_value_element',
+                    zerar_valores, 'forms_tab', st.session_state["user_id"],
+                    ['input', 'formula', 'formulaH', 'selectbox']
+                )
                 
-                conn.commit()
                 conn.close()
                 
+                # Fórmulas são recalculadas por inteiro na próxima passada do formulário
+                st.session_state.pop(f"formulas_em_dia_{st.session_state['user_id']}", None)
+                
                 # Registra a ação no monitor
                 registrar_acesso(
                     user_id=st.session_state["user_id"],
@@ -435,6 +433,32 @@ def zerar_value_element():
         else:
             st.warning(get_texto('main_034', 'Confirme a operação para prosseguir'))
 
+@st.cache_resource
+def garantir_migracoes():
+    """
+    Aplica as migrações de esquema (índices) uma única vez por processo, no
+    banco principal e em cada shard de empresa, e recopia o template para os
+    shards cujo carimbo ficou para trás.
+    Uma falha é propagada e não fica em cache: a próxima execução tenta de novo.
+    """
+    relatorios = aplicar_migracoes_em_todos()
+    for destino, relatorio in relatorios.items():
+        if relatorio['executados']:
+            print(f"[{destino or 'principal'}]")
+            print(formatar_relatorio(relatorio))
+    if len(relatorios) > 1:
+        sincronizar_templates(somente_alterados=True)
+    return relatorios
+
+@st.cache_resource
+def iniciar_manutencao():
+    """Inicia uma única vez por processo a thread de backup/otimização do banco."""
+    try:
+        return iniciar_agendador()
+    except Exception as e:
+        print(f"⚠️ AVISO: Falha ao iniciar a manutenção do banco: {str(e)}")
+        return False
+
 def main():
     """Gerencia a navegação entre as páginas do sistema."""
     # Verifica se o diretório data existe
@@ -443,15 +467,27 @@ def main():
         st.stop()
         
     # Verifica se o banco existe
-    if not DB_PATH.exists():
+    if not banco_disponivel():
         st.error(get_texto('main_059', 'Banco de dados \'{banco}\' não encontrado. O programa não pode continuar.').format(banco=DB_PATH))
         st.stop()
+    
+    falha_migracoes = None
+    try:
+        garantir_migracoes()
+    except Exception as e:
+        # Ex.: "database is locked" na partida; a próxima execução do script tenta de novo
+        falha_migracoes = str(e)
+        print(f"⚠️ AVISO: Falha ao aplicar migrações do banco: {falha_migracoes}")
+    iniciar_manutencao()
         
     logged_in, user_profile = authenticate_user()
     
     if not logged_in:
         st.stop()
     
+    if falha_migracoes and user_profile and user_profile.lower() == "master":
+        st.error(f"Falha ao aplicar migrações do banco (nova tentativa na próxima interação): {falha_migracoes}")
+    
     # Armazenar página anterior para comparação
     if "previous_page" not in st.session_state:
         st.session_state["previous_page"] = None
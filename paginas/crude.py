@@ -6,10 +6,14 @@
 
 import streamlit as st
 import pandas as pd
-import sqlite3
 from datetime import datetime
 
 from config import DB_PATH  # Adicione esta importação
+from banco.conexao import get_connection
+from banco.backends import get_backend, info_colunas
+from banco.templates import invalidar_templates
+from banco.usuarios import invalidar_usuario
+from banco.valores import TABELAS_FORMULARIO, marcar_alterado
 from paginas.monitor import registrar_acesso  # Importação para auditoria
 
 def format_br_number(value):
@@ -24,8 +28,7 @@ def format_br_number(value):
 def get_table_analysis(cursor, table_name):
     """Analisa a estrutura e dados da tabela."""
     # Análise da estrutura
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns_info = cursor.fetchall()
+    columns_info = info_colunas(cursor, table_name)
     
     # Contagem de registros
     cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
@@ -52,6 +55,85 @@ def get_table_analysis(cursor, table_name):
         "max_user_id": max_user_id
     }
 
+def _nativo(valor):
+    """Valor do DataFrame no tipo do driver: NaN/NaT viram None e escalares NumPy viram int/float/str."""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    return valor.item() if hasattr(valor, 'item') else valor
+
+def colunas_chave(cursor, table_name):
+    """
+    Colunas que identificam a linha na gravação do editor.
+
+    Returns:
+        list: Chave primária da tabela (id em usuarios e log_acessos); nas
+              tabelas de formulário, ID_element e user_id
+    """
+    chave = [col[1] for col in info_colunas(cursor, table_name) if col[5]]
+    if table_name in TABELAS_FORMULARIO:
+        chave.append('user_id')
+    return chave
+
+def salvar_alteracoes(cursor, table_name, original, editado):
+    """
+    Grava as linhas novas e as alteradas no editor (sem commit).
+
+    Cada linha existente é localizada pela chave (colunas_chave) com os valores
+    lidos do banco, em parâmetros, então alterar a própria chave também funciona
+    e a ordem de exibição não importa. Linhas sem alteração não são gravadas.
+
+    Args:
+        cursor: Cursor do banco de dados
+        table_name (str): Tabela editada
+        original (pd.DataFrame): Linhas como lidas do banco
+        editado (pd.DataFrame): Linhas devolvidas pelo st.data_editor (novas no fim)
+
+    Returns:
+        tuple: (gravadas, erros) com a quantidade de linhas inseridas ou
+               atualizadas e as mensagens das linhas recusadas
+    """
+    columns = list(original.columns)
+    chave = colunas_chave(cursor, table_name)
+    identificador = chave[0]
+    gravadas = 0
+    erros = []
+
+    insert_query = f"""
+        INSERT INTO {table_name} ({', '.join(columns)})
+        VALUES ({', '.join(['?' for _ in columns])})
+    """
+    for _, row in editado.iloc[len(original):].iterrows():
+        if table_name in TABELAS_FORMULARIO:
+            cursor.execute(f"SELECT user_id FROM {table_name} WHERE {identificador} = ?",
+                           (_nativo(row[identificador]),))
+            existing = cursor.fetchone()
+            if existing:
+                erros.append(f"⚠️ Não é possível adicionar: O {identificador} '{row[identificador]}' "
+                             f"já existe (user_id {existing[0]})")
+                continue
+        cursor.execute(insert_query, tuple(_nativo(row[col]) for col in columns))
+        gravadas += 1
+
+    update_query = f"""
+        UPDATE {table_name}
+        SET {', '.join(f'{col} = ?' for col in columns)}
+        WHERE {' AND '.join(f'{col} = ?' for col in chave)}
+    """
+    for (_, antes), (_, depois) in zip(original.iterrows(), editado.iloc[:len(original)].iterrows()):
+        valores = tuple(_nativo(depois[col]) for col in columns)
+        if valores == tuple(_nativo(antes[col]) for col in columns):
+            continue
+        if table_name in TABELAS_FORMULARIO and _nativo(depois[identificador]) != _nativo(antes[identificador]):
+            cursor.execute(f"SELECT user_id FROM {table_name} WHERE {identificador} = ?",
+                           (_nativo(depois[identificador]),))
+            if cursor.fetchone():
+                erros.append(f"⚠️ Não é possível atualizar: O {identificador} '{depois[identificador]}' "
+                             f"já está sendo usado em outro registro")
+                continue
+        cursor.execute(update_query, valores + tuple(_nativo(antes[col]) for col in chave))
+        gravadas += 1
+    return gravadas, erros
+
 def show_crud():
     """Exibe registros administrativos em formato de tabela."""
     
@@ -136,24 +218,25 @@ def show_crud():
     if st.button("Atualizar Dados"):
         st.rerun()
 
-    # Botão para download do banco de dados
-    with open(DB_PATH, "rb") as db_file:
-        if st.download_button(
-            label="Download DB",
-            data=db_file,
-            file_name="calcrh2.db",
-            mime="application/octet-stream"
-        ):
-            # Registra o download na auditoria
-            try:
-                registrar_acesso(
-                    user_id=st.session_state.get("user_id"),
-                    programa="CRUD",
-                    acao="DOWNLOAD_DB"
-                )
-                st.success("✅ Download registrado na auditoria!")
-            except Exception as e:
-                st.warning(f"⚠️ Download realizado, mas erro ao registrar auditoria: {str(e)}")
+    # Botão para download do banco de dados (apenas no backend SQLite, que é um arquivo)
+    if get_backend().nome == 'sqlite':
+        with open(DB_PATH, "rb") as db_file:
+            if st.download_button(
+                label="Download DB",
+                data=db_file,
+                file_name="calcrh2.db",
+                mime="application/octet-stream"
+            ):
+                # Registra o download na auditoria
+                try:
+                    registrar_acesso(
+                        user_id=st.session_state.get("user_id"),
+                        programa="CRUD",
+                        acao="DOWNLOAD_DB"
+                    )
+                    st.success("✅ Download registrado na auditoria!")
+                except Exception as e:
+                    st.warning(f"⚠️ Download realizado, mas erro ao registrar auditoria: {str(e)}")
 
     # Atualiza a lista de tabelas para incluir a tabela de log_acessos
     tables = ["", "usuarios", "forms_tab", "forms_resultados", "log_acessos"]
@@ -166,7 +249,7 @@ def show_crud():
         selected_table = st.selectbox("Selecione a tabela", tables, key="table_selector")
     
     if selected_table:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         try:
@@ -174,8 +257,7 @@ def show_crud():
             analysis = get_table_analysis(cursor, selected_table)
             
             # Obtém informações das colunas aqui, antes de usar
-            cursor.execute(f"PRAGMA table_info({selected_table})")
-            columns_info = cursor.fetchall()  # Define columns_info aqui
+            columns_info = info_colunas(cursor, selected_table)  # Define columns_info aqui
             
             # Exibe informações da tabela em um expander
             with st.expander("Informações da Tabela", expanded=True):
@@ -248,8 +330,7 @@ def show_crud():
             data = cursor.fetchall()
             
             # Busca nomes das colunas
-            cursor.execute(f"PRAGMA table_info({selected_table})")
-            columns = [col[1] for col in cursor.fetchall()]
+            columns = [col[1] for col in info_colunas(cursor, selected_table)]
             
             # Cria DataFrame
             df = pd.DataFrame(data, columns=columns)
@@ -392,74 +473,29 @@ def show_crud():
                             st.error(f"⚠️ Encontradas duplicatas de ID_element no editor: {duplicates['ID_element'].tolist()}")
                             return
 
-                    # Detecta registros novos comparando o tamanho dos DataFrames
-                    if len(edited_df) > len(df):
-                        # Processa novos registros
-                        new_records = edited_df.iloc[len(df):]
-                        for _, row in new_records.iterrows():
-                            if selected_table == 'forms_tab':
-                                # Debug: mostra o ID que está tentando inserir
-                                st.write(f"Tentando inserir ID_element: {row['ID_element']}")
-                                
-                                cursor.execute("""
-                                    SELECT ID_element, rowid 
-                                    FROM forms_tab 
-                                    WHERE ID_element = ?
-                                """, (row['ID_element'],))
-                                existing = cursor.fetchone()
-                                
-                                if existing:
-                                    st.error(f"⚠️ Não é possível adicionar: O ID_element '{row['ID_element']}' já existe na linha {existing[1]}")
-                                    continue
-
-                            row_values = [row[col] for col in columns]
-                            insert_query = f"""
-                            INSERT INTO {selected_table} ({', '.join(columns)})
-                            VALUES ({', '.join(['?' for _ in columns])})
-                            """
-                            cursor.execute(insert_query, tuple(row_values))
+                    # Login compara LOWER(email) (índice idx_usuarios_email_lower): sem espaços e sem repetição ignorando maiúsculas
+                    # (linhas sem e-mail não entram na comparação)
+                    if selected_table == 'usuarios':
+                        preenchidos = edited_df['email'].notna()
+                        edited_df.loc[preenchidos, 'email'] = edited_df.loc[preenchidos, 'email'].astype(str).str.strip()
+                        normalizados = edited_df.loc[preenchidos, 'email'].str.lower()
+                        normalizados = normalizados[normalizados != '']
+                        duplicates = edited_df.loc[normalizados[normalizados.duplicated(keep=False)].index]
+                        if not duplicates.empty:
+                            st.error(f"⚠️ E-mails repetidos (ignorando maiúsculas/minúsculas): {duplicates['email'].tolist()}")
+                            return
 
-                    # Atualiza registros existentes
-                    for index, row in edited_df.iloc[:len(df)].iterrows():
-                        if selected_table == 'forms_tab':
-                            # Verifica duplicatas considerando o user_id
-                            cursor.execute("""
-                                SELECT ID_element, rowid 
-                                FROM forms_tab 
-                                WHERE ID_element = ? 
-                                    AND user_id = ?
-                                    AND ID_element != (
-                                        SELECT ID_element 
-                                        FROM forms_tab 
-                                        WHERE ID_element = ?
-                                        AND user_id = ?
-                                    )
-                            """, (row['ID_element'], row['user_id'], row['ID_element'], row['user_id']))
-                            
-                            existing = cursor.fetchone()
-                            if existing:
-                                st.error(f"⚠️ Não é possível atualizar: O ID_element '{row['ID_element']}' já está sendo usado em outro registro com o mesmo user_id")
-                                continue
+                    # Novos registros no fim; os existentes são atualizados pela chave primária
+                    _, erros = salvar_alteracoes(cursor, selected_table, df, edited_df)
+                    for erro in erros:
+                        st.error(erro)
 
-                        # Atualiza usando ID_element e user_id como identificadores
-                        if selected_table == 'forms_tab':
-                            update_query = f"""
-                            UPDATE {selected_table}
-                            SET {', '.join(f'{col} = ?' for col in columns)}
-                            WHERE ID_element = ? AND user_id = ?
-                            """
-                            values = tuple(row) + (row['ID_element'], row['user_id'])
-                        else:
-                            update_query = f"""
-                            UPDATE {selected_table}
-                            SET {', '.join(f'{col} = ?' for col in columns)}
-                            WHERE rowid = {index + 1}
-                            """
-                            values = tuple(row)
-                            
-                        cursor.execute(update_query, values)
-                    
                     conn.commit()
+                    invalidar_templates(selected_table)
+                    if selected_table == 'usuarios':
+                        invalidar_usuario()
+                    if selected_table in TABELAS_FORMULARIO:
+                        marcar_alterado()
                     st.success("Alterações salvas com sucesso!")
                     st.rerun()
                 
@@ -12,6 +12,42 @@ import platform
 from datetime import datetime
 import psutil
 
+from banco.conexao import get_estatisticas as get_estatisticas_conexoes
+from banco.unidade_trabalho import get_estatisticas as get_estatisticas_uow
+from banco.log_assincrono import get_estatisticas as get_estatisticas_log
+from banco.templates import get_estatisticas as get_estatisticas_templates
+from banco.usuarios import get_estatisticas as get_estatisticas_usuarios, invalidar_usuario
+from calculo.condicoes import get_estatisticas as get_estatisticas_condicoes
+from calculo.grafo import get_estatisticas as get_estatisticas_grafo
+from calculo.memo import get_estatisticas as get_estatisticas_memo, invalidar as invalidar_memo
+from calculo.vetorial import get_estatisticas as get_estatisticas_vetorial, recalcular_todos
+from banco.manutencao import (
+    get_estatisticas as get_estatisticas_manutencao,
+    fazer_backup,
+    otimizar as otimizar_banco,
+    compactar as compactar_banco,
+    arquivar_log,
+    podar_mudancas,
+)
+from banco.arquivo_log import get_estatisticas as get_estatisticas_arquivo_log
+from banco.provisionamento import (
+    get_estatisticas as get_estatisticas_provisionamento,
+    ler_usuarios,
+    provisionar,
+)
+from banco.retentativa import get_estatisticas as get_estatisticas_retentativa
+from banco.gravador import get_estatisticas as get_estatisticas_gravador
+from banco.shards import get_estatisticas as get_estatisticas_shards, listar_shards, ler_em_todos
+from banco.mudancas import get_estatisticas as get_estatisticas_mudancas, consumidores as listar_consumidores
+from banco.instrumentacao import (
+    get_estatisticas as get_estatisticas_consultas,
+    get_estatisticas_log_lentas,
+    ler_log_lentas,
+    limpar_estatisticas as limpar_estatisticas_consultas,
+)
+from banco.backends import get_backend
+from config import DB_SLOW_QUERY_MS, PROVISIONAMENTO_LOTE
+
 def show_diagnostics():
     """Página de diagnóstico do sistema"""
     
@@ -32,6 +68,7 @@ def show_diagnostics():
             st.write(f"Streamlit Version: {st.__version__}")
             st.write(f"OS: {platform.system()} {platform.release()}")
             st.write(f"Ambiente: {'Produção' if os.getenv('RENDER') else 'Local'}")
+            st.write(f"Banco de dados: {get_backend().nome}")
             
         with col2:
             st.subheader("Recursos")
@@ -67,6 +104,291 @@ def show_diagnostics():
             warnings.warn("Este é um warning de teste")
             st.rerun()
     
+    # Conexões com o banco de dados
+    with st.expander("Conexões com o Banco de Dados", expanded=False):
+        stats = get_estatisticas_conexoes()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Conexões Abertas", stats['aberturas'])
+        with col2:
+            st.metric("Reusos", stats['reusos'])
+        with col3:
+            st.metric("Tempo de Espera (ms)", f"{stats['tempo_espera'] * 1000:.1f}")
+        st.json(stats)
+    
+    # Gravações agrupadas por passada (unidade de trabalho)
+    with st.expander("Gravações por Passada (Unidade de Trabalho)", expanded=False):
+        stats_uow = get_estatisticas_uow()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Gravações Registradas", stats_uow['registradas'])
+        with col2:
+            st.metric("Gravações Efetivas", stats_uow['gravadas'])
+        with col3:
+            st.metric("Coalescidas", stats_uow['coalescidas'])
+        st.json(stats_uow)
+    
+    # Cache de templates (layout user_id = 0 e forms_insumos)
+    with st.expander("Cache de Templates", expanded=False):
+        stats_templates = get_estatisticas_templates()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Acertos", stats_templates['acertos'])
+        with col2:
+            st.metric("Carregamentos", stats_templates['carregamentos'])
+        with col3:
+            st.metric("Verificações de Versão", stats_templates['verificacoes'])
+        st.json(stats_templates)
+    
+    # Cache dos cadastros de usuarios (boas-vindas, idioma, análise, administração)
+    with st.expander("Cache de Usuários", expanded=False):
+        stats_usuarios = get_estatisticas_usuarios()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Taxa de Acerto", f"{stats_usuarios['taxa_acerto']:.1%}")
+        with col2:
+            st.metric("Consultas ao Banco", stats_usuarios['faltas'])
+        with col3:
+            st.metric("Registros", stats_usuarios['registros'])
+        if st.button("Limpar cache de usuários"):
+            invalidar_usuario()
+        st.json(stats_usuarios)
+    
+    # Resultados de fórmulas memorizados por (fórmula, usuário, versão das células)
+    with st.expander("Memorização de Fórmulas", expanded=False):
+        stats_memo = get_estatisticas_memo()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Taxa de Acerto", f"{stats_memo['taxa_acerto']:.1%}")
+        with col2:
+            st.metric("Entradas", f"{stats_memo['entradas']} / {stats_memo['maximo']}")
+        with col3:
+            st.metric("Descartados (LRU)", stats_memo['descartados'])
+        if st.button("Limpar memória de fórmulas"):
+            invalidar_memo()
+        st.json(stats_memo)
+    
+    # Recálculo incremental das fórmulas (grafo de dependências do template)
+    with st.expander("Grafo de Dependências", expanded=False):
+        stats_grafo = get_estatisticas_grafo()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Propagações", stats_grafo['propagacoes'])
+        with col2:
+            st.metric("Células por Alteração", stats_grafo['media_tocadas'])
+        with col3:
+            st.metric("Maior Propagação", stats_grafo['maior_propagacao'])
+        st.json(stats_grafo)
+        
+        # Mapeamentos das condicaoH (compilados por versão do template)
+        stats_condicoes = get_estatisticas_condicoes()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Mapeamentos Compilados", stats_condicoes['mapeamentos'])
+        with col2:
+            st.metric("Respostas da Passada", stats_condicoes['respostas_da_passada'])
+        with col3:
+            st.metric("Consultas de Respostas", stats_condicoes['consultas'])
+        st.json(stats_condicoes)
+    
+    # Recálculo das fórmulas de todos os usuários (após corrigir uma fórmula do template)
+    with st.expander("Recálculo das Fórmulas em Lote", expanded=False):
+        stats_vetorial = get_estatisticas_vetorial()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Execuções", stats_vetorial['execucoes'])
+        with col2:
+            st.metric("Células Avaliadas", stats_vetorial['celulas_avaliadas'])
+        with col3:
+            st.metric("Células Gravadas", stats_vetorial['celulas_gravadas'])
+        simular_recalculo = st.checkbox("Somente simular (não grava)", value=True, key="recalculo_simular")
+        if st.button("Recalcular fórmulas de todos os usuários"):
+            st.dataframe([
+                dict(resumo, banco=destino or "principal")
+                for destino, resumo in ler_em_todos(
+                    lambda conn_banco: recalcular_todos(conn=conn_banco, dry_run=simular_recalculo)
+                )
+            ], use_container_width=True)
+        st.json(stats_vetorial)
+    
+    # Gravação assíncrona do log de acessos
+    with st.expander("Log de Acessos (Gravação em Lote)", expanded=False):
+        stats_log = get_estatisticas_log()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Backlog na Fila", stats_log['backlog'])
+        with col2:
+            st.metric("Gravados", stats_log['gravados'])
+        with col3:
+            st.metric("Descartados", stats_log['descartados'] + stats_log['falhas'])
+        st.json(stats_log)
+    
+    # Manutenção do banco (backup online, ANALYZE/optimize, VACUUM INTO)
+    with st.expander("Manutenção do Banco", expanded=False):
+        stats_manut = get_estatisticas_manutencao()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Tamanho do Banco (MB)", f"{stats_manut.get('tamanho_banco', 0) / 1024 / 1024:.2f}")
+        with col2:
+            st.metric("Último Backup", stats_manut['ultimo_backup'] or "-")
+        with col3:
+            st.metric("Falhas", stats_manut['falhas'])
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("Backup agora"):
+                st.json(fazer_backup())
+        with col2:
+            if st.button("Otimizar (ANALYZE)"):
+                st.json(otimizar_banco())
+        with col3:
+            if st.button("Cópia compactada (VACUUM INTO)"):
+                st.json(compactar_banco())
+        if st.button("Arquivar meses fechados do log de acessos"):
+            st.json(arquivar_log())
+        st.json(get_estatisticas_arquivo_log())
+        
+        if stats_manut['historico']:
+            st.dataframe(stats_manut['historico'], use_container_width=True)
+        else:
+            st.info("Nenhuma tarefa de manutenção executada neste processo")
+    
+    # Provisionamento em lote: contas + linhas dos formulários antes do primeiro acesso
+    with st.expander("Provisionamento de Usuários", expanded=False):
+        stats_prov = get_estatisticas_provisionamento()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Marcas Consultadas", stats_prov['verificacoes'])
+        with col2:
+            st.metric("Cópias no Render", stats_prov['materializados_render'])
+        with col3:
+            st.metric("Provisionados em Lote", stats_prov['materializados_lote'])
+        
+        arquivo = st.file_uploader("Arquivo de usuários (TXT separado por TAB, cp1252)", type=['txt', 'tsv'])
+        lote = st.number_input("Usuários por transação", min_value=1, value=PROVISIONAMENTO_LOTE)
+        simular = st.checkbox("Somente simular (dry-run)")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Provisionar arquivo", disabled=arquivo is None):
+                usuarios = ler_usuarios(arquivo.getvalue().decode('cp1252').splitlines())
+                st.json(provisionar(usuarios, lote=int(lote), dry_run=simular))
+        with col2:
+            if st.button("Provisionar usuários existentes"):
+                st.json(provisionar(None, lote=int(lote), dry_run=simular))
+        st.json(stats_prov)
+    
+    # Gravador único (fila de gravações com group commit)
+    with st.expander("Gravador Único", expanded=False):
+        stats_gravador = get_estatisticas_gravador()
+        if not stats_gravador['habilitado']:
+            st.info("Desligado (DB_GRAVADOR_UNICO=1 para ligar): cada página grava na própria conexão")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Pedidos por Commit", stats_gravador['pedidos_por_grupo'])
+        with col2:
+            st.metric("Latência p99 (ms)", stats_gravador['latencia_p99_ms'])
+        with col3:
+            st.metric("Fila", stats_gravador['fila'])
+        st.json(stats_gravador)
+    
+    # Shards por empresa (diretório no banco principal)
+    with st.expander("Shards por Empresa", expanded=False):
+        stats_shards = get_estatisticas_shards()
+        if not stats_shards['habilitado']:
+            st.info("Desligado (DB_SHARDING=1 para ligar): todas as empresas no banco principal")
+        shards = listar_shards()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Empresas com Shard", len(shards))
+        with col2:
+            st.metric("Leituras Paralelas", stats_shards['leituras_paralelas'])
+        with col3:
+            st.metric("Falhas de Leitura", stats_shards['falhas_leitura'])
+        if shards:
+            st.dataframe([{'empresa': e, 'arquivo': a, 'criado_em': d} for e, a, d in shards],
+                         use_container_width=True)
+        st.json(stats_shards)
+    
+    # Registro de mudanças das células (CDC) e posição de cada consumidor
+    with st.expander("Registro de Mudanças (CDC)", expanded=False):
+        stats_cdc = get_estatisticas_mudancas()
+        posicoes = [
+            dict(item, banco=destino or "principal")
+            for destino, itens in ler_em_todos(lambda conn_banco: listar_consumidores(conn_banco.cursor()))
+            for item in itens
+        ]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Consumidores", len(posicoes))
+        with col2:
+            st.metric("Pendentes (máx.)", max((p['pendentes'] for p in posicoes), default=0))
+        with col3:
+            st.metric("Falhas de Consumidor", stats_cdc['falhas_consumidor'])
+        if posicoes:
+            st.dataframe(posicoes, use_container_width=True)
+        else:
+            st.info("Nenhum consumidor registrado")
+        if st.button("Podar mudanças já confirmadas"):
+            st.json(podar_mudancas())
+        st.json(stats_cdc)
+    
+    # Retentativas por ponto de chamada (contenção do lock de escrita)
+    with st.expander("Retentativas por Ponto de Chamada", expanded=False):
+        stats_retry = get_estatisticas_retentativa()
+        if stats_retry:
+            st.dataframe(
+                [{'local': local, **contadores} for local, contadores in sorted(
+                    stats_retry.items(), key=lambda item: item[1]['retentativas'], reverse=True
+                )],
+                use_container_width=True
+            )
+        else:
+            st.info("Nenhuma operação com retentativa executada ainda")
+    
+    # Consultas SQL medidas pela instrumentação
+    with st.expander("Consultas SQL (Tempo por Instrução)", expanded=False):
+        consultas = get_estatisticas_consultas()
+        if consultas:
+            st.dataframe(
+                [{
+                    'instrução': c['digital'][:120],
+                    'execuções': c['execucoes'],
+                    'total (ms)': c['total_ms'],
+                    'médio (ms)': c['medio_ms'],
+                    'p95 (ms)': c['p95_ms'],
+                    'maior (ms)': c['maior_ms'],
+                    'linhas lidas': c['linhas_retornadas'],
+                    'linhas afetadas': c['linhas_afetadas'],
+                    'lentas': c['lentas'],
+                    'principal local': max(c['locais'], key=c['locais'].get),
+                } for c in consultas],
+                use_container_width=True
+            )
+            selecionada = st.selectbox(
+                "Detalhar instrução",
+                range(len(consultas)),
+                format_func=lambda i: consultas[i]['digital'][:120]
+            )
+            st.json(consultas[selecionada])
+            if st.button("Zerar estatísticas de consultas"):
+                limpar_estatisticas_consultas()
+                st.rerun()
+        else:
+            st.info("Nenhuma consulta medida ainda")
+        
+        st.subheader(f"Consultas Lentas (>= {DB_SLOW_QUERY_MS:.0f} ms)")
+        stats_lentas = get_estatisticas_log_lentas()
+        st.caption(
+            f"Log: {stats_lentas['tamanho_kb']} de {stats_lentas['limite_kb']} KB · "
+            f"{stats_lentas['backlog']} na fila · {stats_lentas['descartadas']} descartadas · "
+            f"{stats_lentas['rotacoes']} rotações"
+        )
+        lentas = ler_log_lentas(50)
+        if lentas:
+            st.dataframe(lentas, use_container_width=True)
+        else:
+            st.info("Nenhuma consulta lenta registrada")
+    
     # Variáveis de Ambiente
     with st.expander("Variáveis de Ambiente", expanded=True):
         st.subheader("Variáveis de Ambiente")
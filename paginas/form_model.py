@@ -11,6 +11,16 @@ import time
 # import logging
 
 from config import DB_PATH
+from banco.shards import conexao_do_usuario
+from banco.unidade_trabalho import UnidadeTrabalho
+from banco.retentativa import executar_com_retentativa, transacao_com_retentativa
+from banco.valores import buscar_elementos, buscar_valores, modo_normalizado
+from banco.templates import buscar_insumo, obter_template, tipos_do_template
+from banco.provisionamento import garantir_provisionado, usuario_provisionado
+from calculo.condicoes import carregar_respostas, obter_condicoes, resolver
+from calculo.formulas import ErroFormula, calcular, compilar, formula_de_data
+from calculo.grafo import TIPOS_FORMULA, obter_grafo
+from calculo.memo import invalidar as invalidar_memo, memorizar
 from paginas.monitor import registrar_acesso  # Ajustado para incluir o caminho completo
 from texto_manager import get_texto
 
@@ -138,181 +148,73 @@ def date_to_days(date_str):
 
 def get_element_value(cursor, name_element, element=None):
     """Busca o valor de um elemento na tabela forms_tab."""
-    cursor.execute("""
-        SELECT value_element 
-        FROM forms_tab 
-        WHERE name_element = ? AND user_id = ?
-    """, (name_element, st.session_state.user_id))
-    result = cursor.fetchone()
-    if result and result[0] is not None:
-        return float(result[0])  # Valor já está como REAL no banco
+    valor = buscar_valores(cursor, 'forms_tab', st.session_state.user_id, [name_element]).get(name_element)
+    if valor is not None:
+        return float(valor)  # Valor já está como REAL no banco
     return 0.0
 
-@st.cache_data(ttl=300)  # Cache por 5 minutos
-def _calculate_formula_cached(formula_str, values_dict, user_id):
-    """
-    Função cacheável para cálculo de fórmulas.
-    
-    Args:
-        formula_str: String da fórmula
-        values_dict: Dicionário com valores das células {name: value}
-        user_id: ID do usuário (para invalidação do cache)
-    
-    Returns:
-        float: Resultado do cálculo
-    """
-    try:
-        # Se a fórmula for um número direto
-        if isinstance(formula_str, (int, float)):
-            return float(formula_str)
-        
-        # Se for string numérica
-        if isinstance(formula_str, str):
-            formula_clean = formula_str.replace(',', '.')
-            if formula_clean.replace('.','',1).isdigit():
-                return float(formula_clean)
-        
-        processed_formula = str(formula_str)
-        
-        # Processa referências na fórmula
-        cell_refs = re.findall(r'(?:Insumos!)?[A-Z]{1,2}[0-9]+', processed_formula)
-        
-        # Substitui todas as referências pelos valores
-        for ref in cell_refs:
-            float_value = values_dict.get(ref, 0.0)
-            processed_formula = re.sub(r'\b' + re.escape(ref) + r'\b', str(float_value), processed_formula)
-        
-        # Substitui vírgulas por pontos antes do eval
-        processed_formula = processed_formula.replace(',', '.')
-        
-        # Função de divisão segura
-        def safe_div(x, y):
-            if abs(float(y)) < 1e-10:
-                return 0.0
-            return x / y
-        
-        # Ambiente seguro para eval
-        safe_env = {
-            'safe_div': safe_div,
-            '__builtins__': None
-        }
-        
-        # Substitui divisões pela função segura
-        processed_formula = re.sub(r'(\d+\.?\d*|\([^)]+\))\s*/\s*(\d+\.?\d*|\([^)]+\))', r'safe_div(\1, \2)', processed_formula)
-        
-        result = float(eval(processed_formula, safe_env, {}))
-        
-        # Formatação do resultado
-        if result is None:
-            return 0.0
-            
-        # Formata o número com casas decimais apropriadas
-        if abs(result) >= 1:
-            formatted_result = f"{result:,.0f}"
-        else:
-            formatted_result = f"{result:,.3f}"
-            
-        # Converte para formato brasileiro
-        formatted_result = formatted_result.replace(',', 'TEMP').replace('.', ',').replace('TEMP', '.')
-        
-        return float(formatted_result.replace('.', '').replace(',', '.'))
-        
-    except Exception as e:
-        # Para cache, retorna 0.0 em caso de erro (sem exibir erro na UI)
-        return 0.0
+_FORMULAS_VERIFICADAS = set()  # textos de fórmula cujas referências já foram conferidas no template
+
+def _verificar_referencias(cursor, compilada):
+    """Avisa (uma vez por fórmula) sobre referências que não existem no template de forms_tab."""
+    if compilada.texto in _FORMULAS_VERIFICADAS:
+        return
+    invalidas = compilada.referencias_invalidas(obter_template(cursor, 'forms_tab')['por_nome'])
+    if invalidas:
+        print(f"⚠️ AVISO: fórmula '{compilada.texto}' referencia células inexistentes (valem 0): {', '.join(invalidas)}")
+    _FORMULAS_VERIFICADAS.add(compilada.texto)
 
-def calculate_formula(formula, values, cursor):
+def calculate_formula(formula, cursor, uow=None):
     """
-    Calcula o resultado de uma fórmula com suporte a operações matemáticas e datas.
-    Versão otimizada com cache para melhor performance.
+    Calcula o resultado de uma fórmula para o usuário da sessão.
+    A fórmula é compilada uma vez por texto (calculo.formulas.compilar); os
+    valores das referências são lidos do banco em uma consulta, com as
+    gravações pendentes da uow por cima, e o resultado de calcular fica
+    memorizado por fórmula, usuário e versão das células dele (calculo.memo):
+    só é recalculado quando alguma célula do usuário muda.
     
     Args:
-        formula: A fórmula a ser calculada (pode ser número, string ou expressão)
-        values: Dicionário com valores das células
+        formula: Conteúdo de math_element (número ou expressão)
         cursor: Cursor do banco de dados
+        uow: UnidadeTrabalho da passada (valores ainda não gravados têm prioridade)
     
     Returns:
-        float: O resultado do cálculo
+        float: O resultado do cálculo (0.0 se a fórmula for inválida)
     """
     try:
-        # CASOS ESPECIAIS SEM CACHE (processamento direto)
-        
         # Se a fórmula for um número direto
         if isinstance(formula, (int, float)):
             return float(formula)
         
-        # Se for string numérica
-        if isinstance(formula, str):
-            formula_clean = formula.replace(',', '.')
-            if formula_clean.replace('.','',1).isdigit():
-                return float(formula_clean)
-        
         processed_formula = str(formula)
         
-        # Verifica se é uma fórmula de data (sem cache por ser específica)
-        if re.match(r'^\s*[A-Z][0-9]+\s*-\s*[A-Z][0-9]+\s*$', processed_formula):
-            refs = re.findall(r'[A-Z][0-9]+', processed_formula)
-            if len(refs) == 2:
-                data_final = refs[0]
-                data_inicial = refs[1]
-                
-                # Busca as datas no banco
-                cursor.execute("""
-                    SELECT str_element 
-                    FROM forms_tab 
-                    WHERE name_element = ? AND user_id = ?
-                """, (data_final, st.session_state.user_id))
-                result = cursor.fetchone()
-                data_final_str = result[0] if result and result[0] else None
-                
-                cursor.execute("""
-                    SELECT str_element 
-                    FROM forms_tab 
-                    WHERE name_element = ? AND user_id = ?
-                """, (data_inicial, st.session_state.user_id))
-                result = cursor.fetchone()
-                data_inicial_str = result[0] if result and result[0] else None
-                
-                # Converte as datas para dias
-                dias_final = date_to_days(data_final_str)
-                dias_inicial = date_to_days(data_inicial_str)
-                
-                # Calcula a diferença em dias e converte para meses
-                diff_dias = dias_final - dias_inicial
-                meses = diff_dias / 30.44
-                
-                return max(0, meses)
-        
-        # FÓRMULAS COM CÉLULAS - USA CACHE
-        
-        # Processa referências na fórmula
-        cell_refs = re.findall(r'(?:Insumos!)?[A-Z]{1,2}[0-9]+', processed_formula)
+        # Referências da fórmula compilada (em cache pelo texto)
+        try:
+            compilada = compilar(processed_formula)
+        except ErroFormula:
+            return 0.0  # sintaxe inválida: aviso já registrado pelo compilador
+        _verificar_referencias(cursor, compilada)
+        cell_refs = list(compilada.referencias)
+        user_id = st.session_state.user_id
+        data = formula_de_data(processed_formula, tipos_do_template(cursor))
         
-        if cell_refs:
+        def _calcular():
             # OTIMIZAÇÃO 1: Consulta em lote
-            placeholders = ','.join(['?'] * len(cell_refs))
-            cursor.execute(f"""
-                SELECT name_element, value_element 
-                FROM forms_tab 
-                WHERE name_element IN ({placeholders}) AND user_id = ?
-            """, cell_refs + [st.session_state.user_id])
-            
-            # Cria dicionário para a função cacheável
-            values_dict = dict(cursor.fetchall())
+            values_dict = {}
+            if cell_refs:
+                values_dict = buscar_valores(cursor, 'forms_tab', user_id, cell_refs)
+                
+                # Gravações pendentes da passada atual prevalecem sobre o banco
+                if uow is not None:
+                    pendentes = uow.pendentes(user_id)
+                    values_dict.update({ref: pendentes[ref] for ref in cell_refs if ref in pendentes})
             
-            # OTIMIZAÇÃO 2: Usa cache para o cálculo
-            return _calculate_formula_cached(
-                formula_str=processed_formula,
-                values_dict=values_dict,
-                user_id=st.session_state.user_id
-            )
+            # Regra única de calculo.formulas (diferença de datas: meses entre dois input_data)
+            return calcular(processed_formula, values_dict, data)
         
-        # Caso não tenha referências, usa cache também
-        return _calculate_formula_cached(
-            formula_str=processed_formula,
-            values_dict={},
-            user_id=st.session_state.user_id
-        )
+        # OTIMIZAÇÃO 2: Resultado memorizado por (fórmula, usuário, versão das células do usuário);
+        # qualquer alteração registrada ou gravada muda a versão
+        return memorizar(compilada, user_id, _calcular, data)
         
     except Exception as e:
         if "division by zero" in str(e):
@@ -320,88 +222,40 @@ def calculate_formula(formula, values, cursor):
         st.error(f"Erro no cálculo da fórmula: {str(e)}")
         return 0.0
 
-def condicaoH(cursor, element, conn):
-    """
-    Atualiza o value_element baseado em um valor de referência e mapeamento.
+def condicaoH(cursor, name_element, uow, respostas=None):
     """
-    # print(f"\nCondicaoH chamada para elemento: {element[0]}")  # Debug
+    Atualiza o value_element baseado na resposta do selectbox de referência e no mapeamento.
+    O mapeamento vem compilado do template (calculo/condicoes.py) e a resposta da
+    unidade de trabalho da passada; a gravação é registrada nela (uow).
+    
+    Args:
+        cursor: Cursor do banco de dados
+        name_element (str): Nome da célula condicaoH (D151, D152, etc)
+        uow: UnidadeTrabalho da passada
+        respostas (dict, optional): Respostas já carregadas (carregar_respostas)
     
+    Returns:
+        bool: True se o valor foi registrado
+    """
     try:
-        # Extrai informações da linha atual
-        name_element = element[1]  # D151, D152, etc
-        math_ref = element[3]      # D15 (vem da coluna math_element)
-        select_options = element[6] # String com mapeamento (vem da coluna str_element)
-        
-        # print(f"  math_ref: {math_ref}")  # Debug
-        # print(f"  select_options: {select_options}")  # Debug
-        
-        # 1. Validações iniciais
-        if not all([name_element, math_ref, select_options]):
-            # print("  Erro: dados incompletos")  # Debug
+        condicao = obter_condicoes(cursor).get(name_element)
+        if condicao is None:
             return False
-            
-        # 2. Busca str_element da referência
-        cursor.execute("""
-            SELECT str_element 
-            FROM forms_tab 
-            WHERE name_element = ? AND user_id = ?
-        """, (math_ref, st.session_state.user_id))
+        math_ref, mapeamento = condicao  # selectbox (math_element) e mapeamento compilado
         
-        result = cursor.fetchone()
-        if not result or result[0] is None:
-            # print("  Erro: str_element não encontrado")  # Debug
-            return False
-            
-        str_ref = result[0].strip()  # Remove espaços extras
-        # print(f"  str_ref encontrado: {str_ref}")  # Debug
+        user_id = st.session_state.user_id
+        if respostas is None or math_ref not in respostas:
+            respostas = carregar_respostas(cursor, uow, user_id, [math_ref])
         
-        # 3. Processa mapeamento do select_options
-        try:
-            # Remove aspas duplas do início e fim do select_options
-            select_options = select_options.strip('"')
-            
-            # Divide os pares de valores
-            mapeamento = {}
-            for par in select_options.split('|'):
-                if ':' in par:
-                    chave, valor = par.split(':')
-                    chave = chave.strip()  # Remove espaços extras da chave
-                    valor = valor.strip()  # Remove espaços extras do valor
-                    mapeamento[chave] = float(valor)
-            
-            # print(f"  Mapeamento: {mapeamento}")  # Debug
-            
-            # Busca valor correspondente
-            if str_ref in mapeamento:
-                valor_encontrado = mapeamento[str_ref]
-                # print(f"  Valor encontrado: {valor_encontrado}")  # Debug
-                
-                # 4. Atualiza o banco
-                cursor.execute("""
-                    UPDATE forms_tab 
-                    SET value_element = ?
-                    WHERE name_element = ? AND user_id = ?
-                """, (valor_encontrado, name_element, st.session_state.user_id))
-                
-                conn.commit()
-                return True
-            
-            # print(f"  Erro: str_ref '{str_ref}' não encontrado no mapeamento")  # Debug
-            return False
-            
-        except ValueError:
-            # print("  Erro: ValueError ao processar valores")  # Debug
-            return False
-            
-        except sqlite3.Error:
-            # print("  Erro: Erro no banco de dados")  # Debug
-            conn.rollback()
+        valor_encontrado = resolver(mapeamento, respostas[math_ref])
+        if valor_encontrado is None:
             return False
         
+        uow.registrar(user_id, name_element, value_element=valor_encontrado)
+        return True
+        
     except Exception as e:
-        # print(f"  Erro inesperado: {str(e)}")  # Debug
-        if 'conn' in locals():
-            conn.rollback()
+        print(f"⚠️ AVISO: condicaoH de {name_element} não registrada: {e}")
         return False
 
 def titulo(cursor, element):
@@ -443,35 +297,68 @@ def titulo(cursor, element):
 def new_user(cursor, user_id):
     """
     Inicializa registros para um novo usuário copiando dados do user_id 0.
+    No armazenamento normalizado não há cópia: o usuário lê o template e
+    só as células alteradas vão para forms_tab_valores.
+    Usuários provisionados em lote (banco/provisionamento.py) já têm as
+    linhas: aqui só se consulta a marca.
     """
+    if modo_normalizado():
+        return
     try:
-        # Verifica se já existem registros para o usuário
-        cursor.execute("""
-            SELECT COUNT(*) FROM forms_tab WHERE user_id = ?
-        """, (user_id,))
-        
-        if cursor.fetchone()[0] == 0:  # Se não existem registros
-            # Copia todos os dados do user_id 0
-            cursor.execute("""
-                INSERT INTO forms_tab (
-                    name_element, type_element, math_element, msg_element,
-                    value_element, select_element, str_element, e_col, e_row,
-                    section, col_len, user_id
-                )
-                SELECT 
-                    name_element, type_element, math_element, msg_element,
-                    value_element, select_element, str_element, e_col, e_row,
-                    section, col_len, ? as user_id
-                FROM forms_tab 
-                WHERE user_id = 0
-            """, (user_id,))
-            
+        if usuario_provisionado(cursor, user_id):
+            return
+        if transacao_com_retentativa(cursor.connection, 'form_model.new_user', garantir_provisionado, user_id):
             st.success(f"Registros iniciais criados para o usuário {user_id}")
         
     except Exception as e:
         st.error(f"Erro ao criar registros para novo usuário: {str(e)}")
         raise
 
+def _propagar_alteracoes(cursor, alteradas, uow, celulas=None):
+    """
+    Recalcula as células que dependem das alteradas (grafo do template), em ordem
+    topológica, registrando os resultados na unidade de trabalho da passada.
+    
+    Args:
+        cursor: Cursor do banco de dados
+        alteradas (list): Células alteradas pelo usuário nesta passada
+        uow: UnidadeTrabalho da passada
+        celulas (list, optional): Células a recalcular, já ordenadas (ignora alteradas)
+    
+    Returns:
+        int: Quantidade de células recalculadas
+    """
+    grafo = obter_grafo(cursor)
+    sujas = celulas if celulas is not None else grafo.propagar(alteradas)
+    if not sujas:
+        return 0
+    user_id = st.session_state.user_id
+    
+    # condicaoH: mapeamentos compilados do template; respostas dos selectboxes da
+    # passada (linhas da página), com no máximo uma consulta para as que faltarem
+    respostas = None
+    condicoes = [nome for nome in sujas if grafo.tipos[nome] == 'condicaoH']
+    if condicoes:
+        mapeamentos = obter_condicoes(cursor)
+        respostas = carregar_respostas(
+            cursor, uow, user_id, [mapeamentos[nome][0] for nome in condicoes if nome in mapeamentos]
+        )
+    
+    for nome in sujas:
+        if grafo.tipos[nome] == 'condicaoH':
+            condicaoH(cursor, nome, uow, respostas)
+        else:
+            # Fórmulas já recalculadas nesta passada são lidas da unidade de trabalho
+            uow.registrar(user_id, nome, value_element=calculate_formula(grafo.expressoes[nome], cursor, uow))
+    return len(sujas)
+
+def _recalcular_formulas(cursor, uow):
+    """Recalcula todas as fórmulas do template em ordem topológica (primeira passada da sessão)."""
+    grafo = obter_grafo(cursor)
+    return _propagar_alteracoes(
+        cursor, None, uow, celulas=[nome for nome in grafo.ordem if grafo.tipos[nome] in TIPOS_FORMULA]
+    )
+
 def _reset_rerun_locks(section):
     """
     Reset das flags de controle de rerun e timestamps de debounce para permitir novas atualizações.
@@ -493,6 +380,15 @@ def _reset_rerun_locks(section):
         # Se houver erro, não afeta o funcionamento principal
         pass
 
+def _gravar_unidade_trabalho(uow, conn, section):
+    """
+    Grava em uma única transação as alterações pendentes da passada e
+    guarda o relatório (gravações registradas x efetivas) na sessão.
+    """
+    relatorio = executar_com_retentativa(uow.flush, f'form_model.flush.{section}', conn)
+    st.session_state[f"uow_relatorio_{section}"] = relatorio
+    return relatorio
+
 def process_forms_tab(section='ancoras_p1'):
     """
     Processa registros da tabela forms_tab e exibe em layout de grade.
@@ -508,6 +404,8 @@ def process_forms_tab(section='ancoras_p1'):
     _reset_rerun_locks(section)
     
     conn = None
+    uow = UnidadeTrabalho('forms_tab')
+    formulas_recalculadas = False
     try:
         # Inicializa flag de log no session_state se não existir
         log_key = f"log_registered_{section}"
@@ -550,8 +448,8 @@ def process_forms_tab(section='ancoras_p1'):
         if 'form_values' not in st.session_state:
             st.session_state.form_values = {}
         
-        # Conexão com o banco
-        conn = sqlite3.connect(DB_PATH)  # Atualizado para usar DB_PATH
+        # Conexão com o banco do usuário (shard da empresa, se houver)
+        conn = conexao_do_usuario(user_id)
         cursor = conn.cursor()
 
         # 3. Garante que existam dados para o usuário
@@ -559,21 +457,31 @@ def process_forms_tab(section='ancoras_p1'):
         conn.commit()
 
         # 4. Busca dados específicos do usuário logado e da seção atual
-        cursor.execute("""
-            SELECT name_element, type_element, math_element, msg_element,
-                   value_element, select_element, str_element, e_col, e_row,
-                   col_len
-            FROM forms_tab
-            WHERE user_id = ? AND section = ?
-            ORDER BY e_row, e_col
-        """, (user_id, section))
-        elements = cursor.fetchall()
+        elements = buscar_elementos(
+            cursor, 'forms_tab', user_id,
+            colunas=['name_element', 'type_element', 'math_element', 'msg_element',
+                     'value_element', 'select_element', 'str_element', 'e_col', 'e_row',
+                     'col_len'],
+            filtros={'section': section}
+        )
 
         # Verifica se existem elementos para esta seção
         if not elements:
             st.warning(f"Nenhum elemento encontrado para a seção {section}")
             return
 
+        # Valores lidos servem de referência para descartar gravações sem efeito
+        for element in elements:
+            uow.registrar_leitura(user_id, element[0], element[4], element[6])
+
+        # Primeira passada da sessão com fórmulas: recálculo completo (alterações feitas fora
+        # do formulário, como CRUD); depois disso só os dependentes de cada alteração
+        chave_formulas = f"formulas_em_dia_{user_id}"
+        if not st.session_state.get(chave_formulas) and any(element[1] == 'formula' for element in elements):
+            invalidar_memo(user_id)
+            _recalcular_formulas(cursor, uow)
+            formulas_recalculadas = True
+
         # Agrupa elementos por linha
         rows = {}
         for element in elements:
@@ -647,18 +555,13 @@ def process_forms_tab(section='ancoras_p1'):
                         if type_elem.endswith('H'):
                             try:
                                 if type_elem == 'condicaoH':
-                                    result = condicaoH(cursor, element, conn)
+                                    result = condicaoH(cursor, name, uow)
                                 elif type_elem == 'call_insumosH':
-                                    result = call_insumos(cursor, element)
+                                    result = call_insumos(cursor, element, uow)
 
-                                # Atualiza o banco com o resultado
+                                # Registra o resultado na unidade de trabalho
                                 if type_elem in ['condicaoH', 'call_insumosH']:
-                                    cursor.execute("""
-                                        UPDATE forms_tab 
-                                        SET value_element = ? 
-                                        WHERE name_element = ? AND user_id = ?
-                                    """, (result, name, st.session_state.user_id))
-                                    conn.commit()
+                                    uow.registrar(st.session_state.user_id, name, value_element=result)
                                 continue
 
                             except Exception as e:
@@ -688,44 +591,24 @@ def process_forms_tab(section='ancoras_p1'):
                                 # Se o valor mudou, atualiza os elementos dependentes
                                 if selected != str_value:
                                     try:
-                                        # Atualiza o próprio selectbox
-                                        cursor.execute("""
-                                            UPDATE forms_tab 
-                                            SET str_element = ?,
-                                                value_element = ?
-                                            WHERE name_element = ? 
-                                            AND user_id = ? 
-                                            AND section = ?
-                                        """, (selected, 0.0, name, st.session_state.user_id, section))
-                                        
-                                        # Busca elementos condicaoH que dependem deste selectbox
-                                        cursor.execute("""
-                                            SELECT * FROM forms_tab 
-                                            WHERE type_element = 'condicaoH' 
-                                            AND math_element = ? 
-                                            AND user_id = ?
-                                        """, (name, st.session_state.user_id))
-                                        
-                                        # Para cada elemento encontrado, chama condicaoH
-                                        for elemento in cursor.fetchall():
-                                            # print(f"Elemento encontrado: {elemento}")  # Debug adicional
-                                            condicaoH(cursor, elemento, conn)
+                                        # Registra a alteração do próprio selectbox
+                                        uow.registrar(
+                                            st.session_state.user_id, name,
+                                            value_element=0.0, str_element=selected
+                                        )
                                         
-                                        conn.commit()
+                                        # Recalcula só os dependentes: condicaoH deste selectbox e as fórmulas que os usam
+                                        _propagar_alteracoes(cursor, [name], uow)
                                     
                                     except sqlite3.Error as e:
                                         st.error(f"Erro no banco de dados: {str(e)}")
-                                        conn.rollback()
 
                             except Exception as e:
                                 st.error(f"Erro no selectbox {name}: {str(e)}")
-                                if 'conn' in locals():
-                                    conn.rollback()
 
                         elif type_elem == 'call_insumos':
                             try:
-                                result = call_insumos(cursor, element)
-                                conn.commit()
+                                result = call_insumos(cursor, element, uow)
                                 
                                 # Configurações de estilo para métricas
                                 FONT_SIZES = {
@@ -805,13 +688,10 @@ def process_forms_tab(section='ancoras_p1'):
                                                 )
                                                 st.session_state[log_key] = True
                                             
-                                            # Atualiza banco
-                                            cursor.execute("""
-                                                UPDATE forms_tab 
-                                                SET value_element = ? 
-                                                WHERE name_element = ? AND user_id = ?
-                                            """, (numeric_value, name, st.session_state.user_id))
-                                            conn.commit()
+                                            # Atualiza banco (grava a passada antes do rerun)
+                                            uow.registrar(st.session_state.user_id, name, value_element=numeric_value)
+                                            _propagar_alteracoes(cursor, [name], uow)
+                                            _gravar_unidade_trabalho(uow, conn, section)
                                             
                                             # Marca flags para controle
                                             st.session_state[rerun_key] = True
@@ -819,12 +699,8 @@ def process_forms_tab(section='ancoras_p1'):
                                             st.rerun()
                                         else:
                                             # Atualiza apenas o session_state sem rerun
-                                            cursor.execute("""
-                                                UPDATE forms_tab 
-                                                SET value_element = ? 
-                                                WHERE name_element = ? AND user_id = ?
-                                            """, (numeric_value, name, st.session_state.user_id))
-                                            conn.commit()
+                                            uow.registrar(st.session_state.user_id, name, value_element=numeric_value)
+                                            _propagar_alteracoes(cursor, [name], uow)
                                     
                                     st.session_state.form_values[name] = numeric_value
                                     
@@ -837,21 +713,14 @@ def process_forms_tab(section='ancoras_p1'):
 
                         elif type_elem == 'formula':
                             try:
-                                # 1. Calcula o resultado da fórmula
-                                result = calculate_formula(math_elem, st.session_state.form_values, cursor)
+                                # 1. Resultado: recalculado nesta passada (pendente na unidade de trabalho)
+                                #    ou o valor gravado, mantido em dia pela propagação das alterações
+                                result = uow.obter(st.session_state.user_id, name, 'value_element', float(value or 0))
                                 
                                 # 2. Renderiza na interface SOMENTE se str_element não estiver vazio
                                 if str_value and str_value.strip():
                                     render_formula_result(result, msg, str_value)
                                 
-                                # 3. Atualiza o banco com UPDATE direto
-                                cursor.execute("""
-                                    UPDATE forms_tab 
-                                    SET value_element = ? 
-                                    WHERE name_element = ? AND user_id = ?
-                                """, (result, name, st.session_state.user_id))
-                                conn.commit()
-                                
                             except Exception as e:
                                 st.error(f"Erro ao processar elemento de fórmula {name}: {str(e)}")
 
@@ -900,13 +769,12 @@ def process_forms_tab(section='ancoras_p1'):
                                                 if (current_time - last_update > min_interval and 
                                                     not st.session_state.get(rerun_key, False)):
                                                     
-                                                    cursor.execute("""
-                                                        UPDATE forms_tab 
-                                                        SET str_element = ?,
-                                                            value_element = ? 
-                                                        WHERE name_element = ? AND user_id = ?
-                                                    """, (input_value, days_since_1900, name, st.session_state.user_id))
-                                                    conn.commit()
+                                                    uow.registrar(
+                                                        st.session_state.user_id, name,
+                                                        value_element=days_since_1900, str_element=input_value
+                                                    )
+                                                    _propagar_alteracoes(cursor, [name], uow)
+                                                    _gravar_unidade_trabalho(uow, conn, section)
                                                     
                                                     # Marca flags para controle
                                                     st.session_state[rerun_key] = True
@@ -914,13 +782,11 @@ def process_forms_tab(section='ancoras_p1'):
                                                     st.rerun()
                                                 else:
                                                     # Atualiza apenas o banco sem rerun
-                                                    cursor.execute("""
-                                                        UPDATE forms_tab 
-                                                        SET str_element = ?,
-                                                            value_element = ? 
-                                                        WHERE name_element = ? AND user_id = ?
-                                                    """, (input_value, days_since_1900, name, st.session_state.user_id))
-                                                    conn.commit()
+                                                    uow.registrar(
+                                                        st.session_state.user_id, name,
+                                                        value_element=days_since_1900, str_element=input_value
+                                                    )
+                                                    _propagar_alteracoes(cursor, [name], uow)
                                             
                                             # Atualiza o form_values com o número de dias
                                             st.session_state.form_values[name] = days_since_1900
@@ -942,15 +808,23 @@ def process_forms_tab(section='ancoras_p1'):
         st.error(f"Erro ao processar formulário: {str(e)}")
     finally:
         if conn:
+            # Grava todas as alterações da passada em uma única transação
+            try:
+                _gravar_unidade_trabalho(uow, conn, section)
+                if formulas_recalculadas:
+                    st.session_state[f"formulas_em_dia_{st.session_state.user_id}"] = True
+            except Exception as e:
+                st.error(f"Erro ao gravar alterações do formulário: {str(e)}")
             conn.close()
 
-def call_insumos(cursor, element):
+def call_insumos(cursor, element, uow):
     """
     Busca valor de referência na tabela forms_insumos e atualiza value_element.
     
     Args:
         cursor: Cursor do banco de dados SQLite
         element: Tupla contendo os dados do elemento (name, type, math, msg, value, select, str, col, row)
+        uow: UnidadeTrabalho da passada onde a gravação é registrada
     
     Returns:
         float: Valor numérico encontrado ou 0.0 em caso de erro
@@ -964,13 +838,8 @@ def call_insumos(cursor, element):
             return 0.0
             
         # Busca o math_element na forms_insumos onde name_element = str_value da forms_tab
-        cursor.execute("""
-            SELECT math_element 
-            FROM forms_insumos 
-            WHERE name_element = ?
-        """, (str_value.strip(),))
-        
-        result = cursor.fetchone()
+        result = buscar_insumo(cursor, str_value.strip(), padrao=False)
+        result = (result,) if result is not False else None
         if not result:
             st.warning(f"Referência '{str_value}' não encontrada em forms_insumos")
             return 0.0
@@ -993,11 +862,7 @@ def call_insumos(cursor, element):
             # Converte para formato BR antes de salvar
             final_value_br = f"{final_value:.2f}".replace('.', ',')
             
-            cursor.execute("""
-                UPDATE forms_tab 
-                SET value_element = ?
-                WHERE name_element = ? AND user_id = ?
-            """, (final_value_br, name, st.session_state.user_id))
+            uow.registrar(st.session_state.user_id, name, value_element=final_value_br)
             
             return final_value  # Retorna float para cálculos
             
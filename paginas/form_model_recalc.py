@@ -6,7 +6,6 @@
 # def verificar_dados_usuario - adicionado nova coluna col_len
 
 import sqlite3
-import re
 import os
 import sys
 
@@ -14,13 +13,18 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import DB_PATH
-import streamlit as st
+from banco.valores import buscar_elementos, buscar_valores, gravar_valores, modo_normalizado, usuario_tem_dados
+from banco.templates import tipos_do_template
+from calculo.formulas import calcular, compilar, formula_de_data
+from calculo.grafo import TIPOS_FORMULA, obter_grafo
 
 def verificar_dados_usuario(cursor, user_id):
     """Verifica/copia dados do template (user_id=0) para novo usuário"""
+    # Armazenamento normalizado: o usuário lê o template, nada a copiar
+    if modo_normalizado():
+        return False
     try:
-        cursor.execute("SELECT COUNT(*) FROM forms_tab WHERE user_id = ?", (user_id,))
-        if cursor.fetchone()[0] == 0:
+        if not usuario_tem_dados(cursor, 'forms_tab', user_id):
             cursor.execute("""
                 INSERT INTO forms_tab (
                     name_element, type_element, math_element, msg_element, 
@@ -49,73 +53,47 @@ def verificar_dados_usuario(cursor, user_id):
 def calculate_formula(cursor, name, user_id):
     """Calcula o valor de uma fórmula"""
     try:
-        cursor.execute("""
-            SELECT math_element 
-            FROM forms_tab 
-            WHERE name_element = ? AND user_id = ?
-            ORDER BY ID_element DESC LIMIT 1
-        """, (name, user_id))
-        
-        formula = cursor.fetchone()
-        if not formula or not formula[0]:
+        formula = buscar_elementos(
+            cursor, 'forms_tab', user_id,
+            colunas=['math_element'],
+            filtros={'name_element': name},
+            ordem='ID_element DESC'
+        )
+        if not formula or not formula[0][0]:
             return 0.0
             
-        math_expr = str(formula[0]).replace(',', '.')
-        refs = re.findall(r'[A-Z]+[0-9]+|[A-Z]+[A-Z]+[0-9]+', math_expr)
+        # Fórmula compilada uma vez por texto (calculo/formulas.py): referências pela árvore,
+        # sem substituição de texto (A1 não atinge mais A12)
+        texto = formula[0][0]
+        compilada = compilar(texto)
         
-        for ref in refs:
-            cursor.execute("""
-                SELECT COALESCE(value_element, 0) 
-                FROM forms_tab 
-                WHERE name_element = ? AND user_id = ?
-                ORDER BY ID_element DESC LIMIT 1
-            """, (ref, user_id))
-            
-            value = cursor.fetchone()
-            math_expr = math_expr.replace(ref, str(value[0] if value else 0))
-        
-        def safe_div(x, y):
-            if abs(float(y)) < 1e-10:  # Considera valores muito próximos de zero
-                return 0.0
-            return x / y
-        
-        safe_env = {
-            'safe_div': safe_div,
-            '__builtins__': None
-        }
-        
-        math_expr = re.sub(r'(\d+\.?\d*|\([^)]+\))\s*/\s*(\d+\.?\d*|\([^)]+\))', r'safe_div(\1, \2)', math_expr)
-        
-        return float(eval(math_expr, safe_env, {}))
+        # Valores de todas as referências em uma consulta; cálculo pela mesma regra da página
+        valores = buscar_valores(cursor, 'forms_tab', user_id, list(compilada.referencias))
+        return calcular(texto, valores, formula_de_data(texto, tipos_do_template(cursor)))
             
     except Exception as e:
         return 0.0
 
-def atualizar_formulas(cursor, user_id):
+def atualizar_formulas(cursor, user_id, alteradas=None):
     """
-    Atualiza todas as fórmulas em ordem específica para um determinado usuário
+    Atualiza as fórmulas de um usuário em ordem topológica (grafo de dependências do template)
+    
+    Args:
+        cursor: Cursor do banco de dados
+        user_id (int): ID do usuário
+        alteradas (list, optional): Células alteradas; recalcula só as fórmulas que dependem
+            delas. Se None, recalcula todas
     """
     try:
-        cursor.execute("""
-            SELECT name_element, type_element, math_element, section
-            FROM forms_tab 
-            WHERE user_id = ? 
-            AND (type_element = 'formula' OR type_element = 'formulaH')
-            ORDER BY ID_element
-        """, (user_id,))
+        grafo = obter_grafo(cursor)
+        celulas = grafo.ordem if alteradas is None else grafo.propagar(alteradas)
         
-        formulas = cursor.fetchall()
-        
-        for formula in formulas:
-            name_element, type_element, math_element, section = formula
+        for name_element in celulas:
+            if grafo.tipos[name_element] not in TIPOS_FORMULA:
+                continue
             result = calculate_formula(cursor, name_element, user_id)
             
-            cursor.execute("""
-                UPDATE forms_tab 
-                SET value_element = CAST(? AS REAL)
-                WHERE name_element = ? 
-                AND user_id = ?
-            """, (result, name_element, user_id))
+            gravar_valores(cursor, 'forms_tab', [(user_id, name_element, {'value_element': float(result)})])
             
         cursor.connection.commit()
         return True
@@ -5,15 +5,18 @@
 # pylance: disable=reportMissingModuleSource
 
 import streamlit as st
-import sqlite3
 import pandas as pd
 import plotly.express as px
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 import io
 import tempfile
 import matplotlib.pyplot as plt
 import traceback
 from config import DB_PATH
+from banco.conexao import get_connection
+from banco.log_assincrono import enfileirar as enfileirar_log, flush as flush_log
+from banco.arquivo_log import fonte_log_acessos
+from banco.shards import ler_em_todos
 import os
 
 try:
@@ -35,7 +38,7 @@ except ImportError as e:
 
 def criar_conexao():
     """Cria conexão com o banco de dados"""
-    return sqlite3.connect(DB_PATH)
+    return get_connection()
 
 def get_timezone_adjusted_datetime():
     """
@@ -47,98 +50,111 @@ def get_timezone_adjusted_datetime():
         current = current - timedelta(hours=3)
     return current
 
-def carregar_dados_acessos():
-    """Carrega dados de acessos do banco de dados"""
-    conn = criar_conexao()
-    
-    # Ajusta a query baseada no ambiente
-    timezone_adjust = "'+3 hours'" if os.getenv('RENDER') else "'0 hours'"
-    
-    # Query para acessos por empresa - ajustada para últimos 30 dias
-    query_empresas = """
-    SELECT u.empresa, COUNT(*) as quantidade_acessos 
-    FROM log_acessos la
-    JOIN usuarios u ON la.user_id = u.user_id
-    WHERE u.empresa IS NOT NULL
-    AND la.data_acesso >= date('now', '-30 days')
-    GROUP BY u.empresa
-    ORDER BY quantidade_acessos DESC
-    LIMIT 10
+def periodo_padrao():
+    """Últimos 30 dias (date('now') do SQLite é UTC), como datas do calendário."""
+    hoje = datetime.now(timezone.utc).date()
+    return hoje - timedelta(days=30), hoje
+
+def _acessos_do_banco(conn, inicio, fim):
+    """Acessos do período em um banco (principal ou shard): por empresa, por usuário e brutos."""
+    periodo = (inicio, fim)
+    with fonte_log_acessos(conn, inicio, fim) as fonte:
+        # Query para acessos por empresa no período
+        query_empresas = f"""
+        SELECT u.empresa, COUNT(*) as quantidade_acessos 
+        FROM {fonte} la
+        JOIN usuarios u ON la.user_id = u.user_id
+        WHERE u.empresa IS NOT NULL
+        AND la.data_acesso >= ? AND la.data_acesso <= ?
+        GROUP BY u.empresa
+        """
+        
+        # Query para acessos por usuário - ajustada para incluir empresa e hora
+        # (data_acesso já é gravada com o ajuste de timezone em registrar_acesso)
+        query_usuarios = f"""
+        SELECT 
+            u.user_id,
+            u.nome, 
+            u.empresa, 
+            COUNT(*) as quantidade_acessos,
+            MAX(la.data_acesso || ' ' || la.hora_acesso) as ultimo_acesso
+        FROM {fonte} la
+        JOIN usuarios u ON la.user_id = u.user_id
+        WHERE la.data_acesso >= ? AND la.data_acesso <= ?
+        GROUP BY u.user_id, u.nome, u.empresa
+        """
+        
+        # Acessos brutos do período; a frequência diária é montada abaixo
+        query_frequencia = f"""
+        SELECT la.data_acesso, la.user_id, la.hora_acesso
+        FROM {fonte} la
+        WHERE la.data_acesso >= ? AND la.data_acesso <= ?
+        """
+        
+        return (
+            pd.read_sql_query(query_empresas, conn, params=periodo),
+            pd.read_sql_query(query_usuarios, conn, params=periodo),
+            pd.read_sql_query(query_frequencia, conn, params=periodo),
+        )
+
+def carregar_dados_acessos(data_inicio=None, data_fim=None):
     """
+    Carrega dados de acessos do banco de dados no período informado.
     
-    # Query para acessos por usuário - ajustada para incluir empresa e hora
-    query_usuarios = f"""
-    SELECT 
-        u.nome, 
-        u.empresa, 
-        COUNT(*) as quantidade_acessos,
-        MAX(la.data_acesso || ' ' || la.hora_acesso) as ultimo_acesso
-    FROM log_acessos la
-    JOIN usuarios u ON la.user_id = u.user_id
-    WHERE date(la.data_acesso, {timezone_adjust}) >= date('now', '-30 days')
-    GROUP BY u.user_id, u.nome, u.empresa
-    ORDER BY quantidade_acessos DESC
-    LIMIT 10
+    Meses já arquivados (banco/arquivo_log.py) são anexados só quando o
+    período pede por eles; por padrão, os últimos 30 dias. Com shards por
+    empresa (banco/shards.py) cada banco é lido em paralelo e os totais
+    são somados aqui.
     """
+    if data_inicio is None or data_fim is None:
+        data_inicio, data_fim = periodo_padrao()
     
-    # Query para frequência de acessos diários - ajustada
-    query_frequencia = """
-    WITH RECURSIVE dates(date) AS (
-        SELECT date('now', '-30 days')
-        UNION ALL
-        SELECT date(date, '+1 day')
-        FROM dates
-        WHERE date < date('now')
-    )
-    SELECT 
-        dates.date as data_acesso,
-        COUNT(DISTINCT la.user_id) as usuarios_unicos,
-        COUNT(la.id) as total_acessos,
-        GROUP_CONCAT(DISTINCT la.hora_acesso) as horarios_acesso
-    FROM dates
-    LEFT JOIN log_acessos la ON date(la.data_acesso) = dates.date
-    GROUP BY dates.date
-    ORDER BY dates.date
-    """
+    # Garante que os acessos ainda na fila de gravação apareçam no dashboard
+    flush_log()
+    partes = [resultado for _, resultado in ler_em_todos(
+        _acessos_do_banco, data_inicio.isoformat(), data_fim.isoformat())]
     
-    df_empresas = pd.read_sql_query(query_empresas, conn)
-    df_usuarios = pd.read_sql_query(query_usuarios, conn)
-    df_frequencia = pd.read_sql_query(query_frequencia, conn)
+    # Top 10 empresas e usuários somando os bancos
+    df_empresas = (pd.concat([p[0] for p in partes], ignore_index=True)
+                   .groupby('empresa', as_index=False)['quantidade_acessos'].sum()
+                   .sort_values('quantidade_acessos', ascending=False, kind='stable')
+                   .head(10).reset_index(drop=True))
+    df_usuarios = (pd.concat([p[1] for p in partes], ignore_index=True)
+                   .groupby(['user_id', 'nome', 'empresa'], as_index=False, dropna=False)
+                   .agg(quantidade_acessos=('quantidade_acessos', 'sum'), ultimo_acesso=('ultimo_acesso', 'max'))
+                   .sort_values('quantidade_acessos', ascending=False, kind='stable')
+                   .head(10).drop(columns='user_id').reset_index(drop=True))
+    df_acessos = pd.concat([p[2] for p in partes], ignore_index=True)
+    
+    # Frequência de acessos diários: um registro por dia do período, inclusive dias sem acesso
+    df_acessos['data_acesso'] = df_acessos['data_acesso'].astype(str).str[:10]
+    dias = [(data_inicio + timedelta(days=n)).isoformat() for n in range((data_fim - data_inicio).days + 1)]
+    por_dia = df_acessos.groupby('data_acesso')
+    df_frequencia = pd.DataFrame({'data_acesso': dias})
+    df_frequencia['usuarios_unicos'] = df_frequencia['data_acesso'].map(
+        por_dia['user_id'].nunique()).fillna(0).astype(int)
+    df_frequencia['total_acessos'] = df_frequencia['data_acesso'].map(
+        por_dia.size()).fillna(0).astype(int)
+    df_frequencia['horarios_acesso'] = df_frequencia['data_acesso'].map(
+        por_dia['hora_acesso'].agg(lambda horas: ','.join(dict.fromkeys(horas.dropna().astype(str)))))
     
-    conn.close()
     return df_empresas, df_usuarios, df_frequencia
 
 def registrar_acesso(user_id, programa, acao):
     """
-    Registra o acesso do usuário no banco de dados com ajuste de timezone
+    Registra o acesso do usuário no banco de dados com ajuste de timezone.
+    A gravação é feita em lote por banco/log_assincrono.py (o render não espera o commit).
     """
     try:
-        conn = criar_conexao()
-        cursor = conn.cursor()
-        
-        # Obtém data e hora ajustadas
+        # Obtém data e hora ajustadas (momento do acesso, não da gravação)
         dt_adjusted = get_timezone_adjusted_datetime()
         data_acesso = dt_adjusted.strftime('%Y-%m-%d')
         hora_acesso = dt_adjusted.strftime('%H:%M:%S')
         
-        cursor.execute("""
-        INSERT INTO log_acessos (
-            user_id,
-            data_acesso,
-            hora_acesso,
-            programa,
-            acao
-        )
-        VALUES (?, ?, ?, ?, ?)
-        """, (user_id, data_acesso, hora_acesso, programa, acao))
-        
-        conn.commit()
-        conn.close()
+        enfileirar_log(user_id, data_acesso, hora_acesso, programa, acao)
         
     except Exception as e:
         st.error(f"Erro ao registrar acesso: {str(e)}")
-        if 'conn' in locals():
-            conn.close()
 
 def subtitulo():
     """
@@ -160,7 +176,20 @@ def main():
     subtitulo()
     
     try:
-        df_empresas, df_usuarios, df_frequencia = carregar_dados_acessos()
+        # Período do dashboard (meses antigos vêm dos arquivos mensais)
+        padrao_inicio, padrao_fim = periodo_padrao()
+        periodo = st.date_input(
+            "Período",
+            value=(padrao_inicio, padrao_fim),
+            max_value=padrao_fim,
+            format="DD/MM/YYYY"
+        )
+        if not isinstance(periodo, (tuple, list)) or len(periodo) != 2:
+            st.info("Selecione a data inicial e a data final do período")
+            return
+        data_inicio, data_fim = periodo
+        
+        df_empresas, df_usuarios, df_frequencia = carregar_dados_acessos(data_inicio, data_fim)
         
         # Container para reduzir largura
         col1, col2, col3 = st.columns([1, 8, 1])  # 80% da largura
@@ -213,7 +242,7 @@ def main():
             st.markdown("<br><br><br>", unsafe_allow_html=True)
             
             # Gráfico de linha do tempo
-            st.subheader("Evolução de Usuários Únicos nos Últimos 30 dias")
+            st.subheader("Evolução de Usuários Únicos no Período")
             fig_timeline = px.line(df_frequencia, 
                                  x='data_acesso', 
                                  y='usuarios_unicos',
@@ -22,7 +22,6 @@ except ImportError as e:
     print(f"Erro ao importar ReportLab: {e}")
 
 import streamlit as st
-import sqlite3
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -32,15 +31,29 @@ import tempfile
 import matplotlib.pyplot as plt
 import traceback
 from paginas.monitor import registrar_acesso
-import time
 
 from config import DB_PATH  # Adicione esta importação
+from banco.shards import banco_do_usuario, conexao_do_usuario
+from banco.snapshot import snapshot_leitura
+from banco.retentativa import transacao_com_retentativa
+from banco.valores import (
+    buscar_elementos, buscar_valores, gravar_valores, modo_normalizado
+)
+from banco.provisionamento import garantir_provisionado, usuario_provisionado
+from banco.usuarios import obter_usuario
 
 # Dicionário de títulos para cada tabela
 TITULOS_TABELAS = {
     "forms_resultados": "Análise: Âncoras de Carreira"
 }
 
+# Colunas dos elementos usadas na tela e no PDF (índices fixos: [9] section, [10] user_id)
+COLUNAS_ELEMENTO = [
+    'name_element', 'type_element', 'math_element', 'msg_element',
+    'value_element', 'select_element', 'str_element', 'e_col', 'e_row',
+    'section', 'user_id'
+]
+
 # Dicionário de subtítulos para cada tabela
 SUBTITULOS_TABELAS = {
     "forms_resultados": "Avaliação de Âncoras de Carreira"
@@ -165,38 +178,22 @@ def pula_linha(cursor, element):
 
 def new_user(cursor, user_id: int, tabela: str):
     """
-    Cria registros iniciais para um novo usuário na tabela especificada,
-    copiando os dados do template (user_id = 0)
+    Cria registros iniciais para um novo usuário, copiando os dados do
+    template (user_id = 0). Usuários provisionados em lote já têm as
+    linhas: aqui só se consulta a marca.
     
     Args:
         cursor: Cursor do banco de dados
         user_id: ID do usuário
-        tabela: Nome da tabela para criar os registros
+        tabela: Nome da tabela da página (a cópia cobre forms_tab e forms_resultados)
     """
+    # Armazenamento normalizado: leitura direta do template, sem cópia
+    if modo_normalizado():
+        return
     try:
-        # Verifica se já existem registros para o usuário
-        cursor.execute(f"""
-            SELECT COUNT(*) FROM {tabela} 
-            WHERE user_id = ?
-        """, (user_id,))
-        
-        if cursor.fetchone()[0] == 0:
-            # Copia dados do template (user_id = 0) para o novo usuário
-            cursor.execute(f"""
-                INSERT INTO {tabela} (
-                    user_id, name_element, type_element, math_element,
-                    msg_element, value_element, select_element, str_element,
-                    e_col, e_row, section
-                )
-                SELECT 
-                    ?, name_element, type_element, math_element,
-                    msg_element, value_element, select_element, str_element,
-                    e_col, e_row, section
-                FROM {tabela}
-                WHERE user_id = 0
-            """, (user_id,))
-            
-            cursor.connection.commit()
+        if usuario_provisionado(cursor, user_id):
+            return
+        if transacao_com_retentativa(cursor.connection, 'resultados.new_user', garantir_provisionado, user_id):
             st.success("Dados iniciais criados com sucesso!")
             
     except Exception as e:
@@ -218,30 +215,17 @@ def call_dados(cursor, element, tabela_destino: str):
         user_id = element[10]    # user_id
         
         if type_elem == 'call_dados':
-            # Busca o valor com CAST para garantir precisão decimal
-            cursor.execute("""
-                SELECT CAST(value_element AS DECIMAL(20, 8))
-                FROM forms_tab 
-                WHERE name_element = ? 
-                AND user_id = ?
-                ORDER BY ID_element DESC
-                LIMIT 1
-            """, (str_value, user_id))
+            # Busca o valor (em nomes duplicados prevalece o registro mais recente)
+            result = buscar_valores(cursor, 'forms_tab', user_id, [str_value])
             
-            result = cursor.fetchone()
-            
-            if result:
-                value = float(result[0]) if result[0] is not None else 0.0
+            if str_value in result:
+                value = float(result[str_value]) if result[str_value] is not None else 0.0
                 
                 # Atualiza usando a tabela passada como parâmetro
-                cursor.execute(f"""
-                    UPDATE {tabela_destino}
-                    SET value_element = CAST(? AS DECIMAL(20, 8))
-                    WHERE name_element = ? 
-                    AND user_id = ?
-                """, (value, name, user_id))
-                
-                cursor.connection.commit()
+                transacao_com_retentativa(
+                    cursor.connection, 'resultados.call_dados',
+                    gravar_valores, tabela_destino, [(user_id, name, {'value_element': value})]
+                )
             else:
                 st.warning(f"Valor não encontrado na tabela forms_tab para {str_value} (user_id: {user_id})")
                 
@@ -298,21 +282,12 @@ def grafico_barra(cursor, element):
         # Lista para armazenar os valores
         valores = []
         
-        # Busca os valores para cada type_name no banco
+        # Busca os valores de todos os type_names em uma consulta
+        tabela = st.session_state.tabela_escolhida
+        encontrados = buscar_valores(cursor, tabela, user_id, [t.strip() for t in type_names])
         for type_name in type_names:
-            tabela = st.session_state.tabela_escolhida
-            cursor.execute(f"""
-                SELECT value_element 
-                FROM {tabela}
-                WHERE name_element = ? 
-                AND user_id = ?
-                ORDER BY ID_element DESC
-                LIMIT 1
-            """, (type_name.strip(), user_id))
-            
-            result = cursor.fetchone()
-            valor = result[0] if result and result[0] is not None else 0.0
-            valores.append(valor)
+            valor = encontrados.get(type_name.strip())
+            valores.append(valor if valor is not None else 0.0)
         
         # Sistema exclusivo para Âncoras de Carreira - Cores do prisma/espectro
         cores_ancoras = {
@@ -445,20 +420,11 @@ def tabela_dados(cursor, element):
         # Lista para armazenar os valores
         valores = []
         
-        # Busca os valores para cada type_name
+        # Busca os valores de todos os type_names em uma consulta
+        encontrados = buscar_valores(cursor, 'forms_resultados', user_id, [t.strip() for t in type_names])
         for type_name in type_names:
-            cursor.execute("""
-                SELECT value_element 
-                FROM forms_resultados 
-                WHERE name_element = ? 
-                AND user_id = ?
-                ORDER BY ID_element DESC
-                LIMIT 1
-            """, (type_name.strip(), user_id))
-            
-            result = cursor.fetchone()
-            valor = format_br_number(result[0]) if result and result[0] is not None else '0,00'
-            valores.append(valor)
+            valor = encontrados.get(type_name.strip())
+            valores.append(format_br_number(valor) if valor is not None else '0,00')
         
         # Criar DataFrame com os dados
         df = pd.DataFrame({
@@ -523,20 +489,13 @@ def gerar_dados_tabela(cursor, elemento, height_pct=100, width_pct=100):
         labels = str(rotulos).split('|')
         valores = []
         
-        # Busca os valores para cada type_name
+        # Busca os valores de todos os type_names em uma consulta
+        encontrados = buscar_valores(
+            cursor, st.session_state.tabela_escolhida, user_id, [t.strip() for t in type_names]
+        )
         for type_name in type_names:
-            cursor.execute(f"""
-                SELECT name_element, value_element 
-                FROM {st.session_state.tabela_escolhida}
-                WHERE name_element = ? 
-                AND user_id = ?
-                ORDER BY ID_element DESC
-                LIMIT 1
-            """, (type_name.strip(), user_id))
-            
-            result = cursor.fetchone()
-            valor = format_br_number(result[1]) if result and result[1] is not None else '0,00'
-            valores.append(valor)
+            valor = encontrados.get(type_name.strip())
+            valores.append(format_br_number(valor) if valor is not None else '0,00')
         
         # Retornar dados formatados para a tabela
         return {
@@ -562,19 +521,11 @@ def gerar_dados_grafico(cursor, elemento, tabela_escolhida: str, height_pct=100,
         type_names = str(select).split('|')
         labels = str(rotulos).split('|')
         valores = []
-        # Busca os valores para cada type_name
+        # Busca os valores de todos os type_names em uma consulta
+        encontrados = buscar_valores(cursor, tabela_escolhida, user_id, [t.strip() for t in type_names])
         for type_name in type_names:
-            cursor.execute(f"""
-                SELECT value_element 
-                FROM {tabela_escolhida}
-                WHERE name_element = ? 
-                AND user_id = ?
-                ORDER BY ID_element DESC
-                LIMIT 1
-            """, (type_name.strip(), user_id))
-            result = cursor.fetchone()
-            valor = float(result[0]) if result and result[0] is not None else 0.0
-            valores.append(valor)
+            valor = encontrados.get(type_name.strip())
+            valores.append(float(valor) if valor is not None else 0.0)
         
         # Sistema exclusivo para Âncoras de Carreira - Cores do prisma/espectro
         cores_ancoras = {
@@ -665,28 +616,13 @@ def subtitulo(titulo_pagina: str):
                     msg_placeholder = st.empty()
                     msg_placeholder.info("Gerando PDF... Por favor, aguarde.")
                     
-                    for _ in range(3):
-                        try:
-                            conn = sqlite3.connect(DB_PATH, timeout=20)
-                            cursor = conn.cursor()
-                            break
-                        except sqlite3.OperationalError as e:
-                            if "database is locked" in str(e):
-                                time.sleep(1)
-                                continue
-                            raise e
-                    else:
-                        st.error("Não foi possível conectar ao banco de dados. Tente novamente.")
-                        return
-                    
+                    # O PDF lê de um snapshot próprio: não espera gravadores nem os bloqueia
                     buffer = generate_pdf_content(
-                        cursor, 
                         st.session_state.user_id,
                         st.session_state.tabela_escolhida
                     )
                     
                     if buffer:
-                        conn.close()
                         msg_placeholder.success("PDF gerado com sucesso!")
                         st.download_button(
                             label="Baixar PDF",
@@ -698,9 +634,6 @@ def subtitulo(titulo_pagina: str):
                 except Exception as e:
                     msg_placeholder.error(f"Erro ao gerar PDF: {str(e)}")
                     st.write("Debug: Stack trace completo:", traceback.format_exc())
-                finally:
-                    if 'conn' in locals() and conn:
-                        conn.close()
                     
     except Exception as e:
         st.error(f"Erro ao gerar interface: {str(e)}")
@@ -814,10 +747,13 @@ def split_long_paragraph(text, max_length=2000):
     
     return sentences
 
-def generate_pdf_content(cursor, user_id: int, tabela_escolhida: str):
+def generate_pdf_content(user_id: int, tabela_escolhida: str):
     """
     Função para gerar PDF com layout específico: 
                     Tabela Âncoras P1 → Gráfico Âncoras P1 → Tabela Âncoras P2 → Gráfico Âncoras P2
+    
+    Todas as leituras são feitas em um único snapshot (banco/snapshot.py),
+    então o relatório é consistente mesmo com gravações concorrentes.
     """
     try:
         # Configurações de dimensões
@@ -836,7 +772,7 @@ def generate_pdf_content(cursor, user_id: int, tabela_escolhida: str):
             bottomMargin=36
         )
 
-        with sqlite3.connect(DB_PATH, timeout=20) as pdf_conn:
+        with snapshot_leitura(banco_do_usuario(user_id)) as pdf_conn:
             pdf_cursor = pdf_conn.cursor()
             elements = []
             styles = getSampleStyleSheet()
@@ -889,16 +825,11 @@ def generate_pdf_content(cursor, user_id: int, tabela_escolhida: str):
             elements.append(Spacer(1, 20))
 
             # Buscar todos os elementos (tabelas e gráficos)
-            pdf_cursor.execute(f"""
-                SELECT name_element, type_element, math_element, msg_element,
-                       value_element, select_element, str_element, e_col, e_row,
-                       section, user_id
-                FROM {tabela_escolhida}
-                WHERE (type_element = 'tabela' OR type_element = 'grafico')
-                AND user_id = ?
-                ORDER BY e_row, e_col
-            """, (user_id,))
-            elementos = pdf_cursor.fetchall()
+            elementos = buscar_elementos(
+                pdf_cursor, tabela_escolhida, user_id,
+                colunas=COLUNAS_ELEMENTO,
+                tipos=['tabela', 'grafico']
+            )
 
             # Separar tabelas e gráficos
             tabelas = [e for e in elementos if e[1] == 'tabela']
@@ -918,21 +849,14 @@ def generate_pdf_content(cursor, user_id: int, tabela_escolhida: str):
                 'D34': {'nome': 'Desafio Puro', 'descricao': 'Busca por desafios complexos e competição', 'arquivo': 'Conteudo/A8_Desafio_Puro.md'}
             }
             
-            # Calcular ranking das âncoras
+            # Calcular ranking das âncoras (valores buscados em uma consulta)
             ranking_ancoras_pdf = []
+            valores_ancoras_pdf = buscar_valores(
+                pdf_cursor, 'forms_resultados', user_id, list(mapeamento_ancoras_pdf.keys())
+            )
             for codigo in mapeamento_ancoras_pdf.keys():
-                # Usar mesma lógica da função da tela que funciona
-                pdf_cursor.execute("""
-                    SELECT value_element 
-                    FROM forms_resultados 
-                    WHERE name_element = ? 
-                    AND user_id = ?
-                    ORDER BY ID_element DESC
-                    LIMIT 1
-                """, (codigo.strip(), user_id))
-                
-                result = pdf_cursor.fetchone()
-                valor_total = parse_br_number(result[0]) if result and result[0] is not None else 0.0
+                valor = valores_ancoras_pdf.get(codigo)
+                valor_total = parse_br_number(valor) if valor is not None else 0.0
                 
                 ranking_ancoras_pdf.append({
                     'codigo': codigo,
@@ -1363,6 +1287,7 @@ def show_results(tabela_escolhida: str, titulo_pagina: str, user_id: int):
     """
     Função principal para exibir a interface web
     """
+    conn = None
     try:
         if not user_id:
             st.error("Usuário não está logado!")
@@ -1374,20 +1299,11 @@ def show_results(tabela_escolhida: str, titulo_pagina: str, user_id: int):
         # Adiciona o subtítulo antes do conteúdo principal
         subtitulo(titulo_pagina)
         
-        # Estabelece conexão com retry
-        for _ in range(3):
-            try:
-                conn = sqlite3.connect(DB_PATH, timeout=20)
-                cursor = conn.cursor()
-                break
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e):
-                    time.sleep(1)
-                    continue
-                raise e
-        else:
-            st.error("Não foi possível conectar ao banco de dados. Tente novamente.")
-            return
+        # Conexão do pool no banco do usuário (espera por lock via busy_timeout, sem retry manual).
+        # A página só lê por ela: new_user e call_dados gravam por transacao_com_retentativa,
+        # e com o gravador único ligado a conexão é somente leitura
+        conn = conexao_do_usuario(user_id, leitura=True)
+        cursor = conn.cursor()
             
         # 1. Verifica/inicializa dados na tabela escolhida
         new_user(cursor, user_id, tabela_escolhida)
@@ -1423,19 +1339,11 @@ def show_results(tabela_escolhida: str, titulo_pagina: str, user_id: int):
         st.markdown(hide_streamlit_style, unsafe_allow_html=True)
         
         # Buscar todos os elementos ordenados por row e col
-        cursor.execute(f"""
-            SELECT name_element, type_element, math_element, msg_element,
-                   value_element, select_element, str_element, e_col, e_row,
-                   section, user_id
-            FROM {tabela_escolhida}
-            WHERE (type_element = 'titulo' OR type_element = 'pula linha' 
-                  OR type_element = 'call_dados' OR type_element = 'grafico'
-                  OR type_element = 'tabela')
-            AND user_id = ?
-            ORDER BY e_row, e_col
-        """, (user_id,))
-        
-        elements = cursor.fetchall()
+        elements = buscar_elementos(
+            cursor, tabela_escolhida, user_id,
+            colunas=COLUNAS_ELEMENTO,
+            tipos=['titulo', 'pula linha', 'call_dados', 'grafico', 'tabela']
+        )
         
         # Contador para gráficos
         grafico_count = 0
@@ -1538,21 +1446,12 @@ def tabela_dados_sem_titulo(cursor, element):
         # Lista para armazenar os valores
         valores = []
         
-        # Busca os valores para cada type_name
+        # Busca os valores de todos os type_names em uma consulta
+        tabela = st.session_state.tabela_escolhida  # Pega a tabela da sessão
+        encontrados = buscar_valores(cursor, tabela, user_id, [t.strip() for t in type_names])
         for type_name in type_names:
-            tabela = st.session_state.tabela_escolhida  # Pega a tabela da sessão
-            cursor.execute(f"""
-                SELECT value_element 
-                FROM {tabela}
-                WHERE name_element = ? 
-                AND user_id = ?
-                ORDER BY ID_element DESC
-                LIMIT 1
-            """, (type_name.strip(), user_id))
-            
-            result = cursor.fetchone()
-            valor = format_br_number(result[0]) if result and result[0] is not None else '0,00'
-            valores.append(valor)
+            valor = encontrados.get(type_name.strip())
+            valores.append(format_br_number(valor) if valor is not None else '0,00')
         
         # Criar DataFrame com os dados
         df = pd.DataFrame({
@@ -1621,15 +1520,9 @@ def buscar_valor_ancora(cursor, user_id, name_element):
     Busca valor específico de uma âncora na tabela forms_resultados
     """
     try:
-        cursor.execute("""
-            SELECT value_element FROM forms_resultados
-            WHERE user_id = ? AND name_element = ?
-            LIMIT 1
-        """, (user_id, name_element))
-        
-        result = cursor.fetchone()
-        if result and result[0] is not None:
-            valor = parse_br_number(result[0])
+        valor = buscar_valores(cursor, 'forms_resultados', user_id, [name_element]).get(name_element)
+        if valor is not None:
+            valor = parse_br_number(valor)
             # Correção para valores multiplicados por 1000
             return valor / 1000 if valor >= 1000 else valor
         return 0.0
@@ -1643,13 +1536,9 @@ def analisar_ancoras_carreira_streamlit(cursor, user_id):
     Combina valores P1 e P2 para criar ranking das 8 âncoras
     """
     try:
-        # 1. Buscar dados do usuário
-        cursor.execute("""
-            SELECT u.nome, u.email, u.empresa 
-            FROM usuarios u 
-            WHERE u.user_id = ?
-        """, (user_id,))
-        usuario_info = cursor.fetchone()
+        # 1. Buscar dados do usuário (cache de usuarios)
+        usuario = obter_usuario(user_id)
+        usuario_info = (usuario['nome'], usuario['email'], usuario['empresa']) if usuario else None
         
         # 2. Definir mapeamento completo das âncoras (códigos corretos do banco)
         # Cores do prisma/espectro para as 8 âncoras
@@ -1711,19 +1600,12 @@ def analisar_ancoras_carreira_streamlit(cursor, user_id):
         codigos_ancoras = list(mapeamento_ancoras.keys())
         ranking_ancoras = []
         
+        # Usar a mesma lógica da função tabela_dados (uma consulta para as 8 âncoras)
+        valores_ancoras = buscar_valores(cursor, tabela, user_id, codigos_ancoras)
+        
         for codigo in codigos_ancoras:
-            # Usar a mesma lógica da função tabela_dados que funciona
-            cursor.execute("""
-                SELECT value_element 
-                FROM forms_resultados 
-                WHERE name_element = ? 
-                AND user_id = ?
-                ORDER BY ID_element DESC
-                LIMIT 1
-            """, (codigo.strip(), user_id))
-            
-            result = cursor.fetchone()
-            valor_total = parse_br_number(result[0]) if result and result[0] is not None else 0.0
+            valor = valores_ancoras.get(codigo)
+            valor_total = parse_br_number(valor) if valor is not None else 0.0
             
 
             
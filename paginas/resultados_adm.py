@@ -6,6 +6,10 @@ import streamlit as st
 import sqlite3
 import pandas as pd
 from config import DB_PATH
+from banco.backends import banco_disponivel
+from banco.valores import contar_usuarios_com_dados, usuario_tem_dados
+from banco.shards import conexao_do_usuario, ler_em_todos
+from banco.usuarios import listar_usuarios
 from paginas.monitor import registrar_acesso
 # from paginas.resultados import show_results  # Removido - usando redirecionamento
 
@@ -47,23 +51,16 @@ def show_resultados_adm():
     """, unsafe_allow_html=True)
     
     # Verificar se o banco existe
-    if not DB_PATH.exists():
+    if not banco_disponivel():
         st.error(f"❌ **Banco de dados não encontrado:** {DB_PATH}")
         return
     
     try:
-        # Conectar ao banco
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Buscar usuários cadastrados
-        cursor.execute("""
-            SELECT user_id, nome, email, perfil, empresa 
-            FROM usuarios 
-            WHERE perfil = 'usuario'
-            ORDER BY nome
-        """)
-        usuarios = cursor.fetchall()
+        # Buscar usuários cadastrados (cache de usuarios: sem consulta a cada rerun)
+        usuarios = [
+            (u['user_id'], u['nome'], u['email'], u['perfil'], u['empresa'])
+            for u in listar_usuarios('usuario')
+        ]
         
         if not usuarios:
             st.warning("⚠️ **Nenhum usuário encontrado** na base de dados.")
@@ -80,13 +77,10 @@ def show_resultados_adm():
             empresas_unicas = len(df_usuarios['Empresa'].dropna().unique())
             st.metric("Empresas Cadastradas", empresas_unicas)
         with col3:
-            # Verificar quantos usuários têm análises
-            cursor.execute("""
-                SELECT COUNT(DISTINCT user_id) 
-                FROM forms_resultados 
-                WHERE user_id IN (SELECT user_id FROM usuarios WHERE perfil = 'usuario')
-            """)
-            usuarios_com_analises = cursor.fetchone()[0]
+            # Verificar quantos usuários têm análises (somando os shards por empresa, em paralelo)
+            usuarios_com_analises = sum(total for _, total in ler_em_todos(
+                lambda conn_banco: contar_usuarios_com_dados(conn_banco.cursor(), 'forms_resultados', 'usuario')
+            ))
             st.metric("Usuários com Análises", usuarios_com_analises)
         
         st.markdown("---")
@@ -148,13 +142,12 @@ def show_resultados_adm():
                     
                     st.success(f"✅ **Usuário selecionado:** {usuario_info['Nome']}")
                     
-                    # Verificar se o usuário tem análises
-                    cursor.execute("""
-                        SELECT COUNT(*) 
-                        FROM forms_resultados 
-                        WHERE user_id = ?
-                    """, (user_id_selecionado,))
-                    tem_analises = cursor.fetchone()[0] > 0
+                    # Verificar se o usuário tem análises (no banco da empresa dele)
+                    conn_usuario = conexao_do_usuario(int(user_id_selecionado))
+                    try:
+                        tem_analises = usuario_tem_dados(conn_usuario.cursor(), 'forms_resultados', user_id_selecionado)
+                    finally:
+                        conn_usuario.close()
                     
                     col1, col2 = st.columns([1, 1])
                     
@@ -202,7 +195,4 @@ def show_resultados_adm():
     except sqlite3.Error as e:
         st.error(f"❌ **Erro de banco de dados:** {str(e)}")
     except Exception as e:
-        st.error(f"❌ **Erro inesperado:** {str(e)}")
-    finally:
-        if 'conn' in locals():
-            conn.close() 
\ No newline at end of file
+        st.error(f"❌ **Erro inesperado:** {str(e)}") 
\ No newline at end of file
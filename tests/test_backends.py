@@ -0,0 +1,152 @@
+# tests/test_backends.py
+# Mesmos testes nos dois backends (banco/backends.py): SQLite e PostgreSQL (TEST_DATABASE_URL)
+# Data: 19/10/2026 - Hora: 13:00
+
+import pandas as pd
+import pytest
+
+from banco import valores
+from banco.backends import get_backend, info_colunas
+from banco.conexao import get_connection
+from banco.migracoes import MIGRACOES, aplicar_migracoes, versao_atual
+from banco.snapshot import snapshot_leitura
+
+USUARIO = 5
+
+
+def _valor(conn, nome, campo='value_element'):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {campo} FROM forms_tab WHERE user_id = ? AND name_element = ?", (USUARIO, nome))
+    return cursor.fetchone()[0]
+
+
+def test_migracoes_aplicadas_e_idempotentes(backend):
+    aplicar_migracoes()
+    segunda = aplicar_migracoes()
+    assert segunda['executados'] == []
+    conn = get_connection()
+    try:
+        assert versao_atual(conn.cursor()) == max(m['versao'] for m in MIGRACOES)
+        existentes = backend.objetos_existentes(conn.cursor())
+    finally:
+        conn.close()
+    assert {'idx_usuarios_email_lower', 'forms_tab_valores', 'mudancas_valores'} <= existentes
+
+
+def test_info_colunas_no_formato_do_pragma(backend):
+    conn = get_connection()
+    try:
+        colunas = {linha[1].lower(): linha for linha in info_colunas(conn.cursor(), 'forms_tab')}
+    finally:
+        conn.close()
+    assert {'name_element', 'value_element', 'str_element', 'user_id'} <= set(colunas)
+    assert colunas['id_element'][5] == 1  # chave primária
+
+
+def test_placeholders_e_textos_com_porcentagem(backend):
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM forms_tab WHERE user_id = ? AND name_element LIKE 'A%' AND msg_element <> '?'",
+            (USUARIO,)
+        )
+        assert cursor.fetchone()[0] > 0
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('modo', ['legado', 'normalizado'])
+def test_gravar_e_buscar_valores(backend, monkeypatch, modo):
+    monkeypatch.setattr(valores, 'STORAGE_MODE', modo)
+    aplicar_migracoes()
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        valores.gravar_valores(cursor, 'forms_tab', [
+            (USUARIO, 'A12', {'value_element': 0.0, 'str_element': '30 pontos'}),
+            (USUARIO, 'A121', {'value_element': 30.0}),
+        ])
+        conn.commit()
+        assert valores.buscar_valores(cursor, 'forms_tab', USUARIO, ['A12'], campo='str_element') == {'A12': '30 pontos'}
+        assert valores.buscar_valores(cursor, 'forms_tab', USUARIO, ['A121']) == {'A121': 30.0}
+    finally:
+        conn.close()
+
+
+def test_snapshot_nao_ve_gravacoes_posteriores(backend):
+    with snapshot_leitura() as leitor:
+        antes = _valor(leitor, 'A121')
+        conn = get_connection()
+        try:
+            conn.execute("UPDATE forms_tab SET value_element = ? WHERE user_id = ? AND name_element = ?",
+                         (-1.0, USUARIO, 'A121'))
+            conn.commit()
+        finally:
+            conn.close()
+        assert _valor(leitor, 'A121') == antes
+    conn = get_connection()
+    try:
+        assert _valor(conn, 'A121') == -1.0
+    finally:
+        conn.close()
+
+
+def test_snapshot_em_conexao_do_pool_nao_deixa_a_sessao_somente_leitura(backend):
+    conn = get_connection()
+    get_backend().iniciar_snapshot(conn)
+    conn.rollback()
+    conn.close()
+
+    # A mesma conexão volta do pool e precisa aceitar gravações no nível padrão
+    reutilizada = get_connection()
+    try:
+        assert reutilizada is conn
+        reutilizada.execute("UPDATE forms_tab SET value_element = ? WHERE user_id = ? AND name_element = ?",
+                            (7.0, USUARIO, 'A121'))
+        reutilizada.commit()
+        assert _valor(reutilizada, 'A121') == 7.0
+    finally:
+        reutilizada.close()
+
+
+def test_salvar_alteracoes_do_editor_pela_chave_primaria(backend):
+    from paginas.crude import salvar_alteracoes
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        colunas = [linha[1] for linha in info_colunas(cursor, 'usuarios')]
+        # Ordem de exibição diferente da de inserção: a linha não pode ser achada pela posição
+        cursor.execute("SELECT * FROM usuarios ORDER BY id DESC")
+        original = pd.DataFrame(cursor.fetchall(), columns=colunas)
+        editado = original.copy()
+        alvo = original.index[-1]
+        editado.loc[alvo, 'nome'] = 'Nome Editado'
+        assert salvar_alteracoes(cursor, 'usuarios', original, editado) == (1, [])
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM usuarios WHERE nome = ?", ('Nome Editado',))
+        assert cursor.fetchone()[0] == 1
+        cursor.execute("SELECT nome FROM usuarios WHERE id = ?", (int(original.loc[alvo, 'id']),))
+        assert cursor.fetchone()[0] == 'Nome Editado'
+
+        colunas = [linha[1] for linha in info_colunas(cursor, 'forms_tab')]
+        id_element, name_element = colunas[0], colunas[1]
+        cursor.execute(f"SELECT * FROM forms_tab WHERE user_id = ? ORDER BY {name_element} DESC", (USUARIO,))
+        original = pd.DataFrame(cursor.fetchall(), columns=colunas)
+        editado = original.copy()
+        linha = original.index[original[name_element] == 'A121'][0]
+        editado.loc[linha, 'str_element'] = 'editado'
+        novo = original.loc[linha].copy()
+        novo[id_element] = int(original[id_element].max()) + 100_000
+        novo[name_element] = 'A121_novo'
+        repetido = original.loc[linha].copy()
+        editado = pd.concat([editado, pd.DataFrame([novo, repetido])], ignore_index=True)
+        gravadas, erros = salvar_alteracoes(cursor, 'forms_tab', original, editado)
+        conn.commit()
+        assert gravadas == 2 and len(erros) == 1
+        assert _valor(conn, 'A121', 'str_element') == 'editado'
+        cursor.execute(f"SELECT COUNT(*) FROM forms_tab WHERE {id_element} = ?", (int(novo[id_element]),))
+        assert cursor.fetchone()[0] == 1
+    finally:
+        conn.close()
@@ -0,0 +1,79 @@
+# tests/test_formulas.py
+# Compilador de fórmulas: precedência, referências, divisão por zero, sintaxe inválida e a conferência calcular x avaliar_vetor
+# Data: 19/10/2026 - Hora: 18:30
+
+import pytest
+
+from banco.conexao import get_connection
+from calculo.diferencial import CASOS_BORDA, conferir, montar_corpus
+from calculo.formulas import ErroFormula, analisar, calcular, compilar
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('1+2*3', 7.0),
+    ('(1+2)*3', 9.0),
+    ('10-4-3', 3.0),
+    ('8/4/2', 1.0),
+    ('2*3**2', 18.0),
+    ('2**3**2', 512.0),
+    ('-2**2', -4.0),
+    ('2**-1', 0.5),
+    ('--3', 3.0),
+    ('1,5*2', 3.0),
+])
+def test_precedencia(texto, esperado):
+    assert compilar(texto).avaliar({}) == esperado
+
+
+def test_referencias_insumos():
+    formula = compilar('Insumos!D10*A1+D10')
+    assert formula.referencias == ('Insumos!D10', 'A1', 'D10')
+    assert formula.avaliar({'Insumos!D10': 2.0, 'A1': 3.0, 'D10': 100.0}) == 106.0
+    assert formula.referencias_invalidas({'A1'}) == ['D10']
+
+
+def test_prefixo_a1_a12():
+    formula = compilar('A1+A12-AB12')
+    assert formula.referencias == ('A1', 'A12', 'AB12')
+    assert formula.avaliar({'A1': 1.0, 'A12': 10.0, 'AB12': 100.0}) == -89.0
+    assert formula.avaliar({'A12': 10.0}) == 10.0
+
+
+def test_divisao_por_zero():
+    assert compilar('A1/A2').avaliar({'A1': 5.0, 'A2': 0.0}) == 0.0
+    assert compilar('1+A1/(A2-A2)').avaliar({'A1': 5.0, 'A2': 3.0}) == 1.0
+    assert compilar('A1/A2/A3').avaliar({'A1': 6.0, 'A2': 0.0, 'A3': 2.0}) == 0.0
+    assert calcular('A1/0', {'A1': 3.0}) == 0.0
+    assert calcular('10+A1/A2', {'A1': 3.0, 'A2': 1e-12}) == 10.0
+
+
+def test_valor_nulo_vale_zero():
+    assert calcular('A1+A2', {'A1': None, 'A2': 2.0}) == 2.0
+    assert calcular('A1*A2', {}) == 0.0
+
+
+@pytest.mark.parametrize('texto, posicao', [
+    ('', 0),
+    ('1+', 2),
+    ('(A1+2', 5),
+    ('A1 $ 2', 3),
+    ('A1 A2', 3),
+    ('A1+*2', 3),
+])
+def test_sintaxe_invalida(texto, posicao):
+    with pytest.raises(ErroFormula) as erro:
+        analisar(texto)
+    assert erro.value.posicao == posicao
+    with pytest.raises(ErroFormula):
+        compilar(texto)
+    assert calcular(texto, {'A1': 1.0}) == 0.0
+
+
+def test_conferencia_calcular_avaliar_vetor(banco):
+    """A página (calcular) e o recálculo em lote (avaliar_vetor) dão o mesmo valor em todas as fórmulas."""
+    conexao = get_connection()
+    corpus = montar_corpus(conexao.cursor())
+    assert len(corpus) > len(CASOS_BORDA)
+    relatorio = conferir(corpus, amostras=100)
+    assert relatorio['comparacoes'] >= len(corpus) * 100
+    assert relatorio['total_divergencias'] == 0, relatorio['divergencias']
@@ -0,0 +1,73 @@
+# tests/test_gravador.py
+# Gravador único ligado: leitores do pool somente leitura e gravações pela fila (banco/gravador.py)
+# Data: 19/10/2026 - Hora: 15:00
+
+import sqlite3
+
+import pytest
+
+from banco import gravador
+from banco.conexao import fechar_conexoes, get_connection
+from banco.retentativa import transacao_com_retentativa
+
+USUARIO = 5
+
+
+def _gravar(cursor, valor):
+    cursor.execute("UPDATE forms_tab SET value_element = ? WHERE user_id = ? AND name_element = 'A121'",
+                   (valor, USUARIO))
+
+
+def _valor(conn):
+    return conn.execute("SELECT value_element FROM forms_tab WHERE user_id = ? AND name_element = 'A121'",
+                        (USUARIO,)).fetchone()[0]
+
+
+@pytest.fixture
+def ligado(banco, monkeypatch):
+    monkeypatch.setattr(gravador, 'DB_GRAVADOR_UNICO', True)
+    yield
+    gravador.encerrar()
+    fechar_conexoes()
+
+
+def test_leitor_somente_leitura_grava_pelo_gravador(ligado):
+    leitor = get_connection(leitura=True)
+    try:
+        assert leitor.somente_leitura
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            _gravar(leitor.cursor(), 1.0)
+
+        antes = gravador.get_estatisticas()['pedidos']
+        transacao_com_retentativa(leitor, 'teste.gravador', _gravar, 42.0)
+        assert gravador.get_estatisticas()['pedidos'] == antes + 1
+        assert _valor(leitor) == 42.0
+    finally:
+        leitor.close()
+
+
+def test_leitor_e_gravacao_direta_em_conexoes_separadas(ligado):
+    leitor = get_connection(leitura=True)
+    conn = get_connection()
+    try:
+        assert conn is not leitor and not conn.somente_leitura
+        _gravar(conn.cursor(), 7.0)  # CRUD/manutenção continuam gravando na própria conexão
+        conn.commit()
+        assert _valor(leitor) == 7.0
+    finally:
+        conn.close()
+        leitor.close()
+    # Cada uma volta para o seu pool
+    assert get_connection(leitura=True) is leitor
+    leitor.close()
+
+
+def test_desligado_leitura_usa_a_conexao_normal(banco):
+    conn = get_connection()
+    try:
+        assert get_connection(leitura=True) is conn
+        conn.close()
+        assert not conn.somente_leitura
+    finally:
+        conn.close()
+        fechar_conexoes()
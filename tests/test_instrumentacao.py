@@ -0,0 +1,35 @@
+# tests/test_instrumentacao.py
+# Log de consultas lentas: gravação fora da transação de quem chamou e rotação (banco/instrumentacao.py)
+# Data: 19/10/2026 - Hora: 12:00
+
+from banco import instrumentacao
+from banco.conexao import get_connection
+
+
+def test_lenta_gravada_com_o_lock_ainda_ocupado(banco, monkeypatch):
+    monkeypatch.setattr(instrumentacao, 'DB_SLOW_QUERY_MS', 0)  # toda instrução é "lenta"
+    conn = get_connection(banco)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE forms_tab SET value_element = value_element WHERE user_id = ?", (5,))
+        # O EXPLAIN e a escrita acontecem na thread do log, com a transação ainda aberta
+        assert instrumentacao.aguardar_log_lentas(5.0)
+        assert conn.in_transaction
+        entrada = next(
+            e for e in instrumentacao.ler_log_lentas(20) if e['digital'].startswith('UPDATE forms_tab')
+        )
+        assert entrada['plano'] and not entrada['plano'][0].startswith('plano indisponível')
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_log_passa_a_arquivo_antigo_no_limite(banco, monkeypatch):
+    monkeypatch.setattr(instrumentacao, 'SLOW_QUERY_LOG_MAX_KB', 1)
+    for i in range(40):
+        instrumentacao._escrever_lenta({'digital': f'SELECT {i}', 'texto': 'x' * 100})
+    log = instrumentacao.SLOW_QUERY_LOG
+    assert log.stat().st_size < 2048
+    assert log.with_name(f"{log.name}.1").exists()
+    recentes = instrumentacao.ler_log_lentas(3)
+    assert [e['digital'] for e in recentes] == ['SELECT 39', 'SELECT 38', 'SELECT 37']
@@ -0,0 +1,141 @@
+# tests/test_shards.py
+# Shards por empresa: migrações, template, manutenção e arquivamento do log em todos os bancos do diretório
+# Data: 19/10/2026 - Hora: 16:00
+
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from banco import arquivo_log, conexao, manutencao, provisionamento, shards
+from banco.conexao import fechar_conexoes, get_connection
+from banco.migracoes import MIGRACOES, aplicar_migracoes, aplicar_migracoes_em_todos
+from banco.mudancas import consumidores
+
+EMPRESA = 'EAR'
+
+
+@pytest.fixture
+def shard(banco, tmp_path, monkeypatch):
+    """Banco migrado com o shard da empresa EAR em tmp_path (pastas de backup e de log também)."""
+    for pasta in ('shards', 'backup', 'arquivo'):
+        (tmp_path / pasta).mkdir()
+    monkeypatch.setattr(shards, 'DB_SHARDING', True)
+    monkeypatch.setattr(conexao, 'DB_SHARDING', True)
+    monkeypatch.setattr(shards, 'SHARD_DIR', tmp_path / 'shards')
+    monkeypatch.setattr(manutencao, 'BACKUP_DIR', tmp_path / 'backup')
+    monkeypatch.setattr(arquivo_log, 'LOG_ARQUIVO_DIR', tmp_path / 'arquivo')
+    aplicar_migracoes()
+    arquivo = shards.criar_shard(EMPRESA)['arquivo']
+    yield arquivo
+    fechar_conexoes()
+
+
+def _consultar(arquivo, sql, parametros=()):
+    conn = sqlite3.connect(arquivo)
+    try:
+        return conn.execute(sql, parametros).fetchall()
+    finally:
+        conn.close()
+
+
+def _envelhecer_shard(arquivo):
+    """Shard criado antes da migração 7: sem o registro de mudanças e sem carimbo de origem."""
+    conn = sqlite3.connect(arquivo)
+    try:
+        for (nome,) in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'trg_cdc_%'").fetchall():
+            conn.execute(f"DROP TRIGGER {nome}")
+        for tabela in ('mudancas_valores', 'mudancas_consumidores', 'template_origem'):
+            conn.execute(f"DROP TABLE {tabela}")
+        conn.execute("PRAGMA user_version = 6")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_migracoes_chegam_ao_shard_antigo(shard):
+    _envelhecer_shard(shard)
+    relatorios = aplicar_migracoes_em_todos()
+    assert set(relatorios) == {None, shard}
+    assert relatorios[shard]['versao_final'] == max(m['versao'] for m in MIGRACOES)
+    assert _consultar(shard, "PRAGMA user_version")[0][0] == relatorios[shard]['versao_final']
+
+    # Os consumidores do CDC passam a ser lidos do shard também
+    lidos = dict(shards.ler_em_todos(lambda conn: consumidores(conn.cursor())))
+    assert set(lidos) == {None, shard}
+
+
+def test_template_recopiado_quando_o_carimbo_muda(shard):
+    assert shards.sincronizar_templates(somente_alterados=True) == {}
+
+    conn = get_connection()
+    try:
+        nome = conn.execute("""
+            SELECT name_element FROM forms_tab WHERE user_id = 0 AND name_element <> ''
+            GROUP BY name_element HAVING COUNT(*) = 1 LIMIT 1
+        """).fetchone()[0]
+        conn.execute("UPDATE forms_tab SET msg_element = 'layout novo' WHERE user_id = 0 AND name_element = ?",
+                     (nome,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    copiadas = shards.sincronizar_templates(somente_alterados=True)
+    assert set(copiadas) == {shard}
+    assert _consultar(shard, "SELECT msg_element FROM forms_tab WHERE user_id = 0 AND name_element = ?",
+                      (nome,)) == [('layout novo',)]
+    assert shards.sincronizar_templates(somente_alterados=True) == {}
+
+
+def test_backup_e_compactacao_incluem_o_shard(shard, tmp_path):
+    backup = manutencao.fazer_backup(pausa_ms=0)
+    assert backup['ok'] and not backup['falhas_shards']
+    copia = Path(backup['shards'][shard])
+    assert copia.parent == tmp_path / 'backup' and copia.name.startswith(f"{Path(shard).stem}_backup_")
+    for tabela in ('forms_tab', 'log_acessos'):
+        assert _consultar(copia, f"SELECT COUNT(*) FROM {tabela}") == _consultar(shard, f"SELECT COUNT(*) FROM {tabela}")
+
+    compactado = manutencao.compactar(tmp_path / 'compactado.db')
+    assert compactado['ok'] and Path(compactado['shards'][shard]).exists()
+
+    otimizado = manutencao.otimizar()
+    assert otimizado['ok'] and otimizado['bancos'] == 2
+
+
+def test_log_do_shard_arquivado_e_lido_de_volta(shard):
+    registro = manutencao.arquivar_log()
+    assert registro['ok'] and not registro['falhas_shards']
+    meses_shard = registro['shards'][shard]
+    assert meses_shard and set(meses_shard) == set(arquivo_log.meses_arquivados(shard))
+    assert all(arquivo_log.arquivo_do_mes(mes, shard).exists() for mes in meses_shard)
+    # Os arquivos do shard não se misturam com os do principal
+    assert arquivo_log.arquivo_do_mes(min(meses_shard), shard) != arquivo_log.arquivo_do_mes(min(meses_shard))
+
+    conn = get_connection(shard)
+    try:
+        with arquivo_log.fonte_log_acessos(conn, '2025-01-01', date.today().isoformat()) as fonte:
+            total = conn.execute(f"SELECT COUNT(*) FROM {fonte} la").fetchone()[0]
+    finally:
+        conn.close()
+    assert total == sum(meses_shard.values()) + _consultar(shard, "SELECT COUNT(*) FROM log_acessos")[0][0]
+
+
+def test_poda_do_registro_de_mudancas_no_shard(shard):
+    registro = manutencao.podar_mudancas()
+    assert registro['ok'] and set(registro['shards']) == {shard}
+
+
+def test_provisionamento_de_existentes_nao_repete_usuarios_do_shard(shard):
+    primeira = provisionamento.provisionar(None)
+    conn = get_connection()
+    try:
+        ids_ear = {linha[0] for linha in conn.execute("SELECT user_id FROM usuarios WHERE empresa = ?", (EMPRESA,))}
+    finally:
+        conn.close()
+    assert ids_ear and primeira['usuarios'] > len(ids_ear)
+    marcados = {linha[0] for linha in _consultar(shard, "SELECT user_id FROM usuarios_provisionados")}
+    assert ids_ear <= marcados
+
+    segunda = provisionamento.provisionar(None)
+    assert segunda['usuarios'] == 0 and segunda['linhas'] == 0 and segunda['lotes'] == 0
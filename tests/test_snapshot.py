@@ -0,0 +1,53 @@
+# tests/test_snapshot.py
+# Snapshot de leitura e PDF com um gravador segurando o lock de escrita (banco/snapshot.py)
+# Data: 19/10/2026 - Hora: 11:00
+
+import sqlite3
+import time
+
+import pytest
+
+from banco import backends
+from banco.snapshot import snapshot_leitura
+from paginas.resultados import generate_pdf_content
+
+USUARIO = 5
+PRAZO_S = 10  # bem abaixo de um busy_timeout de espera real
+
+
+@pytest.fixture
+def gravador(banco, monkeypatch):
+    """Segunda conexão com BEGIN IMMEDIATE e uma gravação sem commit até o fim do teste."""
+    # Um leitor que precisasse do lock falharia em 50 ms em vez de esperar 20 s
+    monkeypatch.setattr(backends, 'DB_BUSY_TIMEOUT_MS', 50)
+    conn = sqlite3.connect(banco, isolation_level=None, timeout=0)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(
+        "UPDATE forms_resultados SET value_element = -12345 WHERE user_id = ?", (USUARIO,)
+    )
+    yield conn
+    conn.rollback()
+    conn.close()
+
+
+def test_snapshot_nao_espera_o_gravador(banco, gravador):
+    inicio = time.perf_counter()
+    with snapshot_leitura(banco) as conn:
+        valores = [v for (v,) in conn.execute(
+            "SELECT value_element FROM forms_resultados WHERE user_id = ?", (USUARIO,)
+        )]
+    assert time.perf_counter() - inicio < PRAZO_S
+    assert valores and -12345 not in valores  # a gravação sem commit não aparece
+
+    # O lock continua com o gravador
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        sqlite3.connect(banco, timeout=0).execute("BEGIN IMMEDIATE")
+
+
+def test_pdf_gerado_com_o_lock_de_escrita_ocupado(banco, gravador):
+    inicio = time.perf_counter()
+    buffer = generate_pdf_content(USUARIO, 'forms_resultados')
+    assert time.perf_counter() - inicio < PRAZO_S
+    assert buffer is not None
+    assert buffer.getvalue().startswith(b'%PDF')
+    assert gravador.in_transaction
@@ -3,12 +3,14 @@
 # Data: 03/08/2025 - Hora: 21:15
 
 import os
-import sqlite3
-from config import DB_PATH
+from banco.conexao import get_connection
+from banco.backends import banco_disponivel, info_colunas
+from banco.retentativa import transacao_com_retentativa
+from banco.usuarios import obter_usuario, invalidar_usuario
 
 # Cache global para evitar múltiplas leituras de arquivo
 _TEXTOS_CACHE = {}
-_USER_LANGUAGE_CACHE = {}
+_USER_LANGUAGE_CACHE = {}  # usuários temporários da tela de login (temp_<idioma>); os demais vêm de banco/usuarios.py
 
 def get_user_language(user_id=None):
     """
@@ -47,36 +49,16 @@ def get_user_language(user_id=None):
     
     try:
         # Verifica se o banco existe
-        if not DB_PATH.exists():
+        if not banco_disponivel():
             return 'pt'
         
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Verifica se a coluna idioma existe
-        cursor.execute("PRAGMA table_info(usuarios)")
-        columns = [column[1] for column in cursor.fetchall()]
+        # Busca o idioma no cache de usuarios (banco/usuarios.py), invalidado por set_user_language
+        usuario = obter_usuario(user_id)
+        language = usuario['idioma'] if usuario else None
         
-        if 'idioma' not in columns:
-            # Coluna não existe, retorna padrão
-            conn.close()
-            return 'pt'
-        
-        # Busca o idioma do usuário
-        cursor.execute("SELECT idioma FROM usuarios WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        
-        conn.close()
-        
-        if result and result[0]:
-            language = result[0]
-            # Valida se é um idioma suportado
-            if language in ['pt', 'en', 'es']:
-                _USER_LANGUAGE_CACHE[user_id] = language
-                return language
-        
-        # Se não encontrou ou idioma inválido, retorna padrão
-        _USER_LANGUAGE_CACHE[user_id] = 'pt'
+        # Valida se é um idioma suportado; se não encontrou ou idioma inválido, retorna padrão
+        if language in ['pt', 'en', 'es']:
+            return language
         return 'pt'
         
     except Exception as e:
@@ -216,16 +198,15 @@ def set_user_language(user_id, language):
         language = 'pt'
     
     try:
-        if not DB_PATH.exists():
+        if not banco_disponivel():
             print("⚠️ AVISO: Banco de dados não encontrado!")
             return False
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # Verifica se a coluna idioma existe
-        cursor.execute("PRAGMA table_info(usuarios)")
-        columns = [column[1] for column in cursor.fetchall()]
+        columns = [column[1] for column in info_colunas(cursor, 'usuarios')]
         
         if 'idioma' not in columns:
             print("⚠️ AVISO: Coluna 'idioma' não existe na tabela usuarios!")
@@ -233,19 +214,22 @@ def set_user_language(user_id, language):
             return False
         
         # Atualiza o idioma do usuário
-        cursor.execute("UPDATE usuarios SET idioma = ? WHERE user_id = ?", (language, user_id))
+        atualizados = transacao_com_retentativa(
+            conn, 'texto_manager.set_user_language',
+            lambda cur: cur.execute(
+                "UPDATE usuarios SET idioma = ? WHERE user_id = ?", (language, user_id)
+            ).rowcount
+        )
+        conn.close()
         
-        if cursor.rowcount == 0:
+        if atualizados == 0:
             print(f"⚠️ AVISO: Usuário {user_id} não encontrado!")
-            conn.close()
             return False
         
-        conn.commit()
-        conn.close()
-        
         # Limpa cache do idioma para forçar recarregamento
         if user_id in _USER_LANGUAGE_CACHE:
             del _USER_LANGUAGE_CACHE[user_id]
+        invalidar_usuario(user_id)
         
         print(f"✅ Idioma do usuário {user_id} alterado para {language}")
         return True